@@ -0,0 +1,141 @@
+"""
+Compare the dataset slicer (src/cut.py) with the pydub script it replaced.
+
+`--recordings` MP3 recordings of `--minutes` minutes each (a wailing tone over
+noise, made with ffmpeg) are cut into 5 s clips, one recording after the other by
+the previous script (pydub: the whole MP3 is decoded into memory, then every clip
+is exported through ffmpeg) and by src/cut.py with each `--workers` count. Then
+src/cut.py runs once more on its own output, to time a resumed run with nothing
+left to do. For each run, the wall time, the audio seconds cut per second and the
+peak RSS of its largest process are reported, and the clips are checked to be the
+same count as the previous script's.
+
+Usage (from the model directory; needs pydub and ffmpeg):
+    python benchmarks/cut_throughput.py --recordings 4 --minutes 10 --workers 1 4
+"""
+
+import argparse
+import glob
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+CUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "cut.py")
+
+
+def legacy_cut(audio_file: str, output_folder: str) -> None:
+    """The previous src/cut.py, for one recording (naming the codec only spares pydub an ffprobe call)."""
+
+    from pydub import AudioSegment
+
+    interval = 5000
+
+    sound = AudioSegment.from_file(audio_file, format="mp3", codec="mp3")
+    for index, milisecond in enumerate(range(0, len(sound), interval)):
+        if (milisecond + interval) > len(sound):
+            break
+
+        sound[milisecond : (milisecond + interval)].export(f"{output_folder}/{str(index)}.wav", format="wav")
+
+
+def make_recordings(directory: str, count: int, minutes: float) -> list:
+    paths = []
+
+    for i in range(count):
+        path = os.path.join(directory, f"recording-{i}.mp3")
+        source = (
+            f"sine=frequency={700 + 50 * i}:sample_rate=44100:duration={minutes * 60},"
+            f"vibrato=f=1.5:d=0.5,volume=0.3"
+        )
+        subprocess.run(
+            [
+                "ffmpeg", "-nostdin", "-hide_banner", "-loglevel", "error", "-y",
+                "-f", "lavfi", "-i", source,
+                "-f", "lavfi", "-i", f"anoisesrc=color=pink:amplitude=0.05:sample_rate=44100:duration={minutes * 60}",
+                "-filter_complex", "amix=inputs=2,pan=stereo|c0=c0|c1=c0", "-b:a", "128k", path,
+            ],
+            check=True,
+        )
+        paths.append(path)
+
+    return paths
+
+
+def timed(command: list) -> tuple:
+    """Run a command; returns its wall time and the peak RSS (MB) of its largest process."""
+
+    start = time.perf_counter()
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    # wait4's usage covers the process and the children it waited for (the pool's workers)
+    _, status, usage = os.wait4(process.pid, 0)
+    elapsed = time.perf_counter() - start
+
+    if os.waitstatus_to_exitcode(status) != 0:
+        sys.exit(f"{' '.join(command)} failed")
+
+    return elapsed, usage.ru_maxrss / 1024
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--recordings", type=int, default=4)
+    parser.add_argument("--minutes", type=float, default=10)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count() or 1])
+    parser.add_argument("--legacy", nargs=2, metavar=("RECORDING", "OUTPUT"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.legacy:
+        legacy_cut(*args.legacy)
+
+        return
+
+    if shutil.which("ffmpeg") is None:
+        sys.exit("ffmpeg is needed to make the recordings (and by pydub)")
+
+    directory = tempfile.mkdtemp(prefix="cut-benchmark-")
+
+    try:
+        raw = os.path.join(directory, "raw")
+        os.makedirs(raw)
+        recordings = make_recordings(raw, args.recordings, args.minutes)
+        audio_s = args.recordings * args.minutes * 60
+        runs = []
+
+        output = os.path.join(directory, "legacy")
+        os.makedirs(output)
+        elapsed, peak = 0.0, 0.0
+
+        for i, recording in enumerate(recordings):
+            os.makedirs(os.path.join(output, str(i)))
+            recording_s, recording_peak = timed([sys.executable, __file__, "--legacy", recording, os.path.join(output, str(i))])
+            elapsed, peak = elapsed + recording_s, max(peak, recording_peak)
+
+        expected = len(glob.glob(os.path.join(output, "*", "*.wav")))
+        runs.append(("previous cut.py (pydub)", elapsed, peak, expected))
+
+        for workers in args.workers:
+            output = os.path.join(directory, f"workers-{workers}")
+            elapsed, peak = timed([sys.executable, CUT, raw, "-o", output, "--workers", str(workers)])
+            runs.append((f"cut.py, {workers} workers", elapsed, peak, len(glob.glob(os.path.join(output, "*.wav")))))
+
+        elapsed, peak = timed([sys.executable, CUT, raw, "-o", output, "--workers", str(args.workers[-1])])
+        runs.append(("cut.py, resumed (all done)", elapsed, peak, len(glob.glob(os.path.join(output, "*.wav")))))
+
+        print(f"{args.recordings} recordings of {args.minutes:g} min, {os.cpu_count()} CPUs\n")
+        print(f"{'run':>28} {'wall s':>8} {'audio s / s':>12} {'peak RSS MB':>12} {'clips':>6}")
+
+        for name, elapsed, peak, clips in runs:
+            print(f"{name:>28} {elapsed:>8.2f} {audio_s / elapsed:>12.0f} {peak:>12.0f} {clips:>6}")
+
+        if any(clips != expected for _, _, _, clips in runs):
+            sys.exit(f"Clip counts differ from the previous script's {expected}")
+
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,345 @@
-from pydub import AudioSegment
+"""
+Build a clip dataset from raw recordings: cut every file into fixed-length WAV clips.
 
-audioFile = "./src/sounds/ambulance/raw/utomp3.com - - AMBULANCE DRIVER on duty menuju yogyakarta_v144P.mp3"
-outputFolder = "./src/sounds/ambulance/test"
+Each recording is streamed through the decoder (soundfile for WAV, MP3, OGG and FLAC,
+an ffmpeg pipe for anything else), so memory stays at a few windows whatever the
+length of the file. Recordings that soundfile can seek in are split into jobs of
+`--segments-per-job` clips, so even a single long recording is cut by all the
+workers of the process pool.
 
-# audioFile = "./src/sounds/traffic-noise/raw/SUARA JALAN RAYA MALAM HARI.mp3"
-# outputFolder = "./src/sounds/traffic-noise/test"
+Clips are named after their recording and position (`<recording>-<segment>.wav`) and
+written atomically, so an interrupted run can simply be started again: clips that
+already exist are not written again, and jobs whose clips all exist are not even
+decoded. Once every job is done, a manifest (CSV) of all the clips in the output
+directory is written next to them.
 
-interval = 5000
-startAt = 374
+Usage (from the model directory):
+    python src/cut.py src/sounds/ambulance/raw -o src/sounds/ambulance/test
+    python src/cut.py "src/sounds/traffic-noise/raw/*.mp3" -o src/sounds/traffic-noise/test --window 5 --overlap 2.5
+"""
 
-sound = AudioSegment.from_file(audioFile, format="mp3")
-for index, milisecond in enumerate(range(0, len(sound), interval), startAt):
-    if (milisecond + interval) > len(sound):
-        break
+import argparse
+import csv
+import glob
+import os
+import re
+import shutil
+import struct
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Iterator, List, Optional
 
-    sound[milisecond : (milisecond + interval)].export(
-        f"{outputFolder}/{str(index)}.wav", format="wav"
+import numpy as np
+import soundfile
+
+# Formats libsndfile decodes (and seeks in) itself; the others go through ffmpeg
+SOUNDFILE_EXTENSIONS = {".wav", ".mp3", ".ogg", ".oga", ".flac"}
+AUDIO_EXTENSIONS = SOUNDFILE_EXTENSIONS | {".webm", ".m4a", ".mp4", ".aac", ".opus"}
+
+FFMPEG_BINARY = os.getenv("FFMPEG_BINARY", "ffmpeg")
+
+MANIFEST_FIELDS = ["clip", "source", "segment", "start_s", "end_s", "sample_rate", "channels"]
+
+
+class Job:
+    """Segments `first` to `last` (exclusive, None for the end of the recording) of one recording."""
+
+    def __init__(self, source: str, first: int, last: Optional[int]) -> None:
+        self.source = source
+        self.first = first
+        self.last = last
+
+
+def find_sources(inputs: List[str]) -> List[str]:
+    """Audio files among the given files, directories and glob patterns, sorted."""
+
+    sources = set()
+
+    for pattern in inputs:
+        for path in glob.glob(pattern) or [pattern]:
+            if os.path.isdir(path):
+                sources.update(os.path.join(path, name) for name in os.listdir(path))
+
+            else:
+                sources.add(path)
+
+    return sorted(
+        path for path in sources if os.path.isfile(path) and os.path.splitext(path)[1].lower() in AUDIO_EXTENSIONS
+    )
+
+
+def clip_name(source: str, segment: int) -> str:
+    """File name of a clip, from its recording's name (lowercased, punctuation collapsed) and its segment."""
+
+    stem = re.sub(r"[^a-z0-9]+", "-", os.path.splitext(os.path.basename(source))[0].lower()).strip("-")
+
+    return f"{stem or 'clip'}-{segment:05d}.wav"
+
+
+def segment_count(frames: int, window: int, hop: int) -> int:
+    """Number of whole windows in a recording (a trailing partial window is dropped)."""
+
+    return 0 if frames < window else (frames - window) // hop + 1
+
+
+def plan(sources: List[str], window_s: float, hop_s: float, segments_per_job: int) -> List[Job]:
+    """Split the recordings into jobs; recordings that cannot be seeked in are one job each."""
+
+    jobs = []
+
+    for source in sources:
+        if os.path.splitext(source)[1].lower() not in SOUNDFILE_EXTENSIONS:
+            jobs.append(Job(source, 0, None))
+
+            continue
+
+        try:
+            info = soundfile.info(source)
+
+        except RuntimeError:
+            # Let ffmpeg try the files libsndfile cannot open
+            jobs.append(Job(source, 0, None))
+
+            continue
+
+        total = segment_count(info.frames, round(window_s * info.samplerate), round(hop_s * info.samplerate))
+
+        for first in range(0, total, segments_per_job):
+            jobs.append(Job(source, first, min(first + segments_per_job, total)))
+
+    return jobs
+
+
+class FfmpegReader:
+    """Sequential reader of 16-bit frames from an ffmpeg WAV pipe, with the soundfile API used here."""
+
+    def __init__(self, source: str) -> None:
+        if shutil.which(FFMPEG_BINARY) is None:
+            raise RuntimeError(f"{FFMPEG_BINARY} not found")
+
+        self._process = subprocess.Popen(
+            [
+                FFMPEG_BINARY, "-nostdin", "-hide_banner", "-loglevel", "error", "-i", source,
+                "-vn", "-map_metadata", "-1", "-fflags", "+bitexact", "-c:a", "pcm_s16le", "-f", "wav", "pipe:1",
+            ],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        self.samplerate, self.channels = self._read_header()
+
+    def _read_header(self) -> tuple:
+        stream = self._process.stdout
+
+        if stream.read(12)[8:12] != b"WAVE":
+            raise RuntimeError(f"ffmpeg could not decode: {self._process.stderr.read().decode(errors='replace').strip()}")
+
+        # Chunks until "data": the format chunk holds the channel count and sample rate
+        while True:
+            kind, size = struct.unpack("<4sI", stream.read(8))
+
+            if kind == b"data":
+                return samplerate, channels
+
+            body = stream.read(size + size % 2)
+
+            if kind == b"fmt ":
+                channels, samplerate = struct.unpack("<HI", body[2:8])
+
+    def seek(self, frames: int) -> None:
+        self.read(frames)
+
+    def read(self, frames: int, dtype: str = "int16", always_2d: bool = True) -> np.ndarray:
+        data = self._process.stdout.read(frames * self.channels * 2)
+
+        return np.frombuffer(data[: len(data) - len(data) % (self.channels * 2)], dtype="<i2").reshape(-1, self.channels)
+
+    def __enter__(self) -> "FfmpegReader":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._process.stdout.close()
+        self._process.kill()
+        self._process.wait()
+
+
+def open_source(source: str):
+    if os.path.splitext(source)[1].lower() in SOUNDFILE_EXTENSIONS:
+        try:
+            return soundfile.SoundFile(source)
+
+        except RuntimeError:
+            pass
+
+    return FfmpegReader(source)
+
+
+def windows(reader, window: int, hop: int, first: int, last: Optional[int]) -> Iterator[tuple]:
+    """Stream (segment, frames) pairs from `first` on, decoding each frame only once."""
+
+    reader.seek(first * hop)
+    buffer = reader.read(window, dtype="int16", always_2d=True)
+    segment = first
+
+    while len(buffer) == window and (last is None or segment < last):
+        yield segment, buffer
+
+        segment += 1
+        # Windows overlap by window - hop frames, which are kept rather than decoded again
+        buffer = np.concatenate([buffer[hop:], reader.read(hop, dtype="int16", always_2d=True)])
+
+
+def cut(job: Job, output: str, window_s: float, hop_s: float, force: bool) -> dict:
+    """
+    Export the clips of one job; runs in a worker process.
+
+    Returns:
+        The job's manifest rows and how many clips were written and skipped
+    """
+
+    rows, written, skipped = [], 0, 0
+
+    def row(segment: int, sample_rate: int, channels: int) -> dict:
+        return {
+            "clip": clip_name(job.source, segment),
+            "source": job.source,
+            "segment": segment,
+            "start_s": round(segment * hop_s, 6),
+            "end_s": round(segment * hop_s + window_s, 6),
+            "sample_rate": sample_rate,
+            "channels": channels,
+        }
+
+    def exists(segment: int) -> bool:
+        return not force and os.path.exists(os.path.join(output, clip_name(job.source, segment)))
+
+    # Resume: start decoding at the first clip that is missing
+    first = job.first
+
+    if job.last is not None:
+        while first < job.last and exists(first):
+            first += 1
+
+        if first == job.last:
+            info = soundfile.info(job.source)
+
+            return {
+                "rows": [row(segment, info.samplerate, info.channels) for segment in range(job.first, job.last)],
+                "written": 0,
+                "skipped": job.last - job.first,
+            }
+
+    with open_source(job.source) as reader:
+        window = round(window_s * reader.samplerate)
+        hop = round(hop_s * reader.samplerate)
+
+        rows.extend(row(segment, reader.samplerate, reader.channels) for segment in range(job.first, first))
+        skipped += first - job.first
+
+        for segment, frames in windows(reader, window, hop, first, job.last):
+            rows.append(row(segment, reader.samplerate, reader.channels))
+
+            if exists(segment):
+                skipped += 1
+
+                continue
+
+            # Written under a temporary name, so a clip that exists is always complete
+            path = os.path.join(output, clip_name(job.source, segment))
+            soundfile.write(f"{path}.partial", frames, reader.samplerate, subtype="PCM_16", format="WAV")
+            os.replace(f"{path}.partial", path)
+            written += 1
+
+    return {"rows": rows, "written": written, "skipped": skipped}
+
+
+def write_manifest(path: str, rows: List[dict]) -> None:
+    rows = sorted(rows, key=lambda row: (row["source"], row["segment"]))
+
+    with open(f"{path}.partial", "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=MANIFEST_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+    os.replace(f"{path}.partial", path)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("inputs", nargs="+", help="recordings, directories of recordings or glob patterns")
+    parser.add_argument("-o", "--output", required=True, help="directory to write the clips to")
+    parser.add_argument("--window", type=float, default=5.0, help="clip length in seconds")
+    parser.add_argument("--overlap", type=float, default=0.0, help="seconds shared by consecutive clips")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--segments-per-job", type=int, default=120, help="clips per job for seekable recordings")
+    parser.add_argument("--manifest", help="manifest path (default: <output>/manifest.csv)")
+    parser.add_argument("--force", action="store_true", help="write clips again even when they already exist")
+    args = parser.parse_args()
+
+    if args.window <= 0 or not 0 <= args.overlap < args.window:
+        parser.error("--window must be positive and --overlap at least 0 and shorter than --window")
+
+    hop_s = args.window - args.overlap
+    sources = find_sources(args.inputs)
+
+    if not sources:
+        parser.error(f"No audio files found in {', '.join(args.inputs)}")
+
+    # Clip names come from the recordings' names, so two recordings must not share one
+    stems = {}
+
+    for source in sources:
+        stems.setdefault(clip_name(source, 0), []).append(source)
+
+    clashes = [names for names in stems.values() if len(names) > 1]
+
+    if clashes:
+        parser.error(f"Recordings would share clip names, rename them: {'; '.join(', '.join(names) for names in clashes)}")
+
+    os.makedirs(args.output, exist_ok=True)
+    jobs = plan(sources, args.window, hop_s, args.segments_per_job)
+    rows, written, skipped, failed = [], 0, 0, []
+    start = time.perf_counter()
+
+    print(f"Cutting {len(sources)} recordings ({len(jobs)} jobs) with {args.workers} workers")
+
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = {pool.submit(cut, job, args.output, args.window, hop_s, args.force): job for job in jobs}
+
+        for future in as_completed(futures):
+            job = futures[future]
+
+            try:
+                result = future.result()
+
+            except Exception as e:
+                # One unreadable recording should not cost the clips of the others
+                failed.append(job.source)
+                print(f"Failed to cut {job.source}: {e}")
+
+                continue
+
+            rows.extend(result["rows"])
+            written += result["written"]
+            skipped += result["skipped"]
+
+            print(
+                f"Exported {result['written']} clips ({result['skipped']} already there) from {job.source} "
+                f"[segments {job.first}-{(job.last or job.first + len(result['rows'])) - 1}]"
+            )
+
+    manifest = args.manifest or os.path.join(args.output, "manifest.csv")
+    write_manifest(manifest, rows)
+    elapsed = time.perf_counter() - start
+
+    print(
+        f"Done in {elapsed:.1f}s: {written} clips written, {skipped} already there, "
+        f"{len(rows) * args.window / max(elapsed, 1e-9):.0f}s of audio per second. Manifest: {manifest}"
     )
 
-    print(f"Exported {outputFolder}/{str(index)}.wav")
+    if failed:
+        raise SystemExit(f"Could not cut {len(set(failed))} recordings: {', '.join(sorted(set(failed)))}")
+
+
+if __name__ == "__main__":
+    main()
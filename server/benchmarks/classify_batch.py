@@ -0,0 +1,69 @@
+"""
+Compare classifying many files one request at a time with the batch endpoint.
+
+The same `--files` uploads of a clip are sent to a running server three ways: one
+`POST /api/classify/` per file (sequentially), one `POST /api/classify/batch` with
+every file as a part, and one batch request with a zip archive of them. Each file is
+given a different trailing byte so the result cache never answers for it.
+
+Usage (from the server directory, with the server running):
+    python benchmarks/classify_batch.py path/to/clip.wav --files 64 --url http://localhost:3001/api/classify
+"""
+
+import argparse
+import io
+import os
+import time
+import zipfile
+
+import httpx
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("clip", help="audio file to upload")
+    parser.add_argument("--url", default=f"http://localhost:{os.getenv('PORT', '3001')}/api/classify")
+    parser.add_argument("--files", type=int, default=64)
+    args = parser.parse_args()
+
+    with open(args.clip, "rb") as f:
+        content = f.read()
+
+    name, extension = os.path.splitext(os.path.basename(args.clip))
+
+    def uploads(run: int) -> list:
+        # Distinct bytes per file and run, so every file misses the result cache
+        return [(f"{name}-{i}{extension}", content + bytes([run, i % 256])) for i in range(args.files)]
+
+    with httpx.Client(timeout=600) as client:
+        start = time.perf_counter()
+
+        for file_name, data in uploads(0):
+            client.post(f"{args.url}/", files={"file": (file_name, data)}).raise_for_status()
+
+        single = time.perf_counter() - start
+
+        start = time.perf_counter()
+        response = client.post(f"{args.url}/batch", files=[("files", upload) for upload in uploads(1)])
+        batch = time.perf_counter() - start
+        succeeded = response.json()["data"]["succeeded"]
+
+        archive = io.BytesIO()
+
+        with zipfile.ZipFile(archive, "w") as z:
+            for file_name, data in uploads(2):
+                z.writestr(file_name, data)
+
+        start = time.perf_counter()
+        response = client.post(f"{args.url}/batch", files={"files": ("clips.zip", archive.getvalue())})
+        archived = time.perf_counter() - start
+        archived_succeeded = response.json()["data"]["succeeded"]
+
+    print(f"{'mode':>22} {'total s':>8} {'ms / file':>10} {'succeeded':>10}")
+    print(f"{'one request per file':>22} {single:>8.2f} {single * 1000 / args.files:>10.1f} {args.files:>10}")
+    print(f"{'batch (multipart)':>22} {batch:>8.2f} {batch * 1000 / args.files:>10.1f} {succeeded:>10}")
+    print(f"{'batch (zip)':>22} {archived:>8.2f} {archived * 1000 / args.files:>10.1f} {archived_succeeded:>10}")
+
+
+if __name__ == "__main__":
+    main()
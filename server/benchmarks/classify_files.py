@@ -0,0 +1,183 @@
+"""
+Throughput, resume and parity check of the offline classifier (src/classify_files.py).
+
+`--files` clips of `--seconds` seconds (a wailing tone or pink noise, made with numpy
+and written as WAV, and as MP3 for every `--mp3-every`th clip) are classified with
+each `--workers` count, and the files/s reported by the CLI once its workers are
+ready is collected. Then:
+
+- resume: a run is killed once a third of the files are in its output, and started
+  again on the same output, which must then hold every file exactly once;
+- parity: `--parity` of the clips are also posted to /api/classify (in process,
+  through the FastAPI test client), and must get the same label and confidence.
+
+Usage (from the server directory; MODEL_PATH as for the server):
+    MODEL_PATH=model.h5 python benchmarks/classify_files.py --files 2000 --workers 1 2 4
+"""
+
+import argparse
+import json
+import os
+import re
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import soundfile
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+CLI = os.path.join(SRC, "classify_files.py")
+
+
+def make_clips(directory: str, count: int, seconds: float, mp3_every: int) -> list:
+    rng = np.random.default_rng(0)
+    sr = 44100
+    t = np.arange(int(seconds * sr)) / sr
+    paths = []
+
+    for i in range(count):
+        if i % 2:
+            signal_ = 0.3 * np.sin(2 * np.pi * (700 + 300 * np.sin(2 * np.pi * 1.5 * t)) * t)
+
+        else:
+            signal_ = np.cumsum(rng.standard_normal(len(t))) / 500
+
+        audio = (signal_ + 0.02 * rng.standard_normal(len(t))).astype(np.float32)
+        extension = ".mp3" if mp3_every and i % mp3_every == 0 else ".wav"
+        path = os.path.join(directory, f"clip-{i:05d}{extension}")
+        soundfile.write(path, np.clip(audio, -1, 1), sr)
+        paths.append(path)
+
+    return paths
+
+
+def run_cli(clips: str, output: str, workers: int, env: dict) -> float:
+    completed = subprocess.run(
+        [sys.executable, CLI, clips, "-o", output, "--workers", str(workers)],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        check=True,
+    )
+    rate = re.search(r"([\d.]+) files/s", completed.stderr.decode())
+
+    return float(rate.group(1)) if rate else 0.0
+
+
+def count_lines(output: str) -> int:
+    if not os.path.exists(output):
+        return 0
+
+    with open(output, "rb") as f:
+        return f.read().count(b"\n")
+
+
+def read_rows(output: str) -> list:
+    with open(output) as f:
+        return [json.loads(line) for line in f]
+
+
+def check_parity(paths: list, rows: dict, directory: str) -> list:
+    """Post the clips to /api/classify in process and compare with the CLI's results."""
+
+    os.environ.setdefault("HISTORY_DATABASE", os.path.join(directory, "history.db"))
+    os.environ["RESULT_CACHE_SIZE"] = "0"
+    sys.path.insert(0, SRC)
+
+    from fastapi.testclient import TestClient
+
+    import main
+
+    errors = []
+
+    with TestClient(main.app) as client:
+        while not client.get("/ready").json()["success"]:
+            time.sleep(0.2)
+
+        for path in paths:
+            with open(path, "rb") as f:
+                data = client.post("/classify/", files={"file": (os.path.basename(path), f)}).json()["data"]
+
+            row = rows[path]
+
+            if data["isAmbulance"] != row["is_ambulance"] or abs(data["confidence"] - row["confidence"]) > 1e-5:
+                errors.append(f"{path}: API {data['isAmbulance']} {data['confidence']:.6f}, CLI {row['is_ambulance']} {row['confidence']}")
+
+    return errors
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=2000)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--mp3-every", type=int, default=4, help="every nth clip is an MP3 (0 for none)")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count() or 1])
+    parser.add_argument("--parity", type=int, default=20, help="clips also classified through the API")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="classify-files-benchmark-")
+    env = {**os.environ, "LOG_LEVEL": "ERROR"}
+
+    if "MODEL_PATH" in env:
+        env["MODEL_PATH"] = os.environ["MODEL_PATH"] = os.path.abspath(env["MODEL_PATH"])
+
+    try:
+        clips = os.path.join(directory, "clips")
+        os.makedirs(clips)
+        paths = make_clips(clips, args.files, args.seconds, args.mp3_every)
+        errors = []
+
+        print(f"{args.files} clips of {args.seconds:g}s, {os.cpu_count()} CPUs\n")
+        print(f"{'workers':>8} {'files/s':>9} {'per minute':>11}")
+
+        for workers in args.workers:
+            output = os.path.join(directory, f"workers-{workers}.jsonl")
+            rate = run_cli(clips, output, workers, env)
+            print(f"{workers:>8} {rate:>9.1f} {rate * 60:>11.0f}")
+
+            if len(read_rows(output)) != args.files:
+                errors.append(f"{workers} workers: {len(read_rows(output))} results for {args.files} files")
+
+        # Resume: kill a run part-way, then start it again
+        output = os.path.join(directory, "resumed.jsonl")
+        process = subprocess.Popen(
+            [sys.executable, CLI, clips, "-o", output, "--workers", str(args.workers[-1])],
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+
+        while process.poll() is None and count_lines(output) < args.files // 3:
+            time.sleep(0.05)
+
+        process.send_signal(signal.SIGKILL)
+        process.wait()
+
+        before = count_lines(output)
+        run_cli(clips, output, args.workers[-1], env)
+        rows = read_rows(output)
+        unique = {row["path"] for row in rows}
+
+        print(f"\nresume: {before} files done when killed, {len(rows)} results after resuming, {len(unique)} distinct")
+
+        if len(rows) != args.files or len(unique) != args.files:
+            errors.append(f"Resumed run holds {len(rows)} results for {len(unique)} files, expected {args.files}")
+
+        parity = paths[:: max(1, len(paths) // args.parity)][: args.parity]
+        errors.extend(check_parity(parity, {row["path"]: row for row in rows}, directory))
+
+        print(f"parity: {len(parity)} clips checked against /api/classify")
+
+        if errors:
+            sys.exit("\n".join(errors))
+
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Load-test a running classify server at increasing concurrency.
+
+For each concurrency level, `--requests` uploads of the same clip are sent with at
+most that many in flight, and p50/p99 latency, requests/sec and the number of
+rejected (503) requests are reported.
+
+Usage (from the server directory, with the server running):
+    python benchmarks/classify_load.py path/to/clip.wav --url http://localhost:3001/api/classify/
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+import httpx
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+async def run_level(client: httpx.AsyncClient, url: str, file_name: str, content: bytes, concurrency: int, total: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    statuses: dict = {}
+
+    async def one() -> None:
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post(url, files={"file": (file_name, content)})
+            latencies.append((time.perf_counter() - start) * 1000)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "p50_ms": statistics.median(latencies),
+        "p99_ms": percentile(latencies, 0.99),
+        "requests_per_second": total / elapsed,
+        "statuses": statuses,
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("clip", help="audio file to upload")
+    parser.add_argument("--url", default=f"http://localhost:{os.getenv('PORT', '3001')}/api/classify/")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument("--requests", type=int, default=200, help="requests sent per concurrency level")
+    args = parser.parse_args()
+
+    with open(args.clip, "rb") as f:
+        content = f.read()
+
+    file_name = os.path.basename(args.clip)
+    limits = httpx.Limits(max_connections=max(args.concurrency))
+
+    async with httpx.AsyncClient(timeout=120, limits=limits) as client:
+        # Warm-up request, not measured
+        await client.post(args.url, files={"file": (file_name, content)})
+
+        print(f"{'conc':>5} {'p50 ms':>10} {'p99 ms':>10} {'req/s':>10}  statuses")
+
+        for concurrency in args.concurrency:
+            result = await run_level(client, args.url, file_name, content, concurrency, args.requests)
+
+            print(
+                f"{result['concurrency']:>5} {result['p50_ms']:>10.1f} {result['p99_ms']:>10.1f} "
+                f"{result['requests_per_second']:>10.1f}  {result['statuses']}"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,132 @@
+"""
+Compare the in-process decoder with the previous pydub + temp file + librosa path, per format.
+
+A synthetic clip is encoded in every supported format (webm and m4a need ffmpeg),
+then both paths decode it repeatedly and the median latency is reported. The
+legacy path needs pydub, ffmpeg and ffprobe; formats it cannot handle are marked.
+
+Usage (from the server directory):
+    python benchmarks/decode.py --duration 5 --repeats 20
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+import numpy as np
+import soundfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from models.classify.decoder import FFMPEG_BINARY, decode_audio  # noqa: E402
+
+SOUNDFILE_FORMATS = {".wav": ("WAV", "PCM_16"), ".mp3": ("MP3", None), ".ogg": ("OGG", "VORBIS"), ".oga": ("OGG", "OPUS")}
+FFMPEG_CODECS = {".webm": "libopus", ".m4a": "aac"}
+
+
+def synthetic_clip(duration: float, sample_rate: int) -> np.ndarray:
+    t = np.arange(int(duration * sample_rate)) / sample_rate
+    sweep = np.sin(2 * np.pi * (700 + 300 * np.sin(2 * np.pi * t)) * t)
+
+    return (0.3 * sweep).astype(np.float32)
+
+
+def encode(signal: np.ndarray, sample_rate: int, extension: str) -> bytes:
+    if extension in SOUNDFILE_FORMATS:
+        format, subtype = SOUNDFILE_FORMATS[extension]
+        buffer = BytesIO()
+        soundfile.write(buffer, signal, 48000 if subtype == "OPUS" else sample_rate, format=format, subtype=subtype)
+
+        return buffer.getvalue()
+
+    wav = BytesIO()
+    soundfile.write(wav, signal, sample_rate, format="WAV")
+
+    with tempfile.NamedTemporaryFile(suffix=extension) as output:
+        subprocess.run(
+            [FFMPEG_BINARY, "-y", "-loglevel", "error", "-i", "pipe:0", "-c:a", FFMPEG_CODECS[extension], output.name],
+            input=wav.getvalue(),
+            check=True,
+        )
+
+        return output.read()
+
+
+def legacy_decode(file_content: bytes, extension: str) -> tuple:
+    """The decoding path used before: temp file, pydub/ffmpeg to WAV, then librosa.load."""
+
+    import librosa
+    from pydub import AudioSegment
+
+    if extension == ".wav":
+        return librosa.load(BytesIO(file_content), sr=None)
+
+    format_map = {".mp3": "mp3", ".webm": "webm", ".ogg": "ogg", ".oga": "ogg", ".m4a": "m4a"}
+
+    with tempfile.NamedTemporaryFile(suffix=extension, delete=False) as temp_input:
+        temp_input.write(file_content)
+
+    try:
+        audio = AudioSegment.from_file(temp_input.name, format=format_map[extension])
+        wav_buffer = BytesIO()
+        audio.export(wav_buffer, format="wav")
+        wav_buffer.seek(0)
+
+        return librosa.load(wav_buffer, sr=None)
+
+    finally:
+        os.unlink(temp_input.name)
+
+
+def median_ms(function, repeats: int) -> float:
+    durations = []
+
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        durations.append((time.perf_counter() - start) * 1000)
+
+    return statistics.median(durations)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=5.0, help="clip duration in seconds")
+    parser.add_argument("--sample-rate", type=int, default=44100)
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    signal = synthetic_clip(args.duration, args.sample_rate)
+    has_ffmpeg = shutil.which(FFMPEG_BINARY) is not None
+
+    print(f"{'format':>7} {'size KB':>9} {'legacy ms':>10} {'decoder ms':>11} {'speedup':>8}")
+
+    for extension in [".wav", ".mp3", ".ogg", ".oga", ".webm", ".m4a"]:
+        if extension in FFMPEG_CODECS and not has_ffmpeg:
+            print(f"{extension:>7}  skipped (ffmpeg not available)")
+
+            continue
+
+        content = encode(signal, args.sample_rate, extension)
+        new = median_ms(lambda: decode_audio(content, extension), args.repeats)
+
+        try:
+            legacy_decode(content, extension)
+            legacy = median_ms(lambda: legacy_decode(content, extension), args.repeats)
+            legacy_column, speedup_column = f"{legacy:>10.2f}", f"{legacy / new:>7.1f}x"
+
+        except Exception as e:
+            legacy_column, speedup_column = f"{'n/a':>10}", f"{'':>8}"
+            print(f"        legacy path failed for {extension}: {str(e).splitlines()[0][:80]}")
+
+        print(f"{extension:>7} {len(content) / 1024:>9.1f} {legacy_column} {new:>11.2f} {speedup_column}")
+
+
+if __name__ == "__main__":
+    main()
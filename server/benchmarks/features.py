@@ -0,0 +1,138 @@
+"""
+Compare `FeatureExtractor` with the librosa feature path it replaces.
+
+Checks that the extractor's spectrograms match `librosa.feature.melspectrogram` +
+`librosa.power_to_db(ref=np.max)` within a tolerance in dB, for single clips and
+batches (exits non-zero otherwise). Then reports the median feature time per clip
+and the peak memory allocated (traced by tracemalloc) for librosa and the extractor
+one request at a time, and for the extractor on a whole batch.
+
+Usage (from the server directory):
+    python benchmarks/features.py --batch-size 16 --repeats 50
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from models.classify import pipeline  # noqa: E402
+from models.classify.features import get_feature_extractor  # noqa: E402
+
+
+def synthetic_clips(count: int, sample_rate: int, rng: np.random.Generator) -> list:
+    """Sirens, noise and silence of assorted lengths, some shorter than one model input."""
+
+    clips = []
+
+    for i in range(count):
+        n_samples = int(rng.integers(sample_rate // 4, pipeline.required_samples() + sample_rate // 2))
+        t = np.arange(n_samples) / sample_rate
+        kind = i % 3
+
+        if kind == 0:
+            clip = 0.4 * np.sin(2 * np.pi * (700 + 300 * np.sin(2 * np.pi * 0.5 * t)) * t)
+
+        elif kind == 1:
+            clip = 0.1 * rng.standard_normal(n_samples)
+
+        else:
+            clip = np.zeros(n_samples)
+
+        clips.append(clip.astype(np.float32))
+
+    return clips
+
+
+def librosa_features(y: np.ndarray, sr: int) -> np.ndarray:
+    """The previous feature path: full librosa mel spectrogram, then dB over the model's frames."""
+
+    import librosa
+
+    mel_spec = librosa.feature.melspectrogram(
+        y=y, sr=sr, n_fft=pipeline.N_FFT, hop_length=pipeline.HOP_LENGTH, n_mels=pipeline.N_MELS
+    )
+
+    return pipeline.pad_spectrogram(librosa.power_to_db(mel_spec[:, : pipeline.MAX_TIME_STEPS], ref=np.max))
+
+
+def measure(function, repeats: int) -> tuple:
+    """Median wall time (ms) and peak traced allocation (KB) of one call."""
+
+    durations = []
+
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        durations.append((time.perf_counter() - start) * 1000)
+
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return statistics.median(durations), peak / 1024
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sample-rates", type=int, nargs="+", default=[16000, 44100, 48000])
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--repeats", type=int, default=50)
+    parser.add_argument("--tolerance-db", type=float, default=1e-2)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    T = pipeline.MAX_TIME_STEPS
+
+    print(f"{'rate':>6} {'max |dB| single':>16} {'max |dB| batch':>15}")
+
+    for sample_rate in args.sample_rates:
+        extractor = get_feature_extractor(sample_rate, pipeline.N_FFT, pipeline.HOP_LENGTH, pipeline.N_MELS)
+        clips = synthetic_clips(args.batch_size, sample_rate, rng)
+        reference = np.stack([librosa_features(y, sample_rate) for y in clips])
+
+        single = np.stack([pipeline.pad_spectrogram(extractor.spectrogram(y, T)) for y in clips])
+        batch = extractor.batch(clips, T)
+
+        single_error = float(np.max(np.abs(single - reference)))
+        batch_error = float(np.max(np.abs(batch - reference)))
+
+        print(f"{sample_rate:>6} {single_error:>16.2e} {batch_error:>15.2e}")
+
+        if max(single_error, batch_error) > args.tolerance_db:
+            sys.exit(f"Features differ from librosa by {max(single_error, batch_error)} dB (tolerance {args.tolerance_db})")
+
+    sample_rate = 44100
+    extractor = get_feature_extractor(sample_rate, pipeline.N_FFT, pipeline.HOP_LENGTH, pipeline.N_MELS)
+    clips = synthetic_clips(args.batch_size, sample_rate, rng)
+    out = np.empty((args.batch_size, pipeline.N_MELS, T), dtype=np.float32)
+
+    def one_at_a_time(feature_function) -> None:
+        for y in clips:
+            feature_function(y)
+
+    # Every path handles the same clips; the peak of the first two is that of a single request
+    rows = [
+        ("librosa", lambda: one_at_a_time(lambda y: librosa_features(y, sample_rate))),
+        ("extractor", lambda: one_at_a_time(lambda y: pipeline.pad_spectrogram(extractor.spectrogram(y, T)))),
+        (f"extractor batch={args.batch_size}", lambda: extractor.batch(clips, T, out=out)),
+    ]
+
+    print(f"\n{'path':>22} {'ms / clip':>10} {'peak KB':>8}")
+
+    for name, function in rows:
+        function()
+        duration, peak = measure(function, args.repeats)
+
+        print(f"{name:>22} {duration / len(clips):>10.3f} {peak:>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Benchmark the per-request cost of `HistoryLogger.log_attempt` as the history grows.
+
+The store is filled in bulk up to each checkpoint, then a run of individual
+`log_attempt` calls is timed. With the append-only store the per-call cost should
+stay flat all the way to 1M entries.
+
+Usage (from the server directory):
+    python benchmarks/history_logging.py --checkpoints 0 10000 100000 1000000
+"""
+
+import argparse
+import datetime
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from utilities.history import HistoryLogger  # noqa: E402
+from utilities.history_store import HistoryStore  # noqa: E402
+
+
+def synthetic_entry(entry_id: int) -> dict:
+    return {
+        "id": entry_id,
+        "timestamp": datetime.datetime.now().isoformat(),
+        "success": True,
+        "file": {"name": f"clip-{entry_id}.wav", "size": {"bytes": 1024, "kilobytes": 1.0, "megabytes": 0.0}, "format": ".wav"},
+        "requester": {"ip_address": f"10.0.{entry_id % 256}.{entry_id % 7}", "user_agent": "benchmark"},
+        "classification": {
+            "result": "ambulance" if entry_id % 2 else "traffic_noise",
+            "is_ambulance": bool(entry_id % 2),
+            "confidence": {"value": 0.9, "percent": 90.0},
+        },
+        "processing_time": {"milliseconds": 12.5, "seconds": 0.0125},
+    }
+
+
+def fill(store: HistoryStore, target: int, chunk: int = 50_000) -> None:
+    while store.count() < target:
+        size = min(chunk, target - store.count())
+        store.append_many(synthetic_entry(store.next_id()) for _ in range(size))
+
+
+def time_log_attempts(samples: int) -> list:
+    durations = []
+
+    for _ in range(samples):
+        start = time.perf_counter()
+        HistoryLogger.log_attempt(
+            file_name="benchmark.wav",
+            file_size=1024,
+            audio_format=".wav",
+            client_ip="127.0.0.1",
+            user_agent="benchmark",
+            success=True,
+            classification_result=True,
+            confidence=0.9,
+            processing_time_ms=12.5,
+        )
+        durations.append((time.perf_counter() - start) * 1000)
+
+    return durations
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--checkpoints", type=int, nargs="+", default=[0, 10_000, 100_000, 1_000_000])
+    parser.add_argument("--samples", type=int, default=500, help="log_attempt calls timed per checkpoint")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        HistoryLogger.store = HistoryStore(os.path.join(directory, "history.db"))
+
+        print(f"{'entries':>10} {'mean ms':>10} {'p50 ms':>10} {'p99 ms':>10}")
+
+        for checkpoint in sorted(args.checkpoints):
+            fill(HistoryLogger.store, checkpoint)
+
+            durations = sorted(time_log_attempts(args.samples))
+            p99 = durations[min(len(durations) - 1, int(len(durations) * 0.99))]
+
+            print(
+                f"{HistoryLogger.store.count():>10} {statistics.mean(durations):>10.3f} "
+                f"{statistics.median(durations):>10.3f} {p99:>10.3f}"
+            )
+
+        HistoryLogger.store.close()
+
+
+if __name__ == "__main__":
+    main()
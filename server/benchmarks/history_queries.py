@@ -0,0 +1,197 @@
+"""
+Compare dashboard queries answered from the history rollups with a scan of every entry.
+
+A scratch history store is filled with `--entries` synthetic attempts spread over the
+last `--days` days (a mix of formats, outcomes and processing times), written in
+batches like the history writer does. Then, for the last hour by minute and the
+whole range by hour, attempts, errors, detections and processing times per format
+are computed both from the rollups (`HistoryStore.rollups`) and by reading every
+entry (`iter_all`, what `HistoryLogger.get_history` does), and timed. The counts
+must match exactly, and the p95 estimated from the rollups' histogram must fall in
+the same histogram bucket as the exact p95.
+
+Finally the rollups are rebuilt from the entries (as for a store written before
+rollups existed) and checked to be unchanged, and `compact` is timed with a
+retention of half the range.
+
+Usage (from the server directory):
+    python benchmarks/history_queries.py --entries 200000 --days 7
+"""
+
+import argparse
+import bisect
+import datetime
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from models.history.stats import build_stats, bucket_start, summarize  # noqa: E402
+from utilities.history_store import LATENCY_BUCKETS_MS, HistoryStore  # noqa: E402
+
+FORMATS = [".wav", ".mp3", ".webm", ".ogg", ".m4a", ".txt"]
+ROLLUP_FORMATS = FORMATS[:-1]
+
+
+def make_entries(store: HistoryStore, count: int, days: float, seed: int) -> None:
+    rng = random.Random(seed)
+    now = datetime.datetime.now()
+    batch = []
+
+    for _ in range(count):
+        audio_format = rng.choice(FORMATS)
+        success = audio_format != ".txt" and rng.random() > 0.05
+        entry = {
+            "id": store.next_id(),
+            "timestamp": (now - datetime.timedelta(seconds=rng.random() * days * 86400)).isoformat(),
+            "success": success,
+            "file": {"name": f"clip{audio_format}", "size": {"bytes": 1000}, "format": audio_format},
+            "requester": {"ip_address": "127.0.0.1", "user_agent": "benchmark"},
+            "processing_time": {"milliseconds": rng.lognormvariate(3.5, 0.8)},
+        }
+
+        if success:
+            is_ambulance = rng.random() < 0.3
+            entry["classification"] = {"result": "ambulance" if is_ambulance else "traffic_noise", "is_ambulance": is_ambulance}
+
+        batch.append(entry)
+
+        if len(batch) == 256:
+            store.append_many(batch)
+            batch = []
+
+    store.append_many(batch)
+
+
+def scan(store: HistoryStore, start: str, end: str) -> dict:
+    """Figures per format (and in total) from every entry in [start, end)."""
+
+    figures: dict = {}
+
+    for entry in store.iter_all():
+        if not start <= entry["timestamp"] < end:
+            continue
+
+        audio_format = entry["file"]["format"] if entry["file"]["format"] in ROLLUP_FORMATS else "other"
+        result = (entry.get("classification") or {}).get("result")
+
+        for key in (audio_format, None):
+            figure = figures.setdefault(key, {"attempts": 0, "successes": 0, "ambulance": 0, "times": []})
+            figure["attempts"] += 1
+            figure["successes"] += int(entry["success"])
+            figure["ambulance"] += result == "ambulance"
+            figure["times"].append(entry["processing_time"]["milliseconds"])
+
+    return figures
+
+
+def exact_p95_bucket(times: list) -> int:
+    times = sorted(times)
+
+    return bisect.bisect_left(LATENCY_BUCKETS_MS, times[max(0, int(len(times) * 0.95 + 0.5) - 1)])
+
+
+def check(name: str, stats: dict, figures: dict) -> list:
+    errors = []
+
+    for key, summary in [(None, stats["totals"])] + list(stats["formats"].items()):
+        expected = figures.get(key)
+
+        for field in ("attempts", "successes", "ambulance"):
+            if summary[field] != expected[field]:
+                errors.append(f"{name} {key or 'total'} {field}: {summary[field]} from rollups, {expected[field]} from entries")
+
+        estimated = bisect.bisect_left(LATENCY_BUCKETS_MS, summary["p95ProcessingTimeMs"])
+
+        if estimated != exact_p95_bucket(expected["times"]):
+            errors.append(f"{name} {key or 'total'} p95 {summary['p95ProcessingTimeMs']:.1f} ms is not in the exact p95's bucket")
+
+    return errors
+
+
+def same(a: dict, b: dict) -> bool:
+    """Equal summaries, up to the rounding of sums added up in a different order."""
+
+    return a.keys() == b.keys() and all(
+        math.isclose(a[key], b[key], rel_tol=1e-9) if isinstance(a[key], float) else a[key] == b[key] for key in a
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=200000)
+    parser.add_argument("--days", type=float, default=7)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="history-benchmark-")
+
+    try:
+        store = HistoryStore(os.path.join(directory, "history.db"), rollup_formats=ROLLUP_FORMATS)
+
+        start = time.perf_counter()
+        make_entries(store, args.entries, args.days, args.seed)
+        print(f"Wrote {args.entries} entries over {args.days:g} days in {time.perf_counter() - start:.1f}s\n")
+
+        now = datetime.datetime.now()
+        end = now.isoformat()
+        queries = [
+            ("last hour by minute", "minute", (now - datetime.timedelta(hours=1)).isoformat()),
+            (f"{args.days:g} days by hour", "hour", (now - datetime.timedelta(days=args.days + 1)).isoformat()),
+        ]
+        errors = []
+
+        print(f"{'query':>22} {'buckets':>8} {'rollups ms':>11} {'scan ms':>9}")
+
+        for name, resolution, query_start in queries:
+            first_bucket = bucket_start(query_start, resolution)
+
+            timed = time.perf_counter()
+            rollups = store.rollups(resolution, first_bucket, end)
+            stats = build_stats(rollups, resolution, query_start, end)
+            rollup_ms = (time.perf_counter() - timed) * 1000
+
+            timed = time.perf_counter()
+            figures = scan(store, first_bucket, end)
+            scan_ms = (time.perf_counter() - timed) * 1000
+
+            print(f"{name:>22} {len(stats['buckets']):>8} {rollup_ms:>11.1f} {scan_ms:>9.0f}")
+            errors.extend(check(name, stats, figures))
+
+        before = summarize(store.rollups("hour"))
+        store.rebuild_rollups()
+
+        if not same(summarize(store.rollups("hour")), before):
+            errors.append("Rebuilt rollups differ from the incrementally maintained ones")
+
+        size = os.path.getsize(os.path.join(directory, "history.db"))
+        timed = time.perf_counter()
+        entries, minute_rollups = store.compact(args.days / 2, args.days / 4)
+
+        print(
+            f"\ncompact ({args.days / 2:g} days of entries, {args.days / 4:g} of minute rollups): deleted {entries} entries "
+            f"and {minute_rollups} minute rollups in {time.perf_counter() - timed:.1f}s; {store.count()} entries left, "
+            f"database was {size / 1e6:.0f} MB"
+        )
+
+        if not same(summarize(store.rollups("hour")), before):
+            errors.append("Compaction changed the hour rollups")
+
+        store.close()
+
+        if errors:
+            sys.exit("\n".join(errors))
+
+        print("Rollups match the entries")
+
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
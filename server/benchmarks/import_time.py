@@ -0,0 +1,103 @@
+"""
+Measure the import time of the server's `main` module and enforce a budget.
+
+Runs `python -X importtime -c "import main"` several times in fresh interpreters,
+reports the fastest total and the heaviest modules, and exits non-zero when the
+import takes longer than the budget or pulls in a module that must stay lazy
+(TensorFlow, Keras, librosa, ...).
+
+Usage (from the server directory):
+    python benchmarks/import_time.py                        # check against the budget
+    python benchmarks/import_time.py --write benchmarks/import_time_profile.txt
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+SRC_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+# Modules that must only be imported by the code paths that need them
+LAZY_MODULES = ["keras", "tensorflow", "ai_edge_litert", "tflite_runtime", "librosa", "numba", "sklearn", "scipy", "pydub", "soundfile", "soxr"]
+
+LINE_PATTERN = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def profile_import() -> tuple:
+    """Import `main` in a fresh interpreter; return the parsed profile and the loaded modules."""
+
+    code = "import sys, main; print(','.join(sorted(sys.modules)))"
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=SRC_DIRECTORY,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    rows = []
+
+    for line in completed.stderr.splitlines():
+        match = LINE_PATTERN.match(line)
+
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            rows.append((module, int(self_us), int(cumulative_us), len(indent) // 2))
+
+    loaded = set(completed.stdout.strip().splitlines()[-1].split(","))
+
+    return rows, loaded
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("IMPORT_TIME_BUDGET_MS", "800")))
+    parser.add_argument("--top", type=int, default=20, help="number of heaviest modules to report")
+    parser.add_argument("--write", help="write the profile summary to this file")
+    args = parser.parse_args()
+
+    best_rows, best_total_ms, loaded = None, float("inf"), set()
+
+    for _ in range(args.runs):
+        rows, loaded = profile_import()
+        total_ms = next(cumulative for module, _, cumulative, _ in rows if module == "main") / 1000
+
+        if total_ms < best_total_ms:
+            best_rows, best_total_ms = rows, total_ms
+
+    heaviest = sorted(best_rows, key=lambda row: row[2], reverse=True)[: args.top]
+
+    lines = [
+        f"import main: {best_total_ms:.1f} ms (best of {args.runs}, budget {args.budget_ms:.0f} ms)",
+        "",
+        f"{'cumulative ms':>14} {'self ms':>9}  module",
+    ]
+    lines.extend(f"{cumulative / 1000:>14.1f} {self_us / 1000:>9.1f}  {'  ' * depth}{module}" for module, self_us, cumulative, depth in heaviest)
+
+    summary = "\n".join(lines)
+    print(summary)
+
+    if args.write:
+        with open(args.write, "w") as f:
+            f.write(summary + "\n")
+
+    failures = []
+    eager = sorted(module for module in LAZY_MODULES if module in loaded)
+
+    if eager:
+        failures.append(f"modules that must stay lazy were imported: {', '.join(eager)}")
+
+    if best_total_ms > args.budget_ms:
+        failures.append(f"import time {best_total_ms:.1f} ms exceeds the {args.budget_ms:.0f} ms budget")
+
+    if failures:
+        sys.exit("FAIL: " + "; ".join(failures))
+
+    print("\nOK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Compare `ModelManager.predict` (traced forward pass) with Keras `model.predict`.
+
+Checks that both paths give the same outputs on random inputs (exits non-zero
+otherwise), then times each path per call for a few batch sizes.
+
+Usage (from the server directory):
+    python benchmarks/inference_fastpath.py --model model.h5
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+
+def time_calls(function, X: np.ndarray, repeats: int) -> float:
+    durations = []
+
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function(X)
+        durations.append((time.perf_counter() - start) * 1000)
+
+    return statistics.median(durations)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=os.getenv("MODEL_PATH", "model.h5"))
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--repeats", type=int, default=50)
+    parser.add_argument("--tolerance", type=float, default=1e-5)
+    args = parser.parse_args()
+
+    os.environ["MODEL_PATH"] = args.model
+
+    from model_manager import model_manager
+
+    model = model_manager.load_model()
+    input_shape = tuple(model.input_shape[1:])
+    rng = np.random.default_rng(0)
+
+    # Parity against predict()
+    for batch_size in args.batch_sizes:
+        X = rng.uniform(-80, 0, size=(batch_size,) + input_shape).astype(np.float32)
+        difference = float(np.max(np.abs(model_manager.predict(X) - model.predict(X, verbose=0))))
+
+        print(f"parity batch={batch_size}: max abs difference {difference:.2e}")
+
+        if difference > args.tolerance:
+            sys.exit(f"Fast path differs from predict() by {difference} (tolerance {args.tolerance})")
+
+    print(f"\n{'batch':>6} {'predict() ms':>14} {'fast path ms':>14} {'speedup':>9}")
+
+    for batch_size in args.batch_sizes:
+        X = rng.uniform(-80, 0, size=(batch_size,) + input_shape).astype(np.float32)
+        slow = time_calls(lambda X: model.predict(X, verbose=0), X, args.repeats)
+        fast = time_calls(model_manager.predict, X, args.repeats)
+
+        print(f"{batch_size:>6} {slow:>14.2f} {fast:>14.2f} {slow / fast:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
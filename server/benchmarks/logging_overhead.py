@@ -0,0 +1,173 @@
+"""
+Measure what logging costs the event loop per classify request.
+
+A request logs what a successful /classify call logs: six debug records (received,
+processing, prediction, result, history) and the completion record with its stage
+timings. Each configuration runs in its own process, with stdout going to
+`--sink` (a pipe read by this script, or /dev/null), and reports:
+
+- the time the caller spends logging one request, which is what the event loop pays
+  (with fewer CPUs than threads, this includes the writer thread's formatting, which
+  takes the CPU from the caller while it runs);
+- for the queue-backed logger, the time until every record is written (flush), to
+  check the writer thread keeps up.
+
+Configurations: the previous print-based Logger, and utilities/logger.py at DEBUG
+(everything written), INFO (debug records dropped) in JSON and text format, and
+ERROR (nothing written, the cost of disabled records alone).
+
+Exits non-zero when the logger at INFO costs more per request than `--max-info-us`.
+
+Usage (from the server directory):
+    python benchmarks/logging_overhead.py --requests 20000 --sink pipe
+"""
+
+import argparse
+import datetime
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+CONFIGURATIONS = [
+    ("previous (print)", {"LOGGER": "previous"}),
+    ("json, DEBUG", {"LOG_LEVEL": "DEBUG", "LOG_FORMAT": "json"}),
+    ("text, DEBUG", {"LOG_LEVEL": "DEBUG", "LOG_FORMAT": "text"}),
+    ("json, INFO", {"LOG_LEVEL": "INFO", "LOG_FORMAT": "json"}),
+    ("text, INFO", {"LOG_LEVEL": "INFO", "LOG_FORMAT": "text"}),
+    ("ERROR", {"LOG_LEVEL": "ERROR", "LOG_FORMAT": "json"}),
+]
+
+STAGES = {"upload": 0.0014, "decode": 0.0008, "features": 0.0022, "pad": 0.00001, "predict": 0.0075}
+
+
+class PreviousLogger:
+    """The print-based Logger this replaced."""
+
+    def debug(text: str) -> None:
+        print(f"\033[36mDEBUG\033[0m:    [{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}]{text}")
+
+
+def previous_request(logger, endpoint: str) -> None:
+    logger.debug(f"[{endpoint}] Received file: siren.wav")
+    logger.debug(f"[{endpoint}] Processing audio file (format: .wav)")
+    logger.debug(f"[{endpoint}] Running prediction")
+    logger.debug(f"[{endpoint}] Result: 0, Ambulance, Confidence: 99.1%")
+    logger.debug(f"[{endpoint}] Logging successful classification")
+
+
+def request(logger, endpoint: str) -> None:
+    logger.debug("[%s] Received file: %s", endpoint, "siren.wav")
+    logger.debug("[%s] Processing audio file (format: %s)", endpoint, ".wav")
+    logger.debug("[%s] Running prediction", endpoint)
+    logger.debug("[%s] Result: %s, %s, Confidence: %s", endpoint, 0, "Ambulance", "99.1%")
+    logger.debug("[%s] Logging successful classification", endpoint)
+
+    if logger.is_enabled(20):
+        logger.info(
+            "[%s] %s",
+            endpoint,
+            "Success",
+            status=201,
+            file_format=".wav",
+            file_size=264644,
+            duration_ms=12.3,
+            stages_ms={name: round(seconds * 1000, 3) for name, seconds in STAGES.items()},
+        )
+
+
+def run_child(requests: int) -> None:
+    """Log `requests` requests to stdout and report the timings on stderr."""
+
+    if os.environ.get("LOGGER") == "previous":
+        logger, log_request = PreviousLogger, previous_request
+
+    else:
+        sys.path.insert(0, SRC)
+
+        from utilities.logger import Logger, request_id
+
+        logger, log_request = Logger, request
+        request_id.set("5535a06b2d30472c8a445fcb9947e3c5")
+
+    # Warm up (and start the writer thread)
+    for _ in range(100):
+        log_request(logger, "/api/classify")
+
+    if hasattr(logger, "flush"):
+        logger.flush()
+
+    start = time.perf_counter()
+
+    for _ in range(requests):
+        log_request(logger, "/api/classify")
+
+    logged = time.perf_counter() - start
+
+    if hasattr(logger, "flush"):
+        logger.flush()
+
+    sys.stdout.flush()
+    written = time.perf_counter() - start
+
+    json.dump({"logged_us": logged / requests * 1e6, "written_us": written / requests * 1e6}, sys.stderr)
+
+
+def measure(environment: dict, requests: int, sink: str) -> dict:
+    command = [sys.executable, __file__, "--child", "--requests", str(requests)]
+    env = {**os.environ, **environment}
+
+    if sink == "null":
+        with open(os.devnull, "w") as devnull:
+            completed = subprocess.run(command, env=env, stdout=devnull, stderr=subprocess.PIPE, check=True)
+
+        return json.loads(completed.stderr.decode().strip().splitlines()[-1])
+
+    process = subprocess.Popen(command, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    # Drain stdout like a log collector would, so the pipe does not fill up
+    drained = threading.Thread(target=lambda: [None for _ in iter(lambda: process.stdout.read(1 << 16), b"")])
+    drained.start()
+    stderr = process.stderr.read()
+    drained.join()
+
+    if process.wait() != 0:
+        sys.exit(f"{environment} failed:\n{stderr.decode()}")
+
+    return json.loads(stderr.decode().strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--sink", choices=["pipe", "null"], default="pipe")
+    parser.add_argument("--max-info-us", type=float, default=20)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.requests)
+
+        return
+
+    print(f"{args.requests} requests, stdout to {args.sink}\n")
+    print(f"{'logger':>18} {'caller µs/request':>18} {'written µs/request':>19}")
+
+    results = {}
+
+    for name, environment in CONFIGURATIONS:
+        results[name] = measure(environment, args.requests, args.sink)
+        print(f"{name:>18} {results[name]['logged_us']:>18.2f} {results[name]['written_us']:>19.2f}")
+
+    worst = max(results["json, INFO"]["logged_us"], results["text, INFO"]["logged_us"])
+
+    if worst > args.max_info_us:
+        sys.exit(f"Logging at INFO costs {worst:.1f} µs per request, above {args.max_info_us} µs")
+
+
+if __name__ == "__main__":
+    main()
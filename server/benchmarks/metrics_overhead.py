@@ -0,0 +1,110 @@
+"""
+Measure what the latency instrumentation (utilities/metrics.py) costs a request.
+
+- per operation: a `stage` block (outside and inside a recording), a histogram
+  observation and a labelled counter increment, and wrapping a call in
+  `record_stages`;
+- per request: the instrumentation one /classify request performs (the recording, its
+  three feature stages, six stage observations, the outcome counter and the request
+  histogram), next to the median time of `pipeline.extract_features` on the clip with
+  and without the recording;
+- per scrape: rendering /metrics with every classify series populated.
+
+Exits non-zero when the per-request cost exceeds `--max-overhead-us`.
+
+Usage (from the server directory):
+    python benchmarks/metrics_overhead.py path/to/clip.wav
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from models.classify import pipeline  # noqa: E402
+from models.classify.metrics import observe_stages, request_seconds, requests_total, stage_seconds  # noqa: E402
+from utilities.metrics import metrics_registry, record_stages, stage  # noqa: E402
+
+
+def per_call_us(statement, number: int) -> float:
+    return min(timeit.repeat(statement, number=number, repeat=5)) / number * 1e6
+
+
+def instrumented_request() -> None:
+    """The metrics work of one /classify request, without the work it measures."""
+
+    start = time.perf_counter()
+
+    def features() -> None:
+        for name in ("decode", "features", "pad"):
+            with stage(name):
+                pass
+
+    _, timings = record_stages(features)
+    observe_stages(timings)
+    stage_seconds.labels("upload").observe(time.perf_counter() - start)
+    stage_seconds.labels("queue").observe(0.001)
+    stage_seconds.labels("inference").observe(0.002)
+    requests_total.labels("/api/classify", "success", ".wav").inc()
+    request_seconds.labels("/api/classify").observe(time.perf_counter() - start)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("clip", help="audio file to extract features from")
+    parser.add_argument("--repeats", type=int, default=200)
+    parser.add_argument("--max-overhead-us", type=float, default=50)
+    args = parser.parse_args()
+
+    with open(args.clip, "rb") as f:
+        content = f.read()
+
+    extension = os.path.splitext(args.clip)[1].lower()
+    histogram = stage_seconds.labels("decode")
+    counter = requests_total.labels("/api/classify", "success", extension)
+
+    def empty_stage() -> None:
+        with stage("decode"):
+            pass
+
+    print(f"{'operation':>36} {'µs':>8}")
+    print(f"{'stage block, not recording':>36} {per_call_us(empty_stage, 100000):>8.2f}")
+    print(f"{'stage block, recording':>36} {per_call_us(lambda: record_stages(empty_stage), 100000):>8.2f}")
+    print(f"{'histogram observe':>36} {per_call_us(lambda: histogram.observe(0.01), 100000):>8.2f}")
+    print(f"{'labelled counter inc':>36} {per_call_us(lambda: requests_total.labels('/api/classify', 'success', extension).inc(), 100000):>8.2f}")
+    print(f"{'counter inc (child kept)':>36} {per_call_us(counter.inc, 100000):>8.2f}")
+
+    request_us = per_call_us(instrumented_request, 20000)
+    print(f"{'one request':>36} {request_us:>8.2f}")
+
+    pipeline.extract_features(content, extension)
+    plain, recorded = [], []
+
+    for _ in range(args.repeats):
+        start = time.perf_counter()
+        pipeline.extract_features(content, extension)
+        plain.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        record_stages(pipeline.extract_features, content, extension)
+        recorded.append(time.perf_counter() - start)
+
+    render_us = per_call_us(metrics_registry.render, 200)
+
+    print(
+        f"\nextract_features: {statistics.median(plain) * 1000:.3f} ms plain, "
+        f"{statistics.median(recorded) * 1000:.3f} ms recorded; the instrumentation is "
+        f"{request_us / (statistics.median(plain) * 1e6) * 100:.3f}% of it"
+    )
+    print(f"rendering /metrics: {render_us:.0f} µs for {metrics_registry.render().count(chr(10))} lines")
+
+    if request_us > args.max_overhead_us:
+        sys.exit(f"Instrumentation costs {request_us:.1f} µs per request, above {args.max_overhead_us} µs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""
+Compare the Keras model backend with TensorFlow Lite conversions of the same model.
+
+The Keras model is converted with each requested quantization (see
+src/convert_model.py), then every backend runs in a fresh process so that its
+memory and startup are measured on their own:
+
+- parity: predictions on the training clips (model/src/sounds/*/test, read from a
+  feature store built by src/feature_store.py with `--feature-store`, or synthetic
+  sirens and noise when the dataset is not checked out) compared with the Keras
+  model's, as the largest probability difference and the share of clips given the
+  same label, plus the accuracy against the clips' folders when they are real. Exits
+  non-zero when a backend agrees with Keras on fewer than `--min-agreement` of them;
+- startup: time to import the runtime, load and warm up the model (ModelManager);
+- latency: median time of a single-sample call and, per sample, of a batch;
+- memory: resident set size after serving (VmRSS) and its peak (VmHWM).
+
+Usage (from the server directory):
+    python benchmarks/model_backends.py model.h5 --quantize none float16 dynamic int8
+"""
+
+import argparse
+import glob
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+sys.path.insert(0, SRC)
+
+from convert_model import QUANTIZATIONS, TRAINING_CLIPS, calibration_features, convert, synthetic_calibration_features  # noqa: E402
+from feature_store import FeatureStore  # noqa: E402
+
+
+def proc_status_mb(field: str) -> float:
+    """A memory field (VmRSS, VmHWM, ...) of this process in MB."""
+
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(f"{field}:"):
+                return int(line.split()[1]) / 1024
+
+    return 0.0
+
+
+def child(args) -> None:
+    """Measure one backend in this (fresh) process and print the results as JSON."""
+
+    os.environ["MODEL_BACKEND"] = args.backend
+    os.environ["MODEL_PATH"] = args.model
+
+    start = time.perf_counter()
+    from model_manager import model_manager
+
+    model_manager.load_model()
+    startup_ms = (time.perf_counter() - start) * 1000
+
+    features = np.load(args.features, mmap_mode="r")[..., np.newaxis]
+    predictions = np.concatenate([model_manager.predict(features[i : i + 1]) for i in range(len(features))])
+    np.save(args.out, predictions)
+
+    single, batch = [], []
+    batch_input = features[: args.batch_size]
+
+    for i in range(args.repeats):
+        sample = features[i % len(features)][np.newaxis]
+        begin = time.perf_counter()
+        model_manager.predict(sample)
+        single.append((time.perf_counter() - begin) * 1000)
+
+        begin = time.perf_counter()
+        model_manager.predict(batch_input)
+        batch.append((time.perf_counter() - begin) * 1000 / len(batch_input))
+
+    print(
+        json.dumps(
+            {
+                "startup_ms": startup_ms,
+                "single_ms": statistics.median(single),
+                "batch_ms": statistics.median(batch),
+                "rss_mb": proc_status_mb("VmRSS"),
+                "peak_rss_mb": proc_status_mb("VmHWM"),
+            }
+        ),
+        flush=True,
+    )
+
+    # Skip interpreter teardown: TensorFlow Lite's can crash at exit once the results are out
+    os._exit(0)
+
+
+def measure(args, backend: str, model: str, features_path: str, directory: str) -> tuple:
+    out = os.path.join(directory, f"{os.path.basename(model)}.predictions.npy")
+    result = subprocess.run(
+        [
+            sys.executable, __file__, "--child", "--backend", backend, "--model", model,
+            "--features", features_path, "--out", out,
+            "--repeats", str(args.repeats), "--batch-size", str(args.batch_size),
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+        env={**os.environ, "MODEL_WARMUP_RUNS": "3", "TF_CPP_MIN_LOG_LEVEL": "2"},
+    )
+
+    return json.loads(result.stdout.strip().splitlines()[-1]), np.load(out)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("keras_model", nargs="?", default=os.getenv("MODEL_PATH", "model.h5"))
+    parser.add_argument("--quantize", nargs="+", choices=QUANTIZATIONS, default=QUANTIZATIONS)
+    parser.add_argument("--clips", default=TRAINING_CLIPS, help="glob of labelled clips for the parity check")
+    parser.add_argument("--feature-store", help="feature store to run the parity check on instead of decoding --clips")
+    parser.add_argument("--synthetic-clips", type=int, default=200, help="clips used when none match --clips")
+    parser.add_argument("--min-agreement", type=float, default=0.98)
+    parser.add_argument("--repeats", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--backend", help=argparse.SUPPRESS)
+    parser.add_argument("--model", help=argparse.SUPPRESS)
+    parser.add_argument("--features", help=argparse.SUPPRESS)
+    parser.add_argument("--out", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args)
+
+        return
+
+    directory = tempfile.mkdtemp(prefix="model-backends-")
+    features_path = os.path.join(directory, "features.npy")
+
+    if args.feature_store:
+        # The children memory-map the store's spectrograms, nothing is decoded
+        store = FeatureStore(args.feature_store)
+        features_path = os.path.join(store.directory, "features.npy")
+        labels = store.labels
+        source = f"{len(store)} clips of the feature store {args.feature_store}"
+
+    else:
+        clips = sorted(glob.glob(args.clips))
+        features = calibration_features(args.clips, len(clips))
+        # The folder of a training clip is its label; index 0 of the model output is "ambulance"
+        labels = np.array([0 if os.path.basename(os.path.dirname(os.path.dirname(path))) == "ambulance" else 1 for path in clips])
+
+        if not features:
+            # A different seed from the synthetic int8 calibration set
+            features = synthetic_calibration_features(args.synthetic_clips, seed=1)
+            labels = None
+
+        source = f"{len(clips)} training clips" if clips else f"{len(features)} synthetic clips (dataset not checked out)"
+        np.save(features_path, np.stack(features).astype(np.float32))
+
+    print(f"parity on {source}\n")
+
+    if args.feature_store:
+        # Every n-th clip, so both classes (stored one after the other) take part
+        calibration = list(store.features[:: max(1, len(store) // 200)][:200])
+
+    else:
+        calibration = calibration_features(args.clips, 200) or synthetic_calibration_features(200)
+    models = [("keras", "keras", os.path.abspath(args.keras_model))]
+
+    for quantize in args.quantize:
+        path = os.path.join(directory, f"model-{quantize}.tflite")
+
+        with open(path, "wb") as f:
+            f.write(convert(args.keras_model, quantize, calibration if quantize == "int8" else None))
+
+        models.append((f"tflite {quantize}", "tflite", path))
+
+    reference = None
+    failures = []
+
+    print(
+        f"{'backend':>15} {'size KB':>8} {'startup ms':>11} {'single ms':>10} {'batch ms/clip':>14} "
+        f"{'RSS MB':>7} {'peak MB':>8} {'max |dp|':>9} {'agree':>7} {'accuracy':>9}"
+    )
+
+    for name, backend, path in models:
+        stats, predictions = measure(args, backend, path, features_path, directory)
+
+        if reference is None:
+            reference = predictions
+
+        agreement = float(np.mean(predictions.argmax(axis=1) == reference.argmax(axis=1)))
+        accuracy = f"{np.mean(predictions.argmax(axis=1) == labels):>9.3f}" if labels is not None else f"{'-':>9}"
+
+        if agreement < args.min_agreement:
+            failures.append(name)
+
+        print(
+            f"{name:>15} {os.path.getsize(path) / 1024:>8.1f} {stats['startup_ms']:>11.0f} {stats['single_ms']:>10.3f} "
+            f"{stats['batch_ms']:>14.3f} {stats['rss_mb']:>7.0f} {stats['peak_rss_mb']:>8.0f} "
+            f"{np.abs(predictions - reference).max():>9.2e} {agreement:>7.3f} {accuracy}"
+        )
+
+    if failures:
+        sys.exit(f"Label agreement with Keras below {args.min_agreement} for: {', '.join(failures)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Check that the MP4 box walk of the decoder ends on malformed headers.
+
+`_needs_seekable_input` walks the top-level boxes of .m4a uploads to find out whether
+the index comes before the media data. Each header below (a box size smaller than its
+header, a 64-bit size smaller than its 16-byte header, a truncated 64-bit size) used
+to move the walk backwards or fail; every one must now be answered within
+`--timeout` seconds, next to well-formed files that must keep their answer. Exits
+non-zero otherwise.
+
+Usage (from the server directory):
+    python benchmarks/mp4_box_walk.py
+"""
+
+import argparse
+import os
+import struct
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from models.classify.decoder import _needs_seekable_input  # noqa: E402
+
+
+def box(kind: bytes, payload: bytes = b"") -> bytes:
+    return struct.pack(">I4s", 8 + len(payload), kind) + payload
+
+
+CASES = [
+    ("moov first", box(b"ftyp", b"M4A ") + box(b"moov") + box(b"mdat", b"\x00" * 16), False),
+    ("mdat first", box(b"ftyp", b"M4A ") + box(b"mdat", b"\x00" * 16) + box(b"moov"), True),
+    ("64-bit size", box(b"ftyp") + struct.pack(">I4sQ", 1, b"free", 24) + b"\x00" * 8 + box(b"moov"), False),
+    ("truncated", box(b"ftyp")[:6], True),
+    ("64-bit size 0", struct.pack(">I4sQ", 1, b"free", 0) + b"\x00" * 32, True),
+    ("64-bit size 15", struct.pack(">I4sQ", 1, b"free", 15) + b"\x00" * 32, True),
+    ("truncated 64-bit size", struct.pack(">I4s", 1, b"free") + b"\x00" * 4, True),
+] + [(f"size {size}", box(b"ftyp") + struct.pack(">I4s", size, b"free") + b"\x00" * 32, True) for size in range(2, 8)]
+
+
+def answer(content: bytes, timeout: float):
+    """The walk's answer for an .m4a upload, or None when it does not end in time."""
+
+    result = []
+    thread = threading.Thread(target=lambda: result.append(_needs_seekable_input([content], ".m4a")), daemon=True)
+    thread.start()
+    thread.join(timeout)
+
+    return result[0] if result else None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--timeout", type=float, default=2)
+    args = parser.parse_args()
+
+    errors = []
+
+    for name, content, expected in CASES:
+        result = answer(content, args.timeout)
+        print(f"{name:>22}: {'hung' if result is None else result}")
+
+        if result is not expected:
+            errors.append(f"{name}: expected {expected}, got {'no answer' if result is None else result}")
+
+    if errors:
+        sys.exit("\n".join(errors))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Compare classifying uploads at their native sample rate with the canonical-rate pipeline.
+
+Parity: the training clips (5 s WAVs cut by model/src/cut.py, under
+model/src/sounds/*/test, or synthetic stand-ins at 44.1 kHz when the dataset is not
+checked out) must give exactly the same features in the canonical mode as with the
+native-rate preprocessing they were trained with (exits non-zero otherwise). The
+same siren rendered at other rates is then compared with its 44.1 kHz rendering, to
+show how far the features drift with and without resampling (mean |dB| over the mel
+bands below the upload's Nyquist frequency, which it can carry at all).
+
+Cost: median latency and peak traced memory per upload rate, for `extract_features`
+(one model window) and for `extract_windows` on a 30 s recording (timeline mode).
+
+Usage (from the server directory):
+    python benchmarks/sample_rate.py --rates 16000 22050 44100 48000 96000
+"""
+
+import argparse
+import glob
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from io import BytesIO
+
+import numpy as np
+import soundfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from models.classify import pipeline  # noqa: E402
+
+TRAINING_CLIPS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "model", "src", "sounds", "*", "test", "*.wav")
+
+
+def siren_wav(sample_rate: int, duration: float = 5.0) -> bytes:
+    """A 5 s two-tone siren over light noise, rendered at `sample_rate` as 16-bit WAV (like cut.py's exports)."""
+
+    t = np.arange(int(duration * sample_rate)) / sample_rate
+    tone = np.where(np.sin(2 * np.pi * 1.5 * t) > 0, 960.0, 770.0)
+    phase = 2 * np.pi * np.cumsum(tone) / sample_rate
+    noise = 0.02 * np.random.default_rng(0).standard_normal(len(t))
+    buffer = BytesIO()
+    soundfile.write(buffer, (0.4 * np.sin(phase) + noise).astype(np.float32), sample_rate, format="WAV", subtype="PCM_16")
+
+    return buffer.getvalue()
+
+
+def measure(function, repeats: int) -> tuple:
+    """Median wall time (ms) and peak traced allocation (KB) of one call."""
+
+    durations = []
+
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        durations.append((time.perf_counter() - start) * 1000)
+
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return statistics.median(durations), peak / 1024
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rates", type=int, nargs="+", default=[16000, 22050, 44100, 48000, 96000])
+    parser.add_argument("--sample-rate", type=int, default=pipeline.SAMPLE_RATE or 44100, help="canonical rate")
+    parser.add_argument("--repeats", type=int, default=30)
+    args = parser.parse_args()
+
+    canonical = args.sample_rate
+
+    # Parity with the training preprocessing
+    clips = sorted(glob.glob(TRAINING_CLIPS))
+    contents = [open(path, "rb").read() for path in clips] or [siren_wav(canonical)]
+    mismatches = 0
+
+    for content in contents:
+        if soundfile.info(BytesIO(content)).samplerate != canonical:
+            continue
+
+        native = pipeline.extract_features(content, ".wav", sample_rate=None)
+        resampled = pipeline.extract_features(content, ".wav", sample_rate=canonical)
+        mismatches += int(not np.array_equal(native, resampled))
+
+    source = f"{len(clips)} training clips" if clips else "synthetic clip (dataset not checked out)"
+    print(f"parity with training preprocessing ({source}): {mismatches} mismatches\n")
+
+    if mismatches:
+        sys.exit(f"{mismatches} clips at {canonical} Hz got different features in the canonical mode")
+
+    # Drift from the canonical-rate rendering per upload rate
+    import librosa
+
+    reference = pipeline.extract_features(siren_wav(canonical), ".wav", sample_rate=None)
+    band_frequencies = librosa.mel_frequencies(pipeline.N_MELS + 2, fmax=canonical / 2)[1:-1]
+
+    print(f"{'rate':>6} {'window s':>9} {'native |dB|':>12} {'canonical |dB|':>15}")
+
+    for rate in args.rates:
+        content = siren_wav(rate)
+        bands = band_frequencies < min(rate, canonical) / 2
+
+        native_features = pipeline.extract_features(content, ".wav", sample_rate=None)
+        canonical_features = pipeline.extract_features(content, ".wav", sample_rate=canonical)
+
+        print(
+            f"{rate:>6} {pipeline.MAX_TIME_STEPS * pipeline.HOP_LENGTH / rate:>9.2f} "
+            f"{np.abs(native_features - reference)[bands].mean():>12.2f} "
+            f"{np.abs(canonical_features - reference)[bands].mean():>15.2f}"
+        )
+
+    # Cost per upload rate
+    print(f"\n{'rate':>6} {'mode':>10} {'window ms':>10} {'window KB':>10} {'30s timeline ms':>16} {'30s timeline KB':>16}")
+
+    for rate in args.rates:
+        clip, recording = siren_wav(rate), siren_wav(rate, duration=30.0)
+
+        for mode, sample_rate in [("native", None), ("canonical", canonical)]:
+            window_ms, window_kb = measure(
+                lambda: pipeline.extract_features(clip, ".wav", sample_rate=sample_rate), args.repeats
+            )
+            timeline_ms, timeline_kb = measure(
+                lambda: pipeline.extract_windows(recording, ".wav", sample_rate=sample_rate), max(3, args.repeats // 5)
+            )
+
+            print(f"{rate:>6} {mode:>10} {window_ms:>10.2f} {window_kb:>10.0f} {timeline_ms:>16.1f} {timeline_kb:>16.0f}")
+
+
+if __name__ == "__main__":
+    main()
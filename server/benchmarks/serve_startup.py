@@ -0,0 +1,133 @@
+"""
+Check that the multi-worker server starts through main.py and exposes one set of metrics.
+
+`SERVER_WORKERS=N python src/main.py` hands over to the pre-fork launcher
+(src/serve.py). The server is started that way, every worker must become ready, and
+`--requests` uploads of a clip are then sent one by one with /metrics scraped after
+each. Whichever worker answers, the request counter must never go down and must end
+at the number of uploads, and every worker must appear in the `worker` label of the
+gauges. Exits non-zero otherwise.
+
+Usage (from the server directory):
+    MODEL_PATH=model.h5 python benchmarks/serve_startup.py path/to/clip.wav --workers 2
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+MAIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "main.py")
+
+
+def wait_ready(url: str, process: subprocess.Popen, timeout_s: float) -> None:
+    deadline = time.monotonic() + timeout_s
+
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            sys.exit(f"Server exited with {process.returncode}")
+
+        try:
+            if httpx.get(url, timeout=2).status_code == 200:
+                return
+
+        except httpx.HTTPError:
+            pass
+
+        time.sleep(0.5)
+
+    sys.exit(f"Server was not ready after {timeout_s:.0f}s")
+
+
+def scrape(url: str) -> tuple:
+    """Total of `classify_requests_total` and the workers labelling `classify_model_loaded`."""
+
+    total = 0.0
+    workers = set()
+
+    for line in httpx.get(url, timeout=10).text.splitlines():
+        if line.startswith("classify_requests_total{"):
+            total += float(line.rsplit(" ", 1)[1])
+
+        elif line.startswith("classify_model_loaded{"):
+            workers.add(line.split('worker="', 1)[1].split('"', 1)[0])
+
+    return total, workers
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("clip", help="audio file to upload")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--port", type=int, default=3912)
+    parser.add_argument("--ready-timeout", type=float, default=300)
+    args = parser.parse_args()
+
+    with open(args.clip, "rb") as f:
+        content = f.read()
+
+    file_name = os.path.basename(args.clip)
+    base_url = f"http://127.0.0.1:{args.port}/api"
+    # Run in a scratch directory, so the server's relative history paths never touch the real history
+    directory = tempfile.mkdtemp(prefix="serve-startup-")
+    env = {
+        **os.environ,
+        "SERVER_WORKERS": str(args.workers),
+        "HOST": "127.0.0.1",
+        "PORT": str(args.port),
+        "MODEL_PATH": os.path.abspath(os.getenv("MODEL_PATH", "model.h5")),
+        "HISTORY_DATABASE": os.path.join(directory, "history.db"),
+        "RESULT_CACHE_SIZE": "0",
+    }
+
+    process = subprocess.Popen(
+        [sys.executable, MAIN], cwd=directory, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    errors = []
+
+    try:
+        # Every worker must be ready, not just the one that answered
+        for _ in range(args.workers * 4):
+            wait_ready(f"{base_url}/ready", process, args.ready_timeout)
+
+        previous = 0.0
+        workers = set()
+
+        for index in range(args.requests):
+            response = httpx.post(f"{base_url}/classify/", files={"file": (file_name, content)}, timeout=120)
+
+            if response.status_code != 201:
+                errors.append(f"upload {index + 1}: status {response.status_code}")
+
+            total, seen = scrape(f"{base_url}/metrics")
+            workers |= seen
+
+            if total < previous:
+                errors.append(f"upload {index + 1}: classify_requests_total went down from {previous:.0f} to {total:.0f}")
+
+            previous = total
+
+        print(f"{args.workers} workers, classify_requests_total {previous:.0f} after {args.requests} uploads")
+        print(f"workers in the gauges: {sorted(workers)}")
+
+        if previous != args.requests:
+            errors.append(f"classify_requests_total is {previous:.0f}, expected {args.requests}")
+
+        if workers != {str(index) for index in range(args.workers)}:
+            errors.append(f"gauges labelled with workers {sorted(workers)}, expected 0 to {args.workers - 1}")
+
+    finally:
+        process.terminate()
+        process.wait(30)
+
+    if errors:
+        sys.exit("\n".join(errors))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,438 @@
+"""
+End-to-end benchmark of the classify server, saved as JSON and compared with a baseline.
+
+Everything runs in this process and is seeded, so two runs on the same machine and
+tree are comparable:
+
+- model: a stub Keras model with the real model's (128, 128, 1) input and two classes
+  (a small CNN with seeded weights), unless `--model` points at a real one;
+- clips: a siren sweep over pink noise, encoded in every format of ALLOWED_EXTENSIONS
+  (webm and m4a need ffmpeg) for each of `--durations`;
+- stages: median and p95 of decode, features, pad (per format and duration) and
+  predict (per batch size), called directly on the pipeline functions;
+- sweep: the app (src/main.py, with its lifespan) is driven through httpx's ASGI
+  transport with at most `--concurrency` uploads in flight, cycling through the
+  `--sweep-duration` clips of every format; throughput, p50/p95/p99 latency, the
+  response statuses and the peak RSS of the server process and its workers are
+  reported per level. The result cache is disabled so every upload is classified.
+
+Results are written to `--output`. With `--baseline`, every figure is compared with
+the same figure of an earlier run: median stage times, p50/p95 latency and peak RSS more
+than `--tolerance` higher (stages also by more than `--min-delta-us`), or throughput more
+than `--tolerance` lower, are flagged as regressions and the script exits non-zero.
+Compare runs made with the same configuration (backends, workers).
+
+Usage (from the server directory):
+    python benchmarks/suite.py --output before.json
+    python benchmarks/suite.py --output after.json --baseline before.json
+    CLASSIFY_FEATURE_BACKEND=thread python benchmarks/suite.py --concurrency 1 8 32 --requests 400
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+SRC = os.path.join(BENCHMARKS, "..", "src")
+
+sys.path.insert(0, BENCHMARKS)
+
+# Read when the logger is imported (by the decoder, below); one line per request would swamp the report
+os.environ.setdefault("LOG_LEVEL", "ERROR")
+
+from decode import FFMPEG_CODECS, encode  # noqa: E402
+from upload_memory import proc_status_mb, reset_peak  # noqa: E402
+
+SAMPLE_RATE = 44100
+
+# Figures compared with the baseline (the others, tail percentiles of few samples, are too noisy),
+# and those of them where a lower value is better; throughput is better higher
+COMPARED = ("median_us", "throughput_rps", "p50_ms", "p95_ms", "server_peak_rss_mb", "workers_peak_rss_mb")
+LOWER_IS_BETTER = ("_us", "_ms", "_mb")
+
+# Configuration recorded with the results, so runs with different settings are told apart
+RECORDED_ENVIRONMENT = [
+    "MODEL_BACKEND",
+    "CLASSIFY_FEATURE_BACKEND",
+    "CLASSIFY_INFERENCE_BACKEND",
+    "CLASSIFY_FEATURE_WORKERS",
+    "CLASSIFY_INFERENCE_WORKERS",
+    "CLASSIFY_MAX_PENDING",
+    "CLASSIFY_SAMPLE_RATE",
+    "INFERENCE_MAX_BATCH_SIZE",
+    "INFERENCE_MAX_WAIT_MS",
+]
+
+
+def build_stub_model(path: str, seed: int) -> None:
+    """Save a small seeded CNN taking the real model's (128, 128, 1) input and giving two class probabilities."""
+
+    import keras
+
+    keras.utils.set_random_seed(seed)
+
+    model = keras.Sequential(
+        [
+            keras.Input(shape=(128, 128, 1)),
+            keras.layers.Conv2D(16, 3, activation="relu"),
+            keras.layers.MaxPooling2D(2),
+            keras.layers.Conv2D(32, 3, activation="relu"),
+            keras.layers.MaxPooling2D(2),
+            keras.layers.GlobalAveragePooling2D(),
+            keras.layers.Dense(32, activation="relu"),
+            keras.layers.Dense(2, activation="softmax"),
+        ]
+    )
+    model.save(path)
+
+
+def synthetic_signal(duration: float, rng: np.random.Generator) -> np.ndarray:
+    """A wailing siren over pink-ish noise."""
+
+    t = np.arange(int(duration * SAMPLE_RATE)) / SAMPLE_RATE
+    siren = 0.3 * np.sin(2 * np.pi * (700 + 300 * np.sin(2 * np.pi * 1.5 * t)) * t)
+    noise = np.cumsum(rng.standard_normal(len(t))) / 2000
+
+    return np.clip(siren + noise - noise.mean(), -1, 1).astype(np.float32)
+
+
+def make_clips(extensions: list, durations: list, seed: int) -> dict:
+    """Encoded clips keyed by (extension, duration); formats that cannot be encoded here are left out."""
+
+    has_ffmpeg = shutil.which(os.getenv("FFMPEG_BINARY", "ffmpeg")) is not None
+    rng = np.random.default_rng(seed)
+    clips = {}
+
+    for duration in durations:
+        signal = synthetic_signal(duration, rng)
+
+        for extension in extensions:
+            if extension in FFMPEG_CODECS and not has_ffmpeg:
+                continue
+
+            clips[(extension, duration)] = encode(signal, SAMPLE_RATE, extension)
+
+    return clips
+
+
+def summarize_us(durations: list) -> dict:
+    durations = sorted(durations)
+
+    return {"median_us": statistics.median(durations), "p95_us": percentile(durations, 0.95)}
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def time_us(function, repeats: int) -> list:
+    function()
+    durations = []
+
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        durations.append((time.perf_counter() - start) * 1e6)
+
+    return durations
+
+
+def run_stages(clips: dict, batch_sizes: list, repeats: int) -> dict:
+    """Per-stage timings of the pipeline functions, called directly in this process."""
+
+    from models.classify import pipeline
+    from models.classify.decoder import decode_audio
+
+    stages = {}
+
+    for (extension, duration), content in clips.items():
+        decode = lambda: decode_audio(  # noqa: E731
+            content, extension, max_samples=pipeline.required_samples(), sample_rate=pipeline.SAMPLE_RATE
+        )
+        y, sr = decode()
+        features = lambda: pipeline.extract_spectrogram(y, sr, max_time_steps=pipeline.MAX_TIME_STEPS)  # noqa: E731
+        spectrogram = features()
+
+        stages[f"{extension}/{duration:g}s"] = {
+            "decode": summarize_us(time_us(decode, repeats)),
+            "features": summarize_us(time_us(features, repeats)),
+            "pad": summarize_us(time_us(lambda: pipeline.pad_spectrogram(spectrogram), repeats)),
+        }
+
+    rng = np.random.default_rng(0)
+
+    for batch_size in batch_sizes:
+        X = rng.uniform(-80, 0, (batch_size, pipeline.N_MELS, pipeline.MAX_TIME_STEPS, 1)).astype(np.float32)
+        stages[f"predict/batch {batch_size}"] = {"predict": summarize_us(time_us(lambda: pipeline.predict(X), repeats))}
+
+    return stages
+
+
+def process_tree(pid: int) -> list:
+    """A process and all its descendants."""
+
+    pids = [pid]
+
+    for task in os.listdir(f"/proc/{pid}/task"):
+        try:
+            with open(f"/proc/{pid}/task/{task}/children") as f:
+                for child in f.read().split():
+                    pids.extend(process_tree(int(child)))
+
+        except OSError:
+            pass
+
+    return pids
+
+
+def peak_rss_mb() -> dict:
+    """Peak RSS of this process and, summed, of its worker processes."""
+
+    pid = os.getpid()
+    workers = [child for child in process_tree(pid) if child != pid]
+
+    return {
+        "server_peak_rss_mb": proc_status_mb(pid, "VmHWM"),
+        "workers_peak_rss_mb": sum(proc_status_mb(child, "VmHWM") for child in workers),
+    }
+
+
+async def run_level(client, uploads: list, concurrency: int, total: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    statuses: dict = {}
+
+    async def one(index: int) -> None:
+        file_name, content = uploads[index % len(uploads)]
+
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post("/classify/", files={"file": (file_name, content)})
+            latencies.append((time.perf_counter() - start) * 1000)
+            statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+
+    can_reset = all(reset_peak(pid) for pid in process_tree(os.getpid()))
+    start = time.perf_counter()
+    await asyncio.gather(*(one(index) for index in range(total)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "throughput_rps": total / elapsed,
+        "p50_ms": statistics.median(latencies),
+        "p95_ms": percentile(latencies, 0.95),
+        "p99_ms": percentile(latencies, 0.99),
+        "statuses": statuses,
+        # Without clear_refs the peak is the process's peak since it started
+        "peak_rss_reset": can_reset,
+        **peak_rss_mb(),
+    }
+
+
+async def run_sweep(uploads: list, levels: list, total: int) -> list:
+    """Drive the app in process at each concurrency level, after its lifespan has started and it is ready."""
+
+    import httpx
+
+    import main
+
+    transport = httpx.ASGITransport(app=main.app)
+
+    async with main.app.router.lifespan_context(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=300) as client:
+            while not (await client.get("/ready")).json()["success"]:
+                await asyncio.sleep(0.2)
+
+            # Warm every format's decoder and the workers, not measured
+            await asyncio.gather(*(client.post("/classify/", files={"file": upload}) for upload in uploads))
+
+            results = []
+
+            for concurrency in levels:
+                result = await run_level(client, uploads, concurrency, total)
+                results.append(result)
+
+                print(
+                    f"{concurrency:>5} {result['throughput_rps']:>8.1f} {result['p50_ms']:>9.1f} {result['p95_ms']:>9.1f} "
+                    f"{result['p99_ms']:>9.1f} {result['server_peak_rss_mb']:>10.0f} {result['workers_peak_rss_mb']:>11.0f}  "
+                    f"{result['statuses']}"
+                )
+
+    return results
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BENCHMARKS, capture_output=True, text=True, check=True
+        ).stdout.strip()
+
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def figures(results: dict) -> dict:
+    """The comparable figures of a run, keyed by a path such as "sweep/8/p95_ms"."""
+
+    flat = {}
+
+    for clip, stages in results["stages"].items():
+        for stage, summary in stages.items():
+            for key, value in summary.items():
+                flat[f"stages/{clip}/{stage}/{key}"] = value
+
+    for level in results["sweep"]:
+        for key in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms", "server_peak_rss_mb", "workers_peak_rss_mb"):
+            flat[f"sweep/{level['concurrency']}/{key}"] = level[key]
+
+    return flat
+
+
+def compare(results: dict, baseline: dict, tolerance: float, min_delta_us: float) -> list:
+    """
+    Figures worse than in the baseline by more than `tolerance` (relative), as printable lines.
+
+    Stage timings must also be worse by more than `min_delta_us`, so that stages taking
+    a few microseconds do not turn timer noise into regressions.
+    """
+
+    current, previous = figures(results), figures(baseline)
+    regressions = []
+
+    for key in sorted(current.keys() & previous.keys()):
+        value, before = current[key], previous[key]
+
+        if before <= 0 or not key.endswith(COMPARED):
+            continue
+
+        if key.endswith("_us") and value - before <= min_delta_us:
+            continue
+
+        change = value / before - 1
+        worse = change > tolerance if key.endswith(LOWER_IS_BETTER) else change < -tolerance
+
+        if worse:
+            regressions.append(f"{key}: {before:.1f} -> {value:.1f} ({change:+.0%})")
+
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", help="model file to use instead of the stub (as MODEL_PATH)")
+    parser.add_argument("--durations", type=float, nargs="+", default=[1, 5, 30], help="clip durations in seconds")
+    parser.add_argument("--sweep-duration", type=float, default=5, help="duration of the clips uploaded in the sweep")
+    parser.add_argument("--repeats", type=int, default=20, help="timed calls per stage")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 16])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--requests", type=int, default=200, help="uploads per concurrency level")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--baseline", help="results of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="relative change flagged as a regression")
+    parser.add_argument("--min-delta-us", type=float, default=100, help="smallest stage slowdown flagged as a regression")
+    args = parser.parse_args()
+
+    if args.sweep_duration not in args.durations:
+        args.durations.append(args.sweep_duration)
+
+    directory = tempfile.mkdtemp(prefix="benchmark-suite-")
+
+    try:
+        if args.model:
+            model_path = os.path.abspath(args.model)
+
+        else:
+            model_path = os.path.join(directory, "stub_model.h5")
+            build_stub_model(model_path, args.seed)
+
+        # Read by the server modules when they are imported, so set before importing them
+        os.environ["MODEL_PATH"] = model_path
+        os.environ["RESULT_CACHE_SIZE"] = "0"
+        os.environ["HISTORY_DATABASE"] = os.path.join(directory, "history.db")
+        sys.path.insert(0, SRC)
+
+        from model_manager import model_manager
+        from models.classify.controller import ALLOWED_EXTENSIONS
+
+        extensions = sorted(ALLOWED_EXTENSIONS)
+        clips = make_clips(extensions, args.durations, args.seed)
+        skipped = sorted(set(extensions) - {extension for extension, _ in clips})
+
+        model_manager.load_model()
+
+        results = {
+            "created": datetime.datetime.now().isoformat(timespec="seconds"),
+            "environment": {
+                "commit": git_commit(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+                "model": "stub" if not args.model else os.path.basename(args.model),
+                "model_version": model_manager.get_model_version(),
+                "settings": {name: os.environ[name] for name in RECORDED_ENVIRONMENT if name in os.environ},
+                "arguments": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+                "skipped_formats": skipped,
+            },
+        }
+
+        print(f"{len(clips)} clips ({', '.join(extensions)} x {', '.join(f'{d:g}s' for d in args.durations)}), {os.cpu_count()} CPUs")
+
+        if skipped:
+            print(f"Skipped (ffmpeg not available): {', '.join(skipped)}")
+
+        print(f"\n{'stage':>24} {'median us':>10} {'p95 us':>10}")
+        results["stages"] = run_stages(clips, args.batch_sizes, args.repeats)
+
+        for clip, stages in results["stages"].items():
+            for stage, summary in stages.items():
+                print(f"{clip + ' ' + stage:>24} {summary['median_us']:>10.0f} {summary['p95_us']:>10.0f}")
+
+        uploads = [
+            (f"clip{extension}", content)
+            for (extension, duration), content in clips.items()
+            if duration == args.sweep_duration
+        ]
+
+        print(f"\n{'conc':>5} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'server MB':>10} {'workers MB':>11}  statuses")
+        results["sweep"] = asyncio.run(run_sweep(uploads, args.concurrency, args.requests))
+
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+        print(f"\nResults: {args.output}")
+
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+        if baseline["environment"]["settings"] != results["environment"]["settings"]:
+            print(f"Warning: the baseline ran with other settings: {baseline['environment']['settings']}")
+
+        regressions = compare(results, baseline, args.tolerance, args.min_delta_us)
+
+        if regressions:
+            sys.exit(f"Regressions against {args.baseline} (commit {baseline['environment']['commit']}):\n" + "\n".join(regressions))
+
+        print(f"No regressions beyond {args.tolerance:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
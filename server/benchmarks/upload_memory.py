@@ -0,0 +1,190 @@
+"""
+Measure the server's peak memory while it receives concurrent large uploads.
+
+A server (src/main.py, decoding on its own threads so the decode is counted too) is
+started, then `--concurrency` uploads are sent at once for each scenario:
+
+- valid: WAV files just under the size limit, which are decoded and classified;
+- oversized: bodies of `--oversized-mb` MB, with a Content-Length header;
+- oversized, chunked: the same bodies sent without a Content-Length header.
+
+For each scenario, the growth of the server's peak resident set size (VmHWM, reset
+between scenarios through /proc/<pid>/clear_refs) and the wall time are reported.
+Pass `--src` to measure another checkout of the server, e.g. one that still buffers
+whole uploads.
+
+Usage (from the server directory):
+    MODEL_PATH=model.h5 python benchmarks/upload_memory.py --concurrency 16
+"""
+
+import argparse
+import asyncio
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+import numpy as np
+import soundfile
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+BOUNDARY = b"upload-memory-benchmark"
+
+
+def proc_status_mb(pid: int, field: str) -> float:
+    """A memory field (VmRSS, VmHWM, ...) of a process in MB."""
+
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith(f"{field}:"):
+                return int(line.split()[1]) / 1024
+
+    return 0.0
+
+
+def reset_peak(pid: int) -> bool:
+    """Reset VmHWM to the current RSS; returns False where the kernel does not allow it."""
+
+    try:
+        with open(f"/proc/{pid}/clear_refs", "w") as f:
+            f.write("5")
+
+        return True
+
+    except OSError:
+        return False
+
+
+def valid_wav(size_mb: float, seed: int) -> bytes:
+    """A noise WAV of about `size_mb` MB, different for every seed so no cache can answer for it."""
+
+    frames = int(size_mb * 1024 * 1024 / 2)
+    signal = np.random.default_rng(seed).uniform(-0.5, 0.5, frames).astype(np.float32)
+    buffer = io.BytesIO()
+    soundfile.write(buffer, signal, 44100, format="WAV", subtype="PCM_16")
+
+    return buffer.getvalue()
+
+
+def multipart_body(file_name: str, content: bytes) -> bytes:
+    return (
+        b"--" + BOUNDARY + b"\r\n"
+        + f'Content-Disposition: form-data; name="file"; filename="{file_name}"\r\n'.encode()
+        + b"Content-Type: application/octet-stream\r\n\r\n"
+        + content
+        + b"\r\n--" + BOUNDARY + b"--\r\n"
+    )
+
+
+async def send(client: httpx.AsyncClient, url: str, body: bytes, chunked: bool) -> int:
+    headers = {"content-type": f"multipart/form-data; boundary={BOUNDARY.decode()}"}
+
+    async def chunks():
+        for start in range(0, len(body), 64 * 1024):
+            yield body[start : start + 64 * 1024]
+
+    try:
+        response = await client.post(url, content=chunks() if chunked else body, headers=headers)
+
+        return response.status_code
+
+    # The server may answer and close before a rejected body has been sent in full
+    except httpx.TransportError:
+        return 0
+
+
+async def scenario(url: str, bodies: list, chunked: bool) -> tuple:
+    async with httpx.AsyncClient(timeout=300) as client:
+        start = time.perf_counter()
+        statuses = await asyncio.gather(*(send(client, url, body, chunked) for body in bodies))
+
+    return time.perf_counter() - start, statuses
+
+
+def wait_ready(url: str, process: subprocess.Popen, timeout_s: float) -> None:
+    deadline = time.monotonic() + timeout_s
+
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            sys.exit(f"Server exited with {process.returncode}")
+
+        try:
+            if httpx.get(url, timeout=2).status_code == 200:
+                return
+
+        except httpx.HTTPError:
+            pass
+
+        time.sleep(0.5)
+
+    sys.exit(f"Server was not ready after {timeout_s:.0f}s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--src", default=SRC, help="server source directory to run")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--valid-mb", type=float, default=9.5)
+    parser.add_argument("--oversized-mb", type=float, default=50)
+    parser.add_argument("--port", type=int, default=3912)
+    parser.add_argument("--ready-timeout", type=float, default=300)
+    args = parser.parse_args()
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    # Run in a scratch directory, so the server's relative history paths never touch the real history
+    directory = tempfile.mkdtemp(prefix="upload-memory-benchmark-")
+    env = {
+        **os.environ,
+        "PORT": str(args.port),
+        "MODEL_PATH": os.path.abspath(os.getenv("MODEL_PATH", "model.h5")),
+        "HISTORY_DATABASE": os.path.join(directory, "history.db"),
+        "CLASSIFY_FEATURE_BACKEND": "thread",
+        "RESULT_CACHE_SIZE": "0",
+    }
+
+    valid = [multipart_body(f"valid-{i}.wav", valid_wav(args.valid_mb, i)) for i in range(args.concurrency)]
+    oversized = [multipart_body("oversized.wav", bytes(int(args.oversized_mb * 1024 * 1024)))] * args.concurrency
+    scenarios = [("valid", valid, False), ("oversized", oversized, False), ("oversized, chunked", oversized, True)]
+
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(os.path.abspath(args.src), "main.py")],
+        cwd=directory,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+    try:
+        wait_ready(f"{base_url}/ready", process, args.ready_timeout)
+
+        # Warm up the decode and inference paths before measuring
+        asyncio.run(scenario(f"{base_url}/classify/", valid[:1], False))
+
+        print(f"server RSS after warm-up: {proc_status_mb(process.pid, 'VmRSS'):.0f} MB\n")
+        print(f"{'scenario':>20} {'uploads':>8} {'sent MB':>8} {'peak growth MB':>15} {'wall s':>7}  statuses")
+
+        for name, bodies, chunked in scenarios:
+            baseline = proc_status_mb(process.pid, "VmRSS")
+
+            if not reset_peak(process.pid):
+                baseline = proc_status_mb(process.pid, "VmHWM")
+
+            elapsed, statuses = asyncio.run(scenario(f"{base_url}/classify/", bodies, chunked))
+            growth = proc_status_mb(process.pid, "VmHWM") - baseline
+            counts = ", ".join(f"{status or 'reset'} x{statuses.count(status)}" for status in sorted(set(statuses)))
+
+            print(
+                f"{name:>20} {len(bodies):>8} {sum(map(len, bodies)) / 2**20:>8.0f} {growth:>15.0f} {elapsed:>7.2f}  {counts}"
+            )
+
+    finally:
+        process.terminate()
+        process.wait(30)
+
+
+if __name__ == "__main__":
+    main()
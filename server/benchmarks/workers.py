@@ -0,0 +1,186 @@
+"""
+Measure memory and throughput of the pre-fork server (src/serve.py) as workers are added.
+
+For every worker count, the server is started with one shared model process and
+then with a model per worker. Once /ready answers, `--requests` uploads of a clip are
+sent with `--concurrency` in flight (the result cache is disabled, so every request
+runs the model), and the following are reported from /proc:
+
+- RSS of each API worker and of the model process;
+- PSS (proportional set size: shared pages are split between the processes sharing
+  them) summed over the whole process tree, which is the memory the server really
+  costs;
+- aggregate requests/sec and p50 latency.
+
+Throughput can only grow with workers up to the number of CPUs of the machine.
+
+Usage (from the server directory):
+    MODEL_PATH=model.h5 python benchmarks/workers.py path/to/clip.wav --workers 1 2 4
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+SERVE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "serve.py")
+
+
+def children(pid: int) -> list:
+    """Direct children of a process."""
+
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(child) for child in f.read().split()]
+
+    except OSError:
+        return []
+
+
+def memory_kb(pid: int) -> dict:
+    """RSS and PSS of a process in KB, from /proc/<pid>/smaps_rollup."""
+
+    values = {}
+
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            field, _, rest = line.partition(":")
+
+            if field in ("Rss", "Pss"):
+                values[field.lower()] = int(rest.split()[0])
+
+    return values
+
+
+def command_line(pid: int) -> str:
+    with open(f"/proc/{pid}/cmdline", "rb") as f:
+        return f.read().replace(b"\0", b" ").decode()
+
+
+async def load(url: str, file_name: str, content: bytes, concurrency: int, total: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    failures = 0
+
+    async with httpx.AsyncClient(timeout=120) as client:
+
+        async def one() -> None:
+            nonlocal failures
+
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post(url, files={"file": (file_name, content)})
+                latencies.append((time.perf_counter() - start) * 1000)
+                failures += int(response.status_code != 201)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(total)))
+        elapsed = time.perf_counter() - start
+
+    return {"rps": total / elapsed, "p50_ms": statistics.median(latencies), "failures": failures}
+
+
+def wait_ready(url: str, process: subprocess.Popen, timeout_s: float) -> None:
+    deadline = time.monotonic() + timeout_s
+
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            sys.exit(f"Server exited with {process.returncode}")
+
+        try:
+            if httpx.get(url, timeout=2).status_code == 200:
+                return
+
+        except httpx.HTTPError:
+            pass
+
+        time.sleep(0.5)
+
+    sys.exit(f"Server was not ready after {timeout_s:.0f}s")
+
+
+def run(args, workers: int, inference: str, content: bytes, file_name: str) -> dict:
+    base_url = f"http://127.0.0.1:{args.port}/api"
+    # Run in a scratch directory, so the server's relative history paths never touch the real history
+    directory = tempfile.mkdtemp(prefix="workers-benchmark-")
+    env = {
+        **os.environ,
+        "MODEL_PATH": os.path.abspath(os.getenv("MODEL_PATH", "model.h5")),
+        "HISTORY_DATABASE": os.path.join(directory, "history.db"),
+        "RESULT_CACHE_SIZE": "0",
+    }
+
+    process = subprocess.Popen(
+        [sys.executable, SERVE, "--workers", str(workers), "--port", str(args.port), "--host", "127.0.0.1", "--inference", inference],
+        cwd=directory,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+    try:
+        wait_ready(f"{base_url}/ready", process, args.ready_timeout)
+
+        # Every worker must be ready, not just the one that answered
+        for _ in range(workers * 4):
+            wait_ready(f"{base_url}/ready", process, args.ready_timeout)
+
+        result = asyncio.run(load(f"{base_url}/classify/", file_name, content, args.concurrency, args.requests))
+
+        tree = children(process.pid)
+        model_pids = [pid for pid in tree if "spawn_main" in command_line(pid)]
+        worker_pids = [pid for pid in tree if pid not in model_pids]
+        processes = [process.pid] + tree
+
+        result.update(
+            worker_rss_mb=statistics.mean(memory_kb(pid)["rss"] for pid in worker_pids) / 1024,
+            model_rss_mb=sum(memory_kb(pid)["rss"] for pid in model_pids) / 1024,
+            total_pss_mb=sum(memory_kb(pid)["pss"] for pid in processes) / 1024,
+        )
+
+        return result
+
+    finally:
+        process.terminate()
+        process.wait(30)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("clip", help="audio file to upload")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--inference", nargs="+", choices=["shared", "per-worker"], default=["shared", "per-worker"])
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--port", type=int, default=3911)
+    parser.add_argument("--ready-timeout", type=float, default=300)
+    args = parser.parse_args()
+
+    with open(args.clip, "rb") as f:
+        content = f.read()
+
+    file_name = os.path.basename(args.clip)
+
+    print(
+        f"{'inference':>10} {'workers':>7} {'worker RSS MB':>14} {'model RSS MB':>13} "
+        f"{'total PSS MB':>13} {'req/s':>7} {'p50 ms':>7} {'failed':>6}"
+    )
+
+    for inference in args.inference:
+        for workers in args.workers:
+            result = run(args, workers, inference, content, file_name)
+
+            print(
+                f"{inference:>10} {workers:>7} {result['worker_rss_mb']:>14.0f} {result['model_rss_mb']:>13.0f} "
+                f"{result['total_pss_mb']:>13.0f} {result['rps']:>7.1f} {result['p50_ms']:>7.1f} {result['failures']:>6}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+"""
+Classify audio files offline, with the server's pipeline but without HTTP.
+
+Every file goes through the same steps as an upload to /api/classify: the decode
+and spectrogram of `pipeline.extract_features` (in a pool of `--workers` processes)
+and the model through `pipeline.predict` (with the backend and model set by
+MODEL_BACKEND and MODEL_PATH), in batches of `--batch-size` files. Results are
+appended to the output file as each batch completes, as CSV or JSON lines
+(chosen by its extension), in completion order:
+
+    path, result ("ambulance" or "traffic_noise"), is_ambulance, confidence, error
+
+The output file is also the checkpoint: started again on the same output, the run
+skips every file already in it (and drops a line cut short by an interruption), so
+an interrupted run simply resumes. Files that failed are retried with
+`--retry-failed` (their new line follows the failed one); `--force` starts the
+output over.
+
+Usage (from the server directory):
+    python src/classify_files.py recordings/ "archive/**/*.mp3" -o results.csv
+    MODEL_BACKEND=tflite MODEL_PATH=model.tflite python src/classify_files.py recordings/ -o results.jsonl --workers 4
+"""
+
+import argparse
+import csv
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+
+from models.classify.decoder import FFMPEG_FORMATS, SOUNDFILE_EXTENSIONS
+
+AUDIO_EXTENSIONS = SOUNDFILE_EXTENSIONS | set(FFMPEG_FORMATS)
+
+OUTPUT_FIELDS = ["path", "result", "is_ambulance", "confidence", "error"]
+
+
+def find_files(inputs: List[str]) -> List[str]:
+    """Audio files among the given files, directories (searched recursively) and glob patterns, sorted."""
+
+    files = set()
+
+    for pattern in inputs:
+        for path in glob.glob(pattern, recursive=True) or [pattern]:
+            if os.path.isdir(path):
+                for directory, _, names in os.walk(path):
+                    files.update(os.path.join(directory, name) for name in names)
+
+            else:
+                files.add(path)
+
+    return sorted(
+        os.path.abspath(path)
+        for path in files
+        if os.path.isfile(path) and os.path.splitext(path)[1].lower() in AUDIO_EXTENSIONS
+    )
+
+
+def read_checkpoint(output: str, retry_failed: bool) -> Set[str]:
+    """
+    Paths already classified in an existing output file.
+
+    A last line without its newline was cut short by an interruption; it is removed
+    from the file so new results are appended after complete lines only.
+    """
+
+    if not os.path.exists(output):
+        return set()
+
+    with open(output, "rb+") as f:
+        content = f.read()
+        complete = content.rfind(b"\n") + 1
+
+        if complete < len(content):
+            f.truncate(complete)
+
+    lines = content[:complete].decode().splitlines()
+
+    if output.endswith(".jsonl"):
+        rows = [json.loads(line) for line in lines if line.strip()]
+
+    else:
+        rows = list(csv.DictReader(lines))
+
+    return {row["path"] for row in rows if not (retry_failed and row["error"])}
+
+
+class ResultWriter:
+    """Appends result rows to the output file, CSV or JSON lines, flushed after every batch."""
+
+    def __init__(self, output: str, force: bool) -> None:
+        self.is_jsonl = output.endswith(".jsonl")
+        is_new = force or not os.path.exists(output) or os.path.getsize(output) == 0
+
+        self._file = open(output, "w" if force else "a", newline="")
+        self._csv = None if self.is_jsonl else csv.DictWriter(self._file, fieldnames=OUTPUT_FIELDS)
+
+        if self._csv is not None and is_new:
+            self._csv.writeheader()
+
+    def write(self, rows: List[dict]) -> None:
+        if self.is_jsonl:
+            self._file.writelines(json.dumps(row) + "\n" for row in rows)
+
+        else:
+            self._csv.writerows(rows)
+
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def extract(path: str) -> Tuple[Optional[np.ndarray], Optional[str]]:
+    """Model input for one file, or why it could not be made; runs in a worker process."""
+
+    from models.classify import pipeline
+
+    try:
+        with open(path, "rb") as f:
+            return pipeline.extract_features(f.read(), os.path.splitext(path)[1].lower()), None
+
+    except Exception as e:
+        return None, str(e)
+
+
+def extracted(pool: ProcessPoolExecutor, paths: List[str], max_pending: int) -> Iterator[Tuple[str, Optional[np.ndarray], Optional[str]]]:
+    """Extract features in the pool, keeping at most `max_pending` files in flight; yields in completion order."""
+
+    remaining = iter(paths)
+    pending = {}
+
+    while True:
+        for path in remaining:
+            pending[pool.submit(extract, path)] = path
+
+            if len(pending) >= max_pending:
+                break
+
+        if not pending:
+            return
+
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+
+        for future in done:
+            yield (pending.pop(future), *future.result())
+
+
+def classify(paths: List[str], writer: ResultWriter, workers: int, batch_size: int, report_every_s: float) -> dict:
+    """
+    Classify `paths` and write their results.
+
+    Returns:
+        How many files were classified and how many failed, and the seconds it took
+        once the workers were ready
+    """
+
+    from models.classify import pipeline
+
+    counts = {"classified": 0, "failed": 0}
+    batch: List[Tuple[str, np.ndarray]] = []
+    rows: List[dict] = []
+
+    def flush() -> None:
+        if batch:
+            prediction = pipeline.predict(np.stack([features for _, features in batch])[..., np.newaxis])
+
+            for (path, _), probabilities in zip(batch, prediction):
+                index = int(np.argmax(probabilities))
+                # Same labels as the API (and the history): class 0 is the ambulance siren
+                rows.append(
+                    {
+                        "path": path,
+                        "result": "ambulance" if index == 0 else "traffic_noise",
+                        "is_ambulance": index == 0,
+                        "confidence": round(float(probabilities[index]), 6),
+                        "error": "",
+                    }
+                )
+
+            counts["classified"] += len(batch)
+            batch.clear()
+
+        writer.write(rows)
+        rows.clear()
+
+    # Spawn rather than fork: the model (TensorFlow) is already loaded in this process
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn"), initializer=pipeline.warm_feature_worker
+    ) as pool:
+        # Start (and warm) every worker before the clock starts, so files/s is the steady rate
+        wait([pool.submit(_noop) for _ in range(workers)])
+        start = last_report = time.perf_counter()
+
+        for path, features, error in extracted(pool, paths, max_pending=batch_size + 4 * workers):
+            if features is None:
+                rows.append({"path": path, "result": "", "is_ambulance": "", "confidence": "", "error": error})
+                counts["failed"] += 1
+
+            else:
+                batch.append((path, features))
+
+            if len(batch) >= batch_size:
+                flush()
+
+            now = time.perf_counter()
+
+            if now - last_report >= report_every_s:
+                done = counts["classified"] + counts["failed"] + len(batch)
+                print(
+                    f"{done}/{len(paths)} files, {done / (now - start):.1f} files/s",
+                    file=sys.stderr,
+                )
+                last_report = now
+
+        flush()
+
+    counts["elapsed_s"] = time.perf_counter() - start
+
+    return counts
+
+
+def _noop() -> None:
+    pass
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("inputs", nargs="+", help="audio files, directories (searched recursively) or glob patterns")
+    parser.add_argument("-o", "--output", required=True, help="results file: .csv, or .jsonl for JSON lines")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="processes decoding files")
+    parser.add_argument("--batch-size", type=int, default=64, help="files per forward pass of the model")
+    parser.add_argument("--retry-failed", action="store_true", help="classify again the files that failed before")
+    parser.add_argument("--force", action="store_true", help="start the output over instead of resuming")
+    parser.add_argument("--report-every", type=float, default=10, help="seconds between progress lines")
+    args = parser.parse_args()
+
+    if not args.output.endswith((".csv", ".jsonl")):
+        parser.error("--output must end in .csv or .jsonl")
+
+    files = find_files(args.inputs)
+
+    if not files:
+        parser.error(f"No audio files found in {', '.join(args.inputs)}")
+
+    done = set() if args.force else read_checkpoint(args.output, args.retry_failed)
+    todo = [path for path in files if path not in done]
+
+    print(f"{len(files)} files, {len(files) - len(todo)} already in {args.output}, {len(todo)} to classify", file=sys.stderr)
+
+    if not todo:
+        return
+
+    from model_manager import model_manager
+
+    # Fail before decoding anything if the model cannot be loaded
+    model_manager.load_model()
+
+    writer = ResultWriter(args.output, args.force)
+
+    try:
+        counts = classify(todo, writer, args.workers, args.batch_size, args.report_every)
+
+    finally:
+        writer.close()
+
+    elapsed = counts["elapsed_s"]
+
+    print(
+        f"Classified {counts['classified']} files ({counts['failed']} failed) in {elapsed:.1f}s: "
+        f"{len(todo) / elapsed:.1f} files/s ({len(todo) / elapsed * 60:.0f} per minute). Results: {args.output}",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
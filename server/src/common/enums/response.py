@@ -5,4 +5,6 @@ class ResponseStatusEnum(Enum):
     OK_200 = 200
     CREATED_201 = 201
     BAD_REQUEST_400 = 400
+    UNAUTHORIZED_401 = 401
     INTERNAL_SERVER_ERROR_500 = 500
+    SERVICE_UNAVAILABLE_503 = 503
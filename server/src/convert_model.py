@@ -0,0 +1,149 @@
+"""
+Convert the Keras model to TensorFlow Lite for the "tflite" model backend.
+
+Quantization modes:
+    none     float32 weights and activations (same results as the Keras model)
+    dynamic  int8 weights, float activations (about 4x smaller; no calibration)
+    float16  float16 weights, dequantized on load (about 2x smaller)
+    int8     int8 weights and activations, calibrated on spectrograms of the
+             training clips (model/src/sounds/*/test); the model keeps float32
+             inputs and outputs, so the server feeds it unchanged
+
+The input keeps a dynamic batch dimension, so the batcher's batches run as one call.
+Check the converted model with benchmarks/model_backends.py before serving it.
+
+Usage (from the server directory):
+    python src/convert_model.py model.h5 model.tflite --quantize float16
+    MODEL_BACKEND=tflite MODEL_PATH=model.tflite python src/main.py
+"""
+
+import argparse
+import glob
+import os
+from typing import Iterator, List
+
+import numpy as np
+
+QUANTIZATIONS = ["none", "dynamic", "float16", "int8"]
+
+TRAINING_CLIPS = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "..", "model", "src", "sounds", "*", "test", "*.wav"
+)
+
+
+def calibration_features(pattern: str, limit: int) -> List[np.ndarray]:
+    """Model inputs for int8 calibration: spectrograms of up to `limit` clips matching `pattern`."""
+
+    from models.classify import pipeline
+
+    features = []
+
+    for path in sorted(glob.glob(pattern))[:limit]:
+        with open(path, "rb") as f:
+            features.append(pipeline.extract_features(f.read(), os.path.splitext(path)[1].lower()))
+
+    return features
+
+
+def synthetic_calibration_features(count: int, seed: int = 0) -> List[np.ndarray]:
+    """Stand-in calibration data (sirens and noise) for when the training clips are not checked out."""
+
+    from models.classify import pipeline
+    from models.classify.features import get_feature_extractor
+
+    sample_rate = pipeline.SAMPLE_RATE or 44100
+    extractor = get_feature_extractor(sample_rate, pipeline.N_FFT, pipeline.HOP_LENGTH, pipeline.N_MELS)
+    rng = np.random.default_rng(seed)
+    t = np.arange(pipeline.required_samples()) / sample_rate
+    signals = []
+
+    for i in range(count):
+        noise = rng.uniform(0.01, 0.2) * rng.standard_normal(len(t))
+        pitch = rng.uniform(600, 1000) + rng.uniform(100, 300) * np.sin(2 * np.pi * rng.uniform(0.3, 2) * t)
+        siren = rng.uniform(0.1, 0.5) * np.sin(2 * np.pi * np.cumsum(pitch) / sample_rate)
+        signals.append((noise + siren if i % 2 == 0 else noise).astype(np.float32))
+
+    return list(extractor.batch(signals, pipeline.MAX_TIME_STEPS))
+
+
+def convert(keras_path: str, quantize: str = "none", calibration: List[np.ndarray] = None) -> bytes:
+    """
+    Convert a Keras model file to a TensorFlow Lite flatbuffer.
+
+    Args:
+        keras_path: Path of the Keras (.h5) model
+        quantize: One of QUANTIZATIONS
+        calibration: Model inputs (n_mels, max_time_steps) for int8 calibration
+
+    Returns:
+        The TensorFlow Lite model
+    """
+
+    import tempfile
+
+    import keras
+    import tensorflow as tf
+
+    if quantize not in QUANTIZATIONS:
+        raise ValueError(f"Invalid quantization: {quantize} (expected one of {QUANTIZATIONS})")
+
+    if quantize == "int8" and not calibration:
+        raise ValueError("int8 quantization needs calibration inputs")
+
+    model = keras.models.load_model(keras_path)
+
+    with tempfile.TemporaryDirectory() as saved_model_dir:
+        # The exported serving signature keeps the batch dimension dynamic and its weights frozen
+        model.export(saved_model_dir, format="tf_saved_model", verbose=False)
+        converter = tf.lite.TFLiteConverter.from_saved_model(saved_model_dir)
+
+        if quantize != "none":
+            converter.optimizations = [tf.lite.Optimize.DEFAULT]
+
+        if quantize == "float16":
+            converter.target_spec.supported_types = [tf.float16]
+
+        if quantize == "int8":
+
+            def representative_dataset() -> Iterator[list]:
+                for features in calibration:
+                    yield [features[np.newaxis, ..., np.newaxis].astype(np.float32)]
+
+            converter.representative_dataset = representative_dataset
+            converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+
+        return converter.convert()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("keras_model", help="Keras model to convert (.h5)")
+    parser.add_argument("output", help="TensorFlow Lite model to write (.tflite)")
+    parser.add_argument("--quantize", choices=QUANTIZATIONS, default="none")
+    parser.add_argument("--calibration-clips", default=TRAINING_CLIPS, help="glob of clips for int8 calibration")
+    parser.add_argument("--calibration-size", type=int, default=200)
+    args = parser.parse_args()
+
+    calibration = None
+
+    if args.quantize == "int8":
+        calibration = calibration_features(args.calibration_clips, args.calibration_size)
+
+        if not calibration:
+            print(f"No clips match {args.calibration_clips}, calibrating on synthetic sirens and noise instead")
+
+            calibration = synthetic_calibration_features(args.calibration_size)
+
+    flatbuffer = convert(args.keras_model, args.quantize, calibration)
+
+    with open(args.output, "wb") as f:
+        f.write(flatbuffer)
+
+    print(
+        f"Wrote {args.output} ({len(flatbuffer) / 1024:.1f} KB, quantization: {args.quantize}, "
+        f"Keras model: {os.path.getsize(args.keras_model) / 1024:.1f} KB)"
+    )
+
+
+if __name__ == "__main__":
+    main()
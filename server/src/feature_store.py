@@ -0,0 +1,259 @@
+"""
+Precomputed spectrograms of the training clips, for training and evaluation without decoding.
+
+A store is a directory holding:
+
+    features.npy  float32 model inputs, shaped (clips, n_mels, max_time_steps), exactly
+                  what `pipeline.extract_features` gives the model for each clip
+    index.csv     one row per clip, in the same order: path, label, label index (0 is
+                  "ambulance", like the model's output), size and modification time
+    params.json   the feature parameters the store was built with
+
+Building again only extracts the clips that are new or whose size or modification
+time changed; the others are copied over from the previous store, and a change of
+feature parameters rebuilds everything. `FeatureStore` memory-maps features.npy, so
+opening a store costs nothing and a dataset larger than RAM can be streamed batch by
+batch.
+
+Usage (from the server directory):
+    python src/feature_store.py --clips "../model/src/sounds/*/test/*.wav" --output ../model/src/features
+"""
+
+import argparse
+import csv
+import glob
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from convert_model import TRAINING_CLIPS
+
+LABELS = ["ambulance", "traffic-noise"]
+
+DEFAULT_STORE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "model", "src", "features")
+
+INDEX_FIELDS = ["path", "label", "label_index", "size", "mtime_ns"]
+
+
+def feature_params() -> dict:
+    from models.classify import pipeline
+
+    return {
+        "sample_rate": pipeline.SAMPLE_RATE,
+        "n_mels": pipeline.N_MELS,
+        "n_fft": pipeline.N_FFT,
+        "hop_length": pipeline.HOP_LENGTH,
+        "max_time_steps": pipeline.MAX_TIME_STEPS,
+    }
+
+
+def clip_label(path: str) -> str:
+    """The label of a training clip is the name of its class folder (sounds/<label>/test/<clip>)."""
+
+    return os.path.basename(os.path.dirname(os.path.dirname(os.path.abspath(path))))
+
+
+class FeatureStore:
+    """A feature store opened for reading, with its spectrograms memory-mapped."""
+
+    def __init__(self, directory: str = DEFAULT_STORE) -> None:
+        self.directory = directory
+
+        with open(os.path.join(directory, "params.json")) as f:
+            self.params = json.load(f)
+
+        with open(os.path.join(directory, "index.csv"), newline="") as f:
+            self.index = list(csv.DictReader(f))
+
+        # Pages are only read when a batch touches them
+        self.features: np.ndarray = np.load(os.path.join(directory, "features.npy"), mmap_mode="r")
+        self.labels = np.array([int(row["label_index"]) for row in self.index], dtype=np.int64)
+
+        if len(self.features) != len(self.index):
+            raise ValueError(f"Feature store {directory} is inconsistent ({len(self.features)} features, {len(self.index)} clips)")
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def batches(
+        self, batch_size: int = 32, shuffle: bool = False, seed: Optional[int] = None
+    ) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Iterate over (inputs, labels) batches, with inputs shaped (batch, n_mels, max_time_steps, 1).
+
+        In order, each batch is a view of the memory map; shuffled, only the batch is
+        copied (its rows read in file order).
+        """
+
+        order = np.random.default_rng(seed).permutation(len(self)) if shuffle else None
+
+        for start in range(0, len(self), batch_size):
+            if order is None:
+                rows = slice(start, start + batch_size)
+
+            else:
+                rows = np.sort(order[start : start + batch_size])
+
+            yield self.features[rows][..., np.newaxis], self.labels[rows]
+
+
+def _extract(path: str) -> Tuple[Optional[np.ndarray], Optional[str]]:
+    """Spectrogram of one clip, or why it could not be made; runs in a worker process."""
+
+    from models.classify import pipeline
+
+    try:
+        with open(path, "rb") as f:
+            return pipeline.extract_features(f.read(), os.path.splitext(path)[1].lower()), None
+
+    except Exception as e:
+        return None, str(e)
+
+
+def _open_previous(directory: str, params: dict) -> Optional[FeatureStore]:
+    """The store already in `directory`, if it was built with the same parameters and is intact."""
+
+    try:
+        store = FeatureStore(directory)
+
+    except (OSError, ValueError):
+        return None
+
+    return store if store.params == params else None
+
+
+def build(clips: List[str], directory: str = DEFAULT_STORE, workers: int = 1) -> dict:
+    """
+    Build or update the feature store in `directory` for the given clips.
+
+    Args:
+        clips: Paths of the clips to store (in class folders named after LABELS)
+        directory: Directory of the store
+        workers: Processes extracting spectrograms
+
+    Returns:
+        Counts of the clips reused from the previous store, extracted and failed
+    """
+
+    params = feature_params()
+    os.makedirs(directory, exist_ok=True)
+
+    previous = _open_previous(directory, params)
+    previous_rows = {}
+
+    if previous is not None:
+        previous_rows = {(row["path"], row["size"], row["mtime_ns"]): i for i, row in enumerate(previous.index)}
+
+    rows = []
+
+    for path in sorted(clips, key=lambda path: (clip_label(path), path)):
+        label = clip_label(path)
+
+        if label not in LABELS:
+            raise ValueError(f"{path} is not in a class folder ({', '.join(LABELS)})")
+
+        stat = os.stat(path)
+        rows.append(
+            {
+                "path": os.path.abspath(path),
+                "label": label,
+                "label_index": LABELS.index(label),
+                "size": str(stat.st_size),
+                "mtime_ns": str(stat.st_mtime_ns),
+            }
+        )
+
+    reused = [previous_rows.get((row["path"], row["size"], row["mtime_ns"])) for row in rows]
+    changed = [i for i, source in enumerate(reused) if source is None]
+
+    features_path = os.path.join(directory, "features.npy")
+    features = np.lib.format.open_memmap(
+        f"{features_path}.partial",
+        mode="w+",
+        dtype=np.float32,
+        shape=(len(rows), params["n_mels"], params["max_time_steps"]),
+    )
+
+    for i, source in enumerate(reused):
+        if source is not None:
+            features[i] = previous.features[source]
+
+    failed = []
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(_extract, [rows[i]["path"] for i in changed], chunksize=16)
+
+        for i, (spectrogram, error) in zip(changed, results):
+            if spectrogram is None:
+                print(f"Could not extract {rows[i]['path']}: {error}")
+                failed.append(i)
+
+            else:
+                features[i] = spectrogram
+
+    # Clips that failed leave the store; the remaining rows are moved up over them
+    if failed:
+        failed_rows = set(failed)
+        keep = [i for i in range(len(rows)) if i not in failed_rows]
+        compacted = np.lib.format.open_memmap(
+            f"{features_path}.compacted", mode="w+", dtype=np.float32, shape=(len(keep),) + features.shape[1:]
+        )
+
+        for target, i in enumerate(keep):
+            compacted[target] = features[i]
+
+        compacted.flush()
+        del features
+        os.replace(f"{features_path}.compacted", f"{features_path}.partial")
+        rows = [rows[i] for i in keep]
+
+    else:
+        features.flush()
+        del features
+
+    del previous
+
+    with open(os.path.join(directory, "index.csv.partial"), "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=INDEX_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+    with open(os.path.join(directory, "params.json.partial"), "w") as f:
+        json.dump(params, f, indent=2)
+
+    # The loader checks that features and index agree, so a crash between the renames only costs a rebuild
+    os.replace(f"{features_path}.partial", features_path)
+    os.replace(os.path.join(directory, "index.csv.partial"), os.path.join(directory, "index.csv"))
+    os.replace(os.path.join(directory, "params.json.partial"), os.path.join(directory, "params.json"))
+
+    return {"clips": len(rows), "reused": len(reused) - len(changed), "extracted": len(changed) - len(failed), "failed": len(failed)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clips", default=TRAINING_CLIPS, help="glob of the training clips")
+    parser.add_argument("--output", default=DEFAULT_STORE, help="directory of the feature store")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    clips = glob.glob(args.clips)
+
+    if not clips:
+        parser.error(f"No clips match {args.clips}")
+
+    start = time.perf_counter()
+    stats = build(clips, args.output, args.workers)
+
+    print(
+        f"Feature store {os.path.abspath(args.output)}: {stats['clips']} clips "
+        f"({stats['reused']} unchanged, {stats['extracted']} extracted, {stats['failed']} failed) "
+        f"in {time.perf_counter() - start:.1f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,139 @@
+import asyncio
 import os
+import sys
+import time
+from contextlib import asynccontextmanager
 
 from dotenv import load_dotenv
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 
-from model_manager import model_manager
+# Load the environment before the local modules read their configuration
+load_dotenv()
+
+from common.enums.response import ResponseStatusEnum
+from models.classify import pipeline
+from models.classify.batcher import model_batcher
+from models.classify.cache import result_cache
 from models.classify.controller import router as classify_router
+from models.classify.executor import classify_executor
+from models.classify.metrics import register_pipeline_metrics
+from models.classify.stream import STREAM_MAX_CONNECTIONS, StreamSession
+from models.history.controller import router as history_router
+from utilities.history_writer import history_writer
+from utilities.logger import Logger
+from utilities.metrics import MultiprocessMetrics, metrics_registry
+from utilities.request_id import RequestIdMiddleware
+from utilities.response import Response
 
-load_dotenv()
+# Readiness of this replica, filled in by the warm-up task
+startup_state: dict = {
+    "is_ready": False,
+    "is_model_loaded": False,
+    "model_version": None,
+    "model_backend": None,
+    "timings_ms": {},
+    "error": None,
+}
+
+register_pipeline_metrics(
+    classify_executor, model_batcher, result_cache, StreamSession, lambda: startup_state["is_model_loaded"]
+)
+
+# Set by serve.py, so that /metrics covers every worker rather than the one answering the scrape
+METRICS_DIRECTORY = os.getenv("METRICS_DIRECTORY")
+METRICS_WRITE_INTERVAL_S = float(os.getenv("METRICS_WRITE_INTERVAL_S", "1"))
+
+# Global multiprocess metrics instance (None when running as a single process)
+multiprocess_metrics = MultiprocessMetrics(metrics_registry, METRICS_DIRECTORY) if METRICS_DIRECTORY else None
+
+
+async def write_metrics() -> None:
+    """Keep this worker's metrics snapshot fresh for the scrapes other workers answer."""
+
+    while True:
+        try:
+            await asyncio.to_thread(multiprocess_metrics.write)
+
+        except Exception as e:
+            Logger.warning("[write_metrics] Could not write the metrics snapshot: %s", e)
+
+        await asyncio.sleep(METRICS_WRITE_INTERVAL_S)
+
+
+async def warm_up() -> None:
+    """Start the worker pools, which load and warm up the model, then mark the replica ready."""
+
+    # Nothing awaits this task until shutdown, so a failure is logged and reported by /ready here
+    try:
+        await _warm_up()
+
+    except Exception as e:
+        startup_state["error"] = f"{type(e).__name__}: {e}"
+
+        Logger.error("[warm_up] Failed, replica will not report ready: %s", startup_state["error"], exc_info=True)
+
+
+async def _warm_up() -> None:
+    start = time.perf_counter()
+
+    await classify_executor.start()
+    await model_batcher.start()
+
+    # Ask an inference worker (which may live in another process) how its model load went
+    status: dict = await classify_executor.run_inference(pipeline.model_status)
+
+    startup_state["is_model_loaded"] = status["is_loaded"]
+    startup_state["model_version"] = status["version"]
+    startup_state["model_backend"] = status["backend"]
+    result_cache.set_model_version(status["version"])
+    startup_state["timings_ms"] = {**status["timings_ms"], "total_ms": (time.perf_counter() - start) * 1000}
+    startup_state["is_ready"] = status["is_loaded"]
+
+    if status["is_loaded"]:
+        Logger.info(
+            "[warm_up] Ready ("
+            + ", ".join(f"{phase}: {value:.0f}" for phase, value in startup_state["timings_ms"].items())
+            + ")"
+        )
+
+    else:
+        startup_state["error"] = "Model failed to load"
 
+        Logger.error("[warm_up] Model failed to load, replica will not report ready")
 
-app: FastAPI = FastAPI(root_path="/api")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await history_writer.start()
+
+    # Warm up in the background so /health answers while the model loads; /ready gates traffic
+    warm_up_task = asyncio.create_task(warm_up())
+    metrics_task = asyncio.create_task(write_metrics()) if multiprocess_metrics is not None else None
+
+    yield
+
+    if not warm_up_task.done():
+        warm_up_task.cancel()
+
+    await asyncio.gather(warm_up_task, return_exceptions=True)
+
+    await model_batcher.stop()
+    classify_executor.shutdown()
+
+    # Flush pending history entries so none are lost on shutdown
+    await history_writer.stop()
+
+    if metrics_task is not None:
+        metrics_task.cancel()
+        await asyncio.gather(metrics_task, return_exceptions=True)
+
+        # The last snapshot keeps this worker's counts in the totals after it exits
+        multiprocess_metrics.write()
+
+
+app: FastAPI = FastAPI(root_path="/api", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -22,9 +145,14 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["POST", "GET"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID"],
 )
 
+# Added last, so it wraps the other middleware and every response carries the ID
+app.add_middleware(RequestIdMiddleware)
+
 app.include_router(classify_router)
+app.include_router(history_router)
 
 
 @app.get("/")
@@ -40,13 +168,72 @@ async def health_check() -> dict:
         "status": "healthy",
         "service": "Indonesian Emergency Sound Classification API Server",
         "model": {
-            "is_loaded": model_manager.is_model_loaded(),
-            "message": "loaded" if model_manager.is_model_loaded() else "not loaded yet",
+            "is_loaded": startup_state["is_model_loaded"],
+            "message": "loaded" if startup_state["is_model_loaded"] else "not loaded yet",
+            "version": startup_state["model_version"],
+            "backend": startup_state["model_backend"],
+            "startup_timings_ms": startup_state["timings_ms"],
         },
+        "batching": model_batcher.stats(),
+        "result_cache": result_cache.stats(),
+        "streams": {"active": StreamSession.active, "max": STREAM_MAX_CONNECTIONS},
     }
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics() -> PlainTextResponse:
+    """
+    Metrics in the Prometheus text format.
+
+    Stage and request latencies are histograms (seconds), outcomes and cache lookups
+    are counters, and queue depths and the model state are gauges. With several
+    workers (serve.py), whichever worker answers merges every worker's snapshot:
+    counters and histograms are summed (those of exited workers included, so they
+    never go down) and gauges carry a `worker` label.
+    """
+
+    if multiprocess_metrics is None:
+        content = metrics_registry.render()
+
+    else:
+        content = await asyncio.to_thread(multiprocess_metrics.render)
+
+    return PlainTextResponse(content, media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/ready")
+async def readiness_check():
+    """Readiness endpoint: 200 only once the model is loaded and warmed up."""
+
+    if not startup_state["is_ready"]:
+        return Response[dict](
+            success=False,
+            status=ResponseStatusEnum.SERVICE_UNAVAILABLE_503,
+            message=f"Warm-up failed: {startup_state['error']}" if startup_state["error"] else "Model is warming up",
+            data=startup_state,
+        )
+
+    return Response[dict](
+        success=True,
+        status=ResponseStatusEnum.OK_200,
+        message="Ready",
+        data=startup_state,
+    )
+
+
 if __name__ == "__main__":
-    import uvicorn
+    if int(os.getenv("SERVER_WORKERS", "1")) > 1:
+        # Several worker processes sharing one model process, see serve.py. Replace this
+        # process rather than importing serve.py here: it imports this module as `main`,
+        # which would run it a second time (registering its metrics twice), and it has
+        # to configure the environment before this module is first imported
+        serve_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "serve.py")
+
+        # os.execv skips atexit, so write the queued log records first
+        Logger.flush()
+        os.execv(sys.executable, [sys.executable, serve_path, *sys.argv[1:]])
+
+    else:
+        import uvicorn
 
-    uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("PORT")))
+        uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("PORT")))
@@ -1,20 +1,45 @@
 """Model loading and management with lazy loading and singleton pattern."""
 
+import hashlib
 import os
-from typing import Optional
+import threading
+import time
+from typing import TYPE_CHECKING, Callable, List, Optional, Union
 
-import keras
+import numpy as np
 
 from utilities.logger import Logger
 
+if TYPE_CHECKING:
+    import keras
+    from ai_edge_litert.interpreter import Interpreter
+
+# Number of dummy inferences run after loading, so the first requests hit warm caches
+MODEL_WARMUP_RUNS = int(os.getenv("MODEL_WARMUP_RUNS", "3"))
+
+# "keras" runs the full-precision .h5 model on TensorFlow; "tflite" runs a model converted
+# (and optionally quantized) by convert_model.py on the TensorFlow Lite interpreter
+MODEL_BACKEND = os.getenv("MODEL_BACKEND", "keras")
+MODEL_BACKENDS = {"keras", "tflite"}
+
+# Interpreter threads for the "tflite" backend (0 lets TensorFlow Lite decide)
+TFLITE_NUM_THREADS = int(os.getenv("TFLITE_NUM_THREADS", "0"))
+
 
 class ModelManager:
     """Manages model loading with lazy loading and singleton pattern."""
 
     _instance: Optional["ModelManager"] = None
-    _model: Optional[keras.Model] = None
-    _model_path: str = "model.h5"
+    _model: Optional[Union["keras.Model", "Interpreter"]] = None
+    _inference_fn: Optional[Callable[[np.ndarray], np.ndarray]] = None
+    _input_shape: tuple = ()
+    _backend: str = MODEL_BACKEND
+    _model_path: str = os.getenv("MODEL_PATH", "model.tflite" if MODEL_BACKEND == "tflite" else "model.h5")
     _is_loaded: bool = False
+    _model_version: Optional[str] = None
+    _version_listeners: List[Callable[[Optional[str]], None]] = []
+    _startup_timings: dict = {}
+    _load_lock = threading.Lock()
 
     def __new__(cls) -> "ModelManager":
         """Ensure only one instance exists (singleton pattern)."""
@@ -30,13 +55,24 @@ class ModelManager:
         
         return cls()
 
-    def load_model(self) -> keras.Model:
-        """Load the model (only once, cached thereafter)."""
+    def load_model(self) -> Union["keras.Model", "Interpreter"]:
+        """Load the model (only once, cached thereafter), timing the import, load and warm-up phases."""
         
         if self._is_loaded and self._model is not None:
             return self._model
 
+        with self._load_lock:
+            # Another thread may have finished loading while this one waited
+            if self._is_loaded and self._model is not None:
+                return self._model
+
+            return self._load_model()
+
+    def _load_model(self) -> Union["keras.Model", "Interpreter"]:
         try:
+            if self._backend not in MODEL_BACKENDS:
+                raise ValueError(f"Invalid model backend: {self._backend} (expected one of {MODEL_BACKENDS})")
+
             if not os.path.exists(self._model_path):
                 error_msg = f"Model file not found: {self._model_path}"
         
@@ -44,12 +80,48 @@ class ModelManager:
         
                 raise FileNotFoundError(error_msg)
 
-            Logger.debug(f"[ModelManager] Loading model from {self._model_path}")
-        
-            self._model = keras.models.load_model(self._model_path)
+            Logger.info(f"[ModelManager] Loading {self._backend} model from {self._model_path}")
+
+            # Importing keras pulls in TensorFlow, so it is deferred until a model is needed
+            start = time.perf_counter()
+
+            if self._backend == "tflite":
+                Interpreter = _import_tflite_interpreter()
+
+                imported = time.perf_counter()
+                self._model = Interpreter(model_path=self._model_path, num_threads=TFLITE_NUM_THREADS or None)
+                self._input_shape = tuple(self._model.get_input_details()[0]["shape"][1:])
+
+                loaded = time.perf_counter()
+                self._inference_fn = self._build_tflite_inference_fn(self._model)
+
+            else:
+                import keras
+
+                imported = time.perf_counter()
+                self._model = keras.models.load_model(self._model_path)
+                self._input_shape = tuple(self._model.input_shape[1:])
+
+                loaded = time.perf_counter()
+                self._inference_fn = self._build_inference_fn(self._model)
+
+            self.warm_up(MODEL_WARMUP_RUNS)
+
+            # Only a model that completed its warm-up forward passes counts as loaded
+            self._set_model_version(self._hash_model_file(self._model_path))
             self._is_loaded = True
+
+            self._startup_timings = {
+                "import_ms": (imported - start) * 1000,
+                "load_ms": (loaded - imported) * 1000,
+                "warmup_ms": (time.perf_counter() - loaded) * 1000,
+            }
         
-            Logger.debug("[ModelManager] Model loaded successfully")
+            Logger.info(
+                f"[ModelManager] Model {self._model_version} loaded successfully ("
+                + ", ".join(f"{phase}: {value:.0f}" for phase, value in self._startup_timings.items())
+                + ")"
+            )
         
             return self._model
 
@@ -58,7 +130,117 @@ class ModelManager:
             
             raise
 
-    def get_model(self) -> keras.Model:
+    @staticmethod
+    def _build_inference_fn(model: "keras.Model") -> Callable[[np.ndarray], np.ndarray]:
+        """Build a direct inference function for the model and trace it once.
+
+        `model.predict` sets up a data adapter and progress callbacks on every call,
+        which dominates the cost of serving single samples. Instead the forward pass is
+        traced once as a `tf.function` with a fixed `(None, *input_shape)` signature,
+        so every batch size reuses the same graph.
+        """
+
+        import keras
+
+        input_shape = (None,) + tuple(model.input_shape[1:])
+
+        if keras.backend.backend() == "tensorflow":
+            import tensorflow as tf
+
+            forward = tf.function(
+                lambda x: model(x, training=False),
+                input_signature=[tf.TensorSpec(shape=input_shape, dtype=tf.float32)],
+            )
+
+            def inference_fn(X: np.ndarray) -> np.ndarray:
+                return forward(tf.convert_to_tensor(X, dtype=tf.float32)).numpy()
+
+        else:
+            def inference_fn(X: np.ndarray) -> np.ndarray:
+                return keras.ops.convert_to_numpy(model(X.astype(np.float32), training=False))
+
+        # Warm up so the first request does not pay the tracing cost
+        inference_fn(np.zeros((1,) + input_shape[1:], dtype=np.float32))
+
+        return inference_fn
+
+    @staticmethod
+    def _build_tflite_inference_fn(interpreter: "Interpreter") -> Callable[[np.ndarray], np.ndarray]:
+        """Build an inference function for a TensorFlow Lite interpreter.
+
+        The interpreter is not thread-safe and its tensors are sized for one batch
+        size at a time, so calls are serialised and the input is only resized (and the
+        tensors reallocated) when the batch size changes.
+        """
+
+        input_index = interpreter.get_input_details()[0]["index"]
+        output_index = interpreter.get_output_details()[0]["index"]
+        lock = threading.Lock()
+        allocated_shape: List[Optional[tuple]] = [None]
+
+        def inference_fn(X: np.ndarray) -> np.ndarray:
+            X = np.ascontiguousarray(X, dtype=np.float32)
+
+            with lock:
+                if X.shape != allocated_shape[0]:
+                    interpreter.resize_tensor_input(input_index, X.shape)
+                    interpreter.allocate_tensors()
+                    allocated_shape[0] = X.shape
+
+                interpreter.set_tensor(input_index, X)
+                interpreter.invoke()
+
+                # The output buffer is reused by the next call
+                return interpreter.get_tensor(output_index).copy()
+
+        inference_fn(np.zeros((1,) + tuple(interpreter.get_input_details()[0]["shape"][1:]), dtype=np.float32))
+
+        return inference_fn
+
+    @staticmethod
+    def _hash_model_file(path: str) -> str:
+        """Short content hash of the model file, which identifies the model version."""
+
+        digest = hashlib.sha256()
+
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+
+        return digest.hexdigest()[:16]
+
+    def _set_model_version(self, version: Optional[str]) -> None:
+        self._model_version = version
+
+        for listener in self._version_listeners:
+            listener(version)
+
+    def add_version_listener(self, listener: Callable[[Optional[str]], None]) -> None:
+        """Call `listener` with the model version whenever a model is loaded, or None when it is unloaded."""
+
+        self._version_listeners.append(listener)
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """Run the model on a batch through the traced inference function."""
+
+        if not self._is_loaded:
+            self.load_model()
+
+        return self._inference_fn(X)
+
+    def warm_up(self, runs: int) -> None:
+        """Run dummy inferences on zeros to warm up the runtime (the model must have been built)."""
+
+        if runs <= 0:
+            return
+
+        X = np.zeros((1,) + self._input_shape, dtype=np.float32)
+
+        # Straight through the inference function: it runs before the model is marked loaded
+        for _ in range(runs):
+            self._inference_fn(X)
+
+    def get_model(self) -> Union["keras.Model", "Interpreter"]:
         """Get the cached model, or load it if not already loaded."""
         
         if not self._is_loaded:
@@ -66,18 +248,58 @@ class ModelManager:
         
         return self._model
 
+    def get_backend(self) -> str:
+        """Runtime the model is served with ("keras" or "tflite")."""
+
+        return self._backend
+
     def is_model_loaded(self) -> bool:
         """Check if model is currently loaded."""
         
         return self._is_loaded
 
+    def get_model_version(self) -> Optional[str]:
+        """Content hash of the loaded model file, or None if no model is loaded."""
+
+        return self._model_version
+
+    def get_startup_timings(self) -> dict:
+        """Time spent (in milliseconds) importing, loading and warming up the model."""
+
+        return dict(self._startup_timings)
+
     def unload_model(self) -> None:
         """Unload the model from memory."""
         
         self._model = None
+        self._inference_fn = None
         self._is_loaded = False
+        self._set_model_version(None)
         
-        Logger.debug("[ModelManager] Model unloaded")
+        Logger.info("[ModelManager] Model unloaded")
+
+
+def _import_tflite_interpreter() -> type:
+    """The TensorFlow Lite interpreter class, from the standalone runtime when it is installed.
+
+    `ai-edge-litert` (or the older `tflite-runtime`) provides the interpreter without
+    the rest of TensorFlow, which is what makes the "tflite" backend light on memory
+    and startup; without either, TensorFlow's own `tf.lite.Interpreter` is used.
+    """
+
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+
+    except ImportError:
+        try:
+            from tflite_runtime.interpreter import Interpreter
+
+        except ImportError:
+            import tensorflow as tf
+
+            Interpreter = tf.lite.Interpreter
+
+    return Interpreter
 
 
 # Global model manager instance
@@ -0,0 +1,135 @@
+"""Expansion of zip and tar archives uploaded to the batch endpoint."""
+
+import os
+import tarfile
+import zipfile
+import zlib
+from typing import BinaryIO, List, Optional
+
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+
+# Raised while inflating a single member (corrupt data, encryption, an unsupported
+# compression method); the rest of the archive can still be read
+MEMBER_ERRORS = (zipfile.BadZipFile, tarfile.TarError, zlib.error, EOFError, RuntimeError, NotImplementedError)
+
+
+class ArchiveError(Exception):
+    """Raised when an archive cannot be read."""
+
+
+class BatchLimitError(Exception):
+    """Raised when a batch request (counting the files inside its archives) exceeds its limits."""
+
+
+class ArchiveMember:
+    """A file extracted from an archive: its content, or why it was not extracted."""
+
+    def __init__(self, name: str, size: int, content: Optional[bytes] = None, error: Optional[str] = None) -> None:
+        self.name = name
+        self.size = size
+        self.content = content
+        self.error = error
+
+
+def is_archive(filename: Optional[str]) -> bool:
+    """Check whether an upload's name marks it as a zip or tar archive."""
+
+    return bool(filename) and filename.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def _open_zip_member(archive: zipfile.ZipFile, info: zipfile.ZipInfo):
+    # zipfile's own error for an encrypted member quotes the whole ZipInfo
+    if info.flag_bits & 0x1:
+        raise RuntimeError("encrypted, password required")
+
+    return archive.open(info)
+
+
+def read_archive(
+    fileobj: BinaryIO,
+    filename: str,
+    max_members: int,
+    max_member_bytes: int,
+    max_total_bytes: int,
+) -> List[ArchiveMember]:
+    """
+    Extract the regular files of an archive into memory.
+
+    Members are read with a size cap, so a compressed member that expands beyond
+    `max_member_bytes` is reported as too large instead of being inflated in full.
+    A member that cannot be inflated carries its error instead of failing the whole
+    archive. Hidden files and macOS resource forks are skipped.
+
+    Args:
+        fileobj: The archive, opened for reading (it must be seekable for zip files)
+        filename: Name of the archive, which selects the format
+        max_members: Maximum number of files in the archive
+        max_member_bytes: Maximum size of a single extracted file
+        max_total_bytes: Maximum size of all extracted files together
+
+    Returns:
+        The members in archive order; oversized and unreadable ones carry an error instead of content
+
+    Raises:
+        ArchiveError: If the archive itself cannot be read
+        BatchLimitError: If the archive holds too many files or expands beyond `max_total_bytes`
+    """
+
+    members: List[ArchiveMember] = []
+    total = 0
+
+    def add(name: str, size: int, open_member) -> None:
+        nonlocal total
+
+        base_name = os.path.basename(name)
+
+        if not base_name or base_name.startswith(".") or "__MACOSX/" in name:
+            return
+
+        if len(members) >= max_members:
+            raise BatchLimitError(f"Too many files. Archive {filename} holds more than {max_members} files")
+
+        if size > max_member_bytes:
+            members.append(ArchiveMember(name=name, size=size, error="too large"))
+
+            return
+
+        try:
+            with open_member() as member:
+                content = member.read(max_member_bytes + 1)
+
+        except MEMBER_ERRORS as e:
+            members.append(ArchiveMember(name=name, size=size, error=f"Could not extract {name}: {e}"))
+
+            return
+
+        # The declared size may lie; what was actually inflated is what counts
+        if len(content) > max_member_bytes:
+            members.append(ArchiveMember(name=name, size=len(content), error="too large"))
+
+            return
+
+        total += len(content)
+
+        if total > max_total_bytes:
+            raise BatchLimitError(f"Batch too large. Archive {filename} expands beyond the batch size limit")
+
+        members.append(ArchiveMember(name=name, size=len(content), content=content))
+
+    try:
+        if filename.lower().endswith(".zip"):
+            with zipfile.ZipFile(fileobj) as archive:
+                for info in archive.infolist():
+                    if not info.is_dir():
+                        add(info.filename, info.file_size, lambda info=info: _open_zip_member(archive, info))
+
+        else:
+            with tarfile.open(fileobj=fileobj, mode="r:*") as archive:
+                for info in archive:
+                    if info.isfile():
+                        add(info.name, info.size, lambda info=info: archive.extractfile(info))
+
+    except (zipfile.BadZipFile, tarfile.TarError, EOFError, OSError) as e:
+        raise ArchiveError(f"Could not read archive {filename}: {e}") from e
+
+    return members
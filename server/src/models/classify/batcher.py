@@ -0,0 +1,187 @@
+"""Dynamic micro-batching in front of the model."""
+
+import asyncio
+import os
+import time
+from typing import Optional
+
+import numpy as np
+
+from models.classify import pipeline
+from models.classify.executor import classify_executor
+from models.classify.metrics import stage_seconds
+from utilities.logger import Logger
+from utilities.metrics import Histogram
+
+
+class ModelBatcher:
+    """Collects concurrent prediction requests and runs them as one batched forward pass.
+
+    A batch is dispatched as soon as it holds `max_batch_size` samples or the oldest
+    request has waited `max_wait_ms`, whichever comes first. Each caller gets its own
+    rows of the batched prediction back through a future.
+    """
+
+    def __init__(self, max_batch_size: int = 16, max_wait_ms: float = 5, max_concurrent_batches: int = 1) -> None:
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.max_concurrent_batches = max_concurrent_batches
+
+        self.batch_size_histogram = Histogram([1, 2, 4, 8, 16, 32, 64, 128])
+        self.queue_delay_histogram = Histogram([0.5, 1, 2, 5, 10, 20, 50, 100, 250, 500, 1000])
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._batch_slots: Optional[asyncio.Semaphore] = None
+        self._batches: set = set()
+
+    def is_running(self) -> bool:
+        """Check if the collector task is running."""
+
+        return self._task is not None and not self._task.done()
+
+    def queue_depth(self) -> int:
+        """Number of requests waiting to be collected into a batch."""
+
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def start(self) -> None:
+        """Start the collector task on the running event loop."""
+
+        if self.is_running():
+            return
+
+        self._queue = asyncio.Queue()
+        self._batch_slots = asyncio.Semaphore(self.max_concurrent_batches)
+        self._task = asyncio.create_task(self._run())
+
+        Logger.info(
+            f"[ModelBatcher] Started (max batch: {self.max_batch_size}, max wait: {self.max_wait_ms}ms, "
+            f"concurrent batches: {self.max_concurrent_batches})"
+        )
+
+    async def stop(self) -> None:
+        """Stop collecting and wait for in-flight batches to finish."""
+
+        if not self.is_running():
+            return
+
+        await self._queue.put(None)
+        await self._task
+        await asyncio.gather(*self._batches)
+
+        self._task = None
+
+        Logger.info("[ModelBatcher] Stopped")
+
+    async def predict(self, X: np.ndarray) -> np.ndarray:
+        """
+        Predict on `X` as part of a shared batch.
+
+        Args:
+            X: Model input shaped (n, n_mels, max_time_steps, 1)
+
+        Returns:
+            The model output for the n samples of `X`
+        """
+
+        if not self.is_running():
+            await self.start()
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((X, future, time.perf_counter()))
+
+        return await future
+
+    async def _run(self) -> None:
+        """Group queued requests into batches and dispatch them."""
+
+        loop = asyncio.get_running_loop()
+        stopping = False
+
+        while not stopping:
+            item = await self._queue.get()
+
+            if item is None:
+                break
+
+            batch = [item]
+            size = len(item[0])
+            deadline = loop.time() + self.max_wait_ms / 1000
+
+            while size < self.max_batch_size:
+                timeout = deadline - loop.time()
+
+                try:
+                    item = self._queue.get_nowait() if timeout <= 0 else await asyncio.wait_for(self._queue.get(), timeout)
+
+                except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                    break
+
+                if item is None:
+                    stopping = True
+
+                    break
+
+                batch.append(item)
+                size += len(item[0])
+
+            # Bound the number of forward passes in flight to what the inference backend can run
+            await self._batch_slots.acquire()
+
+            task = asyncio.create_task(self._dispatch(batch))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def _dispatch(self, batch: list) -> None:
+        """Run one batched forward pass and resolve every caller's future."""
+
+        try:
+            dispatched_at = time.perf_counter()
+
+            for _, _, queued_at in batch:
+                self.queue_delay_histogram.observe((dispatched_at - queued_at) * 1000)
+                stage_seconds.labels("queue").observe(dispatched_at - queued_at)
+
+            inputs = np.concatenate([X for X, _, _ in batch]) if len(batch) > 1 else batch[0][0]
+            self.batch_size_histogram.observe(len(inputs))
+
+            try:
+                predictions = await classify_executor.run_inference(pipeline.predict, inputs)
+                stage_seconds.labels("inference").observe(time.perf_counter() - dispatched_at)
+
+            except Exception as e:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+                return
+
+            offset = 0
+
+            for X, future, _ in batch:
+                if not future.done():
+                    future.set_result(predictions[offset : offset + len(X)])
+
+                offset += len(X)
+
+        finally:
+            self._batch_slots.release()
+
+    def stats(self) -> dict:
+        """Batch-size distribution and queueing delay (milliseconds) recorded so far."""
+
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "batch_size": self.batch_size_histogram.snapshot(),
+            "queue_delay_ms": self.queue_delay_histogram.snapshot(),
+        }
+
+
+# Global model batcher instance
+model_batcher = ModelBatcher(
+    max_batch_size=int(os.getenv("INFERENCE_MAX_BATCH_SIZE", "16")),
+    max_wait_ms=float(os.getenv("INFERENCE_MAX_WAIT_MS", "5")),
+    max_concurrent_batches=classify_executor.inference_workers,
+)
@@ -0,0 +1,129 @@
+"""Cache of classification results for uploads that were already classified."""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from model_manager import model_manager
+from models.classify import pipeline
+from utilities.logger import Logger
+
+
+class ResultCache:
+    """LRU cache of classification results with a time-to-live.
+
+    Results are keyed by a hash of the upload bytes and its extension together with
+    the model version and the feature parameters, so a different model or feature
+    configuration never serves a stale result. The cache is emptied whenever the
+    model version changes, and bypassed while no model version is known.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_s: float = 3600) -> None:
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._entries: OrderedDict = OrderedDict()
+        self._model_version: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def is_enabled(self) -> bool:
+        return self.max_entries > 0 and self._model_version is not None
+
+    def set_model_version(self, version: Optional[str]) -> None:
+        """Switch to a new model version, dropping every result of the previous one."""
+
+        with self._lock:
+            if version == self._model_version:
+                return
+
+            dropped = len(self._entries)
+            self._entries.clear()
+            self._model_version = version
+
+        Logger.info(f"[ResultCache] Model version is now {version}, dropped {dropped} results")
+
+    def key(self, file_content: bytes, file_extension: str) -> str:
+        """Cache key of an upload under the current model version and feature parameters."""
+
+        return self.digest_key(hashlib.sha256(file_content).hexdigest(), file_extension)
+
+    def digest_key(self, digest: str, file_extension: str) -> str:
+        """Cache key of an upload whose SHA-256 was computed while it was received."""
+
+        parameters = (
+            f"{pipeline.SAMPLE_RATE}:{pipeline.N_MELS}:{pipeline.N_FFT}:{pipeline.HOP_LENGTH}:{pipeline.MAX_TIME_STEPS}"
+        )
+
+        return f"{self._model_version}:{parameters}:{file_extension}:{digest}"
+
+    def get(self, key: str) -> Optional[dict]:
+        """Return the cached result for `key`, or None (counting the hit or miss)."""
+
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is not None and now - entry[1] > self.ttl_s:
+                del self._entries[key]
+                self.evictions += 1
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+            return dict(entry[0])
+
+    def put(self, key: str, result: dict) -> None:
+        """Store a result, evicting the least recently used entries beyond `max_entries`."""
+
+        with self._lock:
+            # The model may have changed while this result was being computed
+            if self._model_version is None or not key.startswith(f"{self._model_version}:"):
+                return
+
+            self._entries[key] = (dict(result), time.monotonic())
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        """Size, hit/miss/eviction counters and hit ratio of the cache."""
+
+        with self._lock:
+            lookups = self.hits + self.misses
+
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_s": self.ttl_s,
+                "model_version": self._model_version,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+
+# Global result cache instance
+result_cache = ResultCache(
+    max_entries=int(os.getenv("RESULT_CACHE_SIZE", "1024")),
+    ttl_s=float(os.getenv("RESULT_CACHE_TTL_S", "3600")),
+)
+
+# Follow model loads in this process; process-based inference workers report theirs through warm_up
+model_manager.add_version_listener(result_cache.set_model_version)
@@ -1,17 +1,23 @@
+import asyncio
 import os
-import tempfile
 import time
-from io import BytesIO
+from typing import Dict, List, Optional, Tuple
 
-import librosa
 import numpy as np
-from fastapi import APIRouter, File, UploadFile, Request
-from pydub import AudioSegment
+from fastapi import APIRouter, File, Query, UploadFile, Request, WebSocket
 
 from common.enums.response import ResponseStatusEnum
-from model_manager import model_manager
-from utilities.history import HistoryLogger
-from utilities.logger import Logger
+from models.classify import pipeline
+from models.classify.archive import ArchiveError, BatchLimitError, is_archive, read_archive
+from models.classify.batcher import model_batcher
+from models.classify.cache import result_cache
+from models.classify.executor import ExecutorSaturatedError, classify_executor
+from models.classify.metrics import OUTCOMES, observe_stages, request_seconds, requests_total, stage_seconds
+from models.classify.stream import StreamSession
+from models.classify.upload import UPLOAD_REQUEST_BODY, StreamedUpload, UploadRejectedError, UploadTooLargeError
+from utilities.history_writer import history_writer
+from utilities.logger import INFO, Logger
+from utilities.metrics import record_stages
 from utilities.response import Response
 
 # Configuration
@@ -30,296 +36,584 @@ ALLOWED_MIME_TYPES = {
     "audio/mp4",
     "application/octet-stream",  # Some browsers send this for audio files
 }
+CLASS_NAMES = ["Ambulance", "Traffic Noise"]
 
+# Limits of one batch request, counting the files inside archives
+BATCH_MAX_FILES = int(os.getenv("CLASSIFY_BATCH_MAX_FILES", "256"))
+BATCH_MAX_TOTAL_MB = int(os.getenv("CLASSIFY_BATCH_MAX_TOTAL_MB", "200"))
+BATCH_MAX_TOTAL_BYTES = BATCH_MAX_TOTAL_MB * 1024 * 1024
 
-async def convert_to_wav(file_content: bytes, original_format: str) -> BytesIO:
-    """Convert audio file to WAV format using pydub."""
-    try:
-        # Create a temporary file to store the original audio
-        with tempfile.NamedTemporaryFile(suffix=original_format, delete=False) as temp_input:
-            temp_input.write(file_content)
-            temp_input_path = temp_input.name
 
+def get_file_extension(filename: str) -> str:
+    """Get the file extension from filename."""
+    if not filename:
+        return ""
+
+    return os.path.splitext(filename)[1].lower()
+
+
+class ClassifyAttempt:
+    """Request details shared by the history entry and the response of one classify call."""
+
+    def __init__(self, endpoint: str, request: Request, file_name: Optional[str] = None) -> None:
+        self.endpoint = endpoint
+        self.start_time = time.perf_counter()
+        self.set_file_name(file_name)
+        self.file_size = 0
+
+        # Seconds spent in each stage, for the request's log line
+        self.timings: Dict[str, float] = {}
+
+        # Extract client information
+        self.client_ip = request.client.host if request.client else "unknown"
+        self.user_agent = request.headers.get("user-agent", "unknown")
+
+    def set_file_name(self, file_name: Optional[str]) -> None:
+        self.file_name = file_name or "unknown"
+        self.file_extension = get_file_extension(file_name)
+
+    def processing_time_ms(self) -> float:
+        return (time.perf_counter() - self.start_time) * 1000
+
+    def count(self, status: ResponseStatusEnum) -> None:
+        """Count the outcome of this attempt by endpoint, outcome and format."""
+
+        # Unsupported extensions share one label value, so clients cannot add series at will
+        file_format = self.file_extension if self.file_extension in ALLOWED_EXTENSIONS else "other"
+
+        requests_total.labels(self.endpoint, OUTCOMES.get(status.value, str(status.value)), file_format).inc()
+
+    def record(self, status: ResponseStatusEnum) -> None:
+        """Count the outcome of this attempt and record how long the request took."""
+
+        self.count(status)
+        elapsed = time.perf_counter() - self.start_time
+        request_seconds.labels(self.endpoint).observe(elapsed)
+
+        if Logger.is_enabled(INFO):
+            Logger.info(
+                "[%s] %s",
+                self.endpoint,
+                OUTCOMES.get(status.value, "completed").capitalize(),
+                status=status.value,
+                file_format=self.file_extension,
+                file_size=self.file_size,
+                duration_ms=round(elapsed * 1000, 3),
+                stages_ms={name: round(seconds * 1000, 3) for name, seconds in self.timings.items()},
+            )
+
+    def history_fields(self, success: bool, **outcome) -> dict:
+        """Arguments of `history_writer.log_attempt` for this attempt and its outcome."""
+
+        return {
+            "file_name": self.file_name,
+            "file_size": self.file_size,
+            "audio_format": self.file_extension,
+            "client_ip": self.client_ip,
+            "user_agent": self.user_agent,
+            "success": success,
+            "processing_time_ms": self.processing_time_ms(),
+            **outcome,
+        }
+
+    async def fail(self, error_msg: str, status: ResponseStatusEnum) -> Response:
+        """Log a failed attempt and build the matching error response."""
+
+        self.record(status)
+
+        await history_writer.log_attempt(**self.history_fields(False, error_message=error_msg))
+
+        return Response[None](
+            success=False,
+            status=status,
+            message=error_msg,
+            data=None,
+        )
+
+    async def succeed(self, is_ambulance: bool, confidence: float) -> None:
+        """Log a successful classification."""
+
+        Logger.debug("[%s] Logging successful classification", self.endpoint)
+
+        self.record(ResponseStatusEnum.CREATED_201)
+
+        await history_writer.log_attempt(
+            **self.history_fields(True, classification_result=is_ambulance, confidence=confidence)
+        )
+
+    async def fail_unexpectedly(self, error: Exception) -> Response:
+        """Log an unexpected error (as far as possible) and answer with a generic 500."""
+
+        Logger.error("[%s] Error: %s", self.endpoint, error)
+
+        # Try to log the error attempt with whatever information we have
         try:
-            # Determine the format based on extension
-            format_map = {
-                ".mp3": "mp3",
-                ".webm": "webm",
-                ".ogg": "ogg",
-                ".oga": "ogg",
-                ".m4a": "m4a",
-                ".wav": "wav",
-            }
-            
-            audio_format = format_map.get(original_format.lower(), "wav")
-            
-            # Load and convert to WAV
-            audio = AudioSegment.from_file(temp_input_path, format=audio_format)
-            
-            # Export to WAV in memory
-            wav_buffer = BytesIO()
-            audio.export(wav_buffer, format="wav")
-            wav_buffer.seek(0)
-            
-            return wav_buffer
-            
-        finally:
-            # Clean up temporary file
-            os.unlink(temp_input_path)
-            
-    except Exception as e:
-        Logger.error(f"[convert_to_wav] Error converting audio: {e}")
+            await self.fail(str(error), ResponseStatusEnum.INTERNAL_SERVER_ERROR_500)
+
+        except Exception as log_error:
+            Logger.error("[%s] Failed to log error: %s", self.endpoint, log_error)
+
+        return Response[None](
+            success=False,
+            status=ResponseStatusEnum.INTERNAL_SERVER_ERROR_500,
+            message="Internal Server Error. Please try again.",
+            data=None,
+        )
+
+
+def validate_extension(attempt: ClassifyAttempt) -> Optional[str]:
+    """Check the extension of an upload; returns the error message if it is rejected."""
+
+    if attempt.file_extension not in ALLOWED_EXTENSIONS:
+        Logger.debug("[%s] Invalid file extension: %s", attempt.endpoint, attempt.file_extension)
+
+        return "Invalid file type. Supported formats: WAV, MP3, WebM, OGG, M4A"
+
+    return None
+
+
+def validate_size(attempt: ClassifyAttempt) -> Optional[str]:
+    """Check the size of an upload; returns the error message if it is rejected."""
+
+    if attempt.file_size > MAX_FILE_SIZE_BYTES:
+        Logger.debug("[%s] File too large: %d bytes", attempt.endpoint, attempt.file_size)
+
+        return f"File too large. Maximum size is {MAX_FILE_SIZE_MB}MB"
+
+    if attempt.file_size == 0:
+        Logger.debug("[%s] Empty file received", attempt.endpoint)
+
+        return "Empty file received"
+
+    return None
+
+
+def validate_upload(attempt: ClassifyAttempt) -> Optional[str]:
+    """Check the extension and size of an upload; returns the error message if it is rejected."""
+
+    return validate_extension(attempt) or validate_size(attempt)
+
+
+async def read_upload(attempt: ClassifyAttempt, request: Request) -> Tuple[Optional[StreamedUpload], Optional[Response]]:
+    """
+    Stream and validate the upload of a request; returns it, or the error response to send instead.
+
+    The extension is checked as soon as the part headers arrive and the size against
+    Content-Length and then every received chunk, so a rejected upload is not read
+    any further.
+    """
 
-        raise ValueError(f"Failed to convert audio file: {str(e)}")
+    upload = StreamedUpload()
+    start = time.perf_counter()
 
+    def check_filename(file_name: Optional[str]) -> Optional[str]:
+        attempt.set_file_name(file_name)
 
-async def load_and_extract_spectrogram(
-    audio_data: BytesIO, n_mels: int = 128, n_fft: int = 1024, hop_length: int = 512
-) -> np.ndarray:
-    """Extract mel spectrogram from audio data."""
-    y, sr = librosa.load(audio_data, sr=None)
+        Logger.debug("[%s] Received file: %s", attempt.endpoint, file_name)
 
-    mel_spec: np.ndarray = librosa.feature.melspectrogram(
-        y=y, sr=sr, n_fft=n_fft, hop_length=hop_length, n_mels=n_mels
+        return validate_extension(attempt)
+
+    try:
+        await upload.receive(request, MAX_FILE_SIZE_BYTES, check_filename)
+        attempt.file_size = upload.size
+        error_msg = validate_size(attempt)
+
+    except UploadTooLargeError as e:
+        attempt.file_size = e.size
+        error_msg = validate_size(attempt)
+
+    except UploadRejectedError as e:
+        attempt.file_size = upload.size
+        error_msg = str(e)
+
+    attempt.timings["upload"] = time.perf_counter() - start
+    stage_seconds.labels("upload").observe(attempt.timings["upload"])
+
+    if error_msg is not None:
+        return None, await attempt.fail(error_msg, ResponseStatusEnum.BAD_REQUEST_400)
+
+    return upload, None
+
+
+async def run_pipeline(attempt: ClassifyAttempt, feature_function, *args) -> Tuple[Optional[tuple], Optional[Response]]:
+    """
+    Run a feature function on the feature backend, then the model on its output.
+
+    The feature function must return the model input first (without the channel axis),
+    optionally followed by extra values that are passed through.
+
+    Returns:
+        (features, prediction), or the error response to send instead
+    """
+
+    try:
+        # Bound the number of requests inside the pipeline; beyond that, shed load with a 503
+        with classify_executor.admit():
+            # Decode and extract spectrogram
+            Logger.debug("[%s] Processing audio file (format: %s)", attempt.endpoint, attempt.file_extension)
+
+            try:
+                # The feature stages are timed where they run, and the timings come back with the result
+                features, timings = await classify_executor.run_features(record_stages, feature_function, *args)
+                observe_stages(timings)
+                attempt.timings.update(timings)
+
+            except ValueError as e:
+                error_msg = str(e)
+
+                Logger.error("[%s] Conversion error: %s", attempt.endpoint, error_msg)
+
+                return None, await attempt.fail(error_msg, ResponseStatusEnum.BAD_REQUEST_400)
+
+            # A single spectrogram becomes a batch of one; a tuple already starts with a batch
+            X = features[0] if isinstance(features, tuple) else features[np.newaxis]
+            X = X[..., np.newaxis]
+
+            # Predict
+            Logger.debug("[%s] Running prediction", attempt.endpoint)
+            try:
+                # Queueing in the micro-batcher and the forward pass, as one stage of this request
+                predicted_at = time.perf_counter()
+                prediction: np.ndarray = await model_batcher.predict(X)
+                attempt.timings["predict"] = time.perf_counter() - predicted_at
+
+            except Exception as e:
+                Logger.error("[%s] Model prediction failed: %s", attempt.endpoint, e)
+
+                return None, await attempt.fail(
+                    "Model prediction failed. Please try again later.", ResponseStatusEnum.INTERNAL_SERVER_ERROR_500
+                )
+
+    except ExecutorSaturatedError as e:
+        Logger.error("[%s] %s", attempt.endpoint, e)
+
+        return None, await attempt.fail("Server is busy. Please try again later.", ResponseStatusEnum.SERVICE_UNAVAILABLE_503)
+
+    return (features, prediction), None
+
+
+class BatchItem:
+    """One file of a batch request, with its outcome once it is known."""
+
+    def __init__(self, attempt: ClassifyAttempt, content: Optional[bytes] = None, error: Optional[str] = None) -> None:
+        self.attempt = attempt
+        self.content = content
+        # Why the content could not be read (an archive member that did not inflate)
+        self.error = error
+        self.result: Optional[dict] = None
+        self.history: Optional[dict] = None
+
+    def fail(self, error_msg: str, status: ResponseStatusEnum) -> None:
+        self.attempt.count(status)
+        self.result = {
+            "fileName": self.attempt.file_name,
+            "success": False,
+            "status": status.value,
+            "message": error_msg,
+            "data": None,
+        }
+        self.history = self.attempt.history_fields(False, error_message=error_msg)
+
+    def succeed(self, data: dict) -> None:
+        self.attempt.count(ResponseStatusEnum.CREATED_201)
+        self.result = {
+            "fileName": self.attempt.file_name,
+            "success": True,
+            "status": ResponseStatusEnum.CREATED_201.value,
+            "message": "Classification successful",
+            "data": data,
+        }
+        self.history = self.attempt.history_fields(
+            True, classification_result=data["isAmbulance"], confidence=data["confidence"]
+        )
+
+
+async def read_batch(endpoint: str, request: Request, files: List[UploadFile]) -> List[BatchItem]:
+    """
+    Read every upload of a batch request, expanding zip and tar archives into their files.
+
+    Invalid files (and unreadable archives or members) become failed items; exceeding the batch
+    limits raises `BatchLimitError`.
+    """
+
+    items: List[BatchItem] = []
+    total_bytes = 0
+
+    for file in files:
+        if is_archive(file.filename):
+            try:
+                members = await asyncio.to_thread(
+                    read_archive,
+                    file.file,
+                    file.filename,
+                    BATCH_MAX_FILES - len(items),
+                    MAX_FILE_SIZE_BYTES,
+                    BATCH_MAX_TOTAL_BYTES - total_bytes,
+                )
+
+            except ArchiveError as e:
+                # An unreadable archive fails on its own, like an undecodable file
+                item = BatchItem(ClassifyAttempt(endpoint, request, file.filename))
+                item.attempt.file_size = file.size or 0
+                item.fail(str(e), ResponseStatusEnum.BAD_REQUEST_400)
+                items.append(item)
+
+                continue
+
+            for member in members:
+                item = BatchItem(
+                    ClassifyAttempt(endpoint, request, f"{file.filename}/{member.name}"), member.content, member.error
+                )
+                item.attempt.file_size = member.size
+                total_bytes += len(member.content or b"")
+                items.append(item)
+
+            continue
+
+        if len(items) >= BATCH_MAX_FILES:
+            raise BatchLimitError(f"Too many files. A batch holds at most {BATCH_MAX_FILES} files")
+
+        item = BatchItem(ClassifyAttempt(endpoint, request, file.filename))
+        item.content = await file.read()
+        item.attempt.file_size = len(item.content)
+        total_bytes += item.attempt.file_size
+
+        if total_bytes > BATCH_MAX_TOTAL_BYTES:
+            raise BatchLimitError(f"Batch too large. Maximum total size is {BATCH_MAX_TOTAL_MB}MB")
+
+        items.append(item)
+
+    for item in items:
+        if item.result is None:
+            error_msg = validate_upload(item.attempt) or item.error
+
+            if error_msg is not None:
+                item.content = None
+                item.fail(error_msg, ResponseStatusEnum.BAD_REQUEST_400)
+
+    return items
+
+
+async def classify_batch_items(endpoint: str, items: List[BatchItem], cache_keys: dict) -> None:
+    """
+    Decode batch items in parallel on the feature backend, then classify them in one forward pass.
+
+    The caller must have admitted the items; each one ends up succeeded or failed.
+    """
+
+    Logger.debug("[%s] Processing %d files", endpoint, len(items))
+
+    features = await asyncio.gather(
+        *(
+            classify_executor.run_features(record_stages, pipeline.extract_features, item.content, item.attempt.file_extension)
+            for item in items
+        ),
+        return_exceptions=True,
     )
-    mel_spec_db: np.ndarray = librosa.power_to_db(mel_spec, ref=np.max)
 
-    return mel_spec_db
+    decoded = []
 
+    for item, result in zip(items, features):
+        if not isinstance(result, BaseException):
+            result, timings = result
+            observe_stages(timings)
 
-def get_file_extension(filename: str) -> str:
-    """Get the file extension from filename."""
-    if not filename:
-        return ""
+        if isinstance(result, ValueError):
+            Logger.error("[%s] Conversion error in %s: %s", endpoint, item.attempt.file_name, result)
 
-    return os.path.splitext(filename)[1].lower()
+            item.fail(str(result), ResponseStatusEnum.BAD_REQUEST_400)
+
+        elif isinstance(result, BaseException):
+            Logger.error("[%s] Error in %s: %s", endpoint, item.attempt.file_name, result)
+
+            item.fail("Internal Server Error. Please try again.", ResponseStatusEnum.INTERNAL_SERVER_ERROR_500)
+
+        else:
+            decoded.append((item, result))
+
+    if not decoded:
+        return
+
+    # One forward pass for the whole wave, bypassing the micro-batcher
+    Logger.debug("[%s] Running prediction on %d files", endpoint, len(decoded))
+
+    X = np.stack([result for _, result in decoded])[..., np.newaxis]
+
+    try:
+        dispatched_at = time.perf_counter()
+        prediction: np.ndarray = await classify_executor.run_inference(pipeline.predict, X)
+        stage_seconds.labels("inference").observe(time.perf_counter() - dispatched_at)
+
+    except Exception as e:
+        Logger.error("[%s] Model prediction failed: %s", endpoint, e)
+
+        for item, _ in decoded:
+            item.fail("Model prediction failed. Please try again later.", ResponseStatusEnum.INTERNAL_SERVER_ERROR_500)
+
+        return
+
+    for (item, _), probabilities in zip(decoded, prediction):
+        index = int(np.argmax(probabilities))
+        confidence = float(probabilities[index])
+        data = {
+            "isAmbulance": index == 0,
+            "confidence": confidence,
+            "confidencePercent": f"{confidence * 100:.1f}%",
+        }
+
+        if id(item) in cache_keys:
+            result_cache.put(cache_keys[id(item)], data)
+
+        item.succeed(data)
 
 
 router: APIRouter = APIRouter(prefix="/classify", tags=["Classify"])
 
 
-@router.post("/")
-async def upload_file(request: Request, file: UploadFile = File(...)):
+@router.post("/", openapi_extra=UPLOAD_REQUEST_BODY)
+async def upload_file(request: Request):
     """
     Classify an audio file to detect ambulance sirens.
 
+    The multipart body is streamed: it must hold the audio file (WAV, MP3, WebM, OGG,
+    M4A) in a `file` field, and is rejected as soon as it breaks a limit.
+
     Args:
-        request: FastAPI Request object (for client IP and headers)
-        file: Audio file to classify (WAV, MP3, WebM, OGG, M4A)
+        request: FastAPI Request object (for the upload, client IP and headers)
 
     Returns:
         Classification result with confidence score
     """
-    
-    start_time = time.time()
-    
-    # Extract client information
-    client_ip = request.client.host if request.client else "unknown"
-    user_agent = request.headers.get("user-agent", "unknown")
-    
+
+    attempt = ClassifyAttempt("/api/classify", request)
+
     try:
-        Logger.debug(f"[/api/classify] Received file: {file.filename}")
-
-        # Get file extension
-        file_extension = get_file_extension(file.filename)
-        
-        # Read file content
-        file_content = await file.read()
-        file_size = len(file_content)
-        
-        # Validate file extension
-        if file_extension not in ALLOWED_EXTENSIONS:
-            Logger.debug(f"[/api/classify] Invalid file extension: {file_extension}")
-            
-            error_msg = f"Invalid file type. Supported formats: WAV, MP3, WebM, OGG, M4A"
-            
-            processing_time = (time.time() - start_time) * 1000
-            
-            HistoryLogger.log_attempt(
-                file_name=file.filename or "unknown",
-                file_size=file_size,
-                audio_format=file_extension,
-                client_ip=client_ip,
-                user_agent=user_agent,
-                success=False,
-                error_message=error_msg,
-                processing_time_ms=processing_time,
-            )
-            
-            return Response[None](
-                success=False,
-                status=ResponseStatusEnum.BAD_REQUEST_400,
-                message=error_msg,
-                data=None,
-            )
+        upload, error = await read_upload(attempt, request)
 
-        # Validate file size
-        if file_size > MAX_FILE_SIZE_BYTES:
-            Logger.debug(f"[/api/classify] File too large: {file_size} bytes")
-            
-            error_msg = f"File too large. Maximum size is {MAX_FILE_SIZE_MB}MB"
-            
-            processing_time = (time.time() - start_time) * 1000
-            
-            HistoryLogger.log_attempt(
-                file_name=file.filename or "unknown",
-                file_size=file_size,
-                audio_format=file_extension,
-                client_ip=client_ip,
-                user_agent=user_agent,
-                success=False,
-                error_message=error_msg,
-                processing_time_ms=processing_time,
-            )
-            
-            return Response[None](
-                success=False,
-                status=ResponseStatusEnum.BAD_REQUEST_400,
-                message=error_msg,
-                data=None,
-            )
+        if error is not None:
+            return error
 
-        if file_size == 0:
-            Logger.debug("[/api/classify] Empty file received")
-            
-            error_msg = "Empty file received"
-            
-            processing_time = (time.time() - start_time) * 1000
-            
-            HistoryLogger.log_attempt(
-                file_name=file.filename or "unknown",
-                file_size=file_size,
-                audio_format=file_extension,
-                client_ip=client_ip,
-                user_agent=user_agent,
-                success=False,
-                error_message=error_msg,
-                processing_time_ms=processing_time,
-            )
-            
-            return Response[None](
-                success=False,
-                status=ResponseStatusEnum.BAD_REQUEST_400,
-                message=error_msg,
-                data=None,
-            )
+        # Uploads seen before under the same model skip decoding and inference, but still count in history
+        cache_key = (
+            result_cache.digest_key(upload.digest(), attempt.file_extension) if result_cache.is_enabled() else None
+        )
+        cached = result_cache.get(cache_key) if cache_key is not None else None
 
-        # Convert to WAV if necessary
-        Logger.debug(f"[/api/classify] Processing audio file (format: {file_extension})")
-        
-        if file_extension != ".wav":
-            Logger.debug(f"[/api/classify] Converting {file_extension} to WAV")
-            try:
-                audio_data = await convert_to_wav(file_content, file_extension)
+        if cached is not None:
+            Logger.debug("[/api/classify] Cache hit, Confidence: %s", cached["confidencePercent"])
 
-            except ValueError as e:
-                error_msg = str(e)
-                
-                Logger.error(f"[/api/classify] Conversion error: {error_msg}")
-                
-                processing_time = (time.time() - start_time) * 1000
-                
-                HistoryLogger.log_attempt(
-                    file_name=file.filename or "unknown",
-                    file_size=file_size,
-                    audio_format=file_extension,
-                    client_ip=client_ip,
-                    user_agent=user_agent,
-                    success=False,
-                    error_message=error_msg,
-                    processing_time_ms=processing_time,
-                )
-                
-                return Response[None](
-                    success=False,
-                    status=ResponseStatusEnum.BAD_REQUEST_400,
-                    message=error_msg,
-                    data=None,
-                )
+            await attempt.succeed(cached["isAmbulance"], cached["confidence"])
 
-        else:
-            audio_data = BytesIO(file_content)
-
-        # Extract spectrogram
-        Logger.debug("[/api/classify] Extracting spectrogram")
-        X = []
-        max_time_steps: int = 128
-        spectrogram: np.ndarray = await load_and_extract_spectrogram(audio_data)
-        
-        if spectrogram.shape[1] < max_time_steps:
-            pad_width: int = max_time_steps - spectrogram.shape[1]
-            spectrogram_padded: np.ndarray = np.pad(
-                spectrogram, ((0, 0), (0, pad_width)), mode="constant"
+            return Response[dict](
+                success=True,
+                status=ResponseStatusEnum.CREATED_201,
+                message="Classification successful",
+                data=cached,
             )
-            
-            X.append(spectrogram_padded)
 
-        else:
-            X.append(spectrogram[:, :max_time_steps])
+        result, error = await run_pipeline(attempt, pipeline.extract_features, upload.chunks, attempt.file_extension)
 
-        X = np.array(X)
-        X = X[..., np.newaxis]
+        if error is not None:
+            return error
 
-        # Predict
-        Logger.debug("[/api/classify] Running prediction")
-        try:
-            model = model_manager.get_model()
-            prediction: np.ndarray = model.predict(X)
-            
-        except Exception as e:
-            error_msg = "Model prediction failed. Please try again later."
-            
-            Logger.error(f"[/api/classify] Model prediction failed: {e}")
-            
-            processing_time = (time.time() - start_time) * 1000
-            
-            HistoryLogger.log_attempt(
-                file_name=file.filename or "unknown",
-                file_size=file_size,
-                audio_format=file_extension,
-                client_ip=client_ip,
-                user_agent=user_agent,
-                success=False,
-                error_message=error_msg,
-                processing_time_ms=processing_time,
-            )
-            
-            return Response[None](
-                success=False,
-                status=ResponseStatusEnum.INTERNAL_SERVER_ERROR_500,
-                message=error_msg,
-                data=None,
-            )
-        
+        _, prediction = result
         indices: np.intp = np.argmax(prediction)
-        
+
         # Get confidence score (probability for the predicted class)
         confidence: float = float(prediction[0][indices])
         confidence_percent: str = f"{confidence * 100:.1f}%"
         is_ambulance: bool = bool(indices == 0)  # Convert numpy bool to Python bool
 
-        Logger.debug(
-            f"[/api/classify] Result: {indices}, {['Ambulance', 'Traffic Noise'][indices]}, Confidence: {confidence_percent}"
-        )
+        Logger.debug("[/api/classify] Result: %s, %s, Confidence: %s", indices, CLASS_NAMES[indices], confidence_percent)
+
+        data = {
+            "isAmbulance": is_ambulance,
+            "confidence": confidence,
+            "confidencePercent": confidence_percent,
+        }
+
+        if cache_key is not None:
+            result_cache.put(cache_key, data)
 
         # Log successful classification
-        processing_time = (time.time() - start_time) * 1000
-        
-        Logger.debug("[/api/classify] Logging successful classification")
-        
-        HistoryLogger.log_attempt(
-            file_name=file.filename or "unknown",
-            file_size=file_size,
-            audio_format=file_extension,
-            client_ip=client_ip,
-            user_agent=user_agent,
+        await attempt.succeed(is_ambulance, confidence)
+
+        # Return response with confidence scores
+        return Response[dict](
             success=True,
-            classification_result=is_ambulance,
-            confidence=confidence,
-            processing_time_ms=processing_time,
+            status=ResponseStatusEnum.CREATED_201,
+            message="Classification successful",
+            data=data,
         )
 
-        # Return response with confidence scores
+    except Exception as e:
+        return await attempt.fail_unexpectedly(e)
+
+
+@router.post("/timeline", openapi_extra=UPLOAD_REQUEST_BODY)
+async def upload_file_timeline(
+    request: Request,
+    window_hop: int = Query(pipeline.MAX_TIME_STEPS // 2, ge=1, le=pipeline.MAX_TIME_STEPS),
+):
+    """
+    Classify a long recording window by window to find where sirens occur.
+
+    The recording is split into overlapping windows of the model's input length,
+    `window_hop` spectrogram frames apart, which are all classified in one batched
+    forward pass. The recording counts as an ambulance if any window does.
+
+    Args:
+        request: FastAPI Request object (for the streamed upload, client IP and headers)
+        window_hop: Distance between consecutive windows, in spectrogram frames
+
+    Returns:
+        Aggregated classification result and a per-window timeline
+    """
+
+    attempt = ClassifyAttempt("/api/classify/timeline", request)
+
+    try:
+        upload, error = await read_upload(attempt, request)
+
+        if error is not None:
+            return error
+
+        result, error = await run_pipeline(
+            attempt, pipeline.extract_windows, upload.chunks, attempt.file_extension, window_hop
+        )
+
+        if error is not None:
+            return error
+
+        (_, starts, ends), prediction = result
+        indices = np.argmax(prediction, axis=1)
+
+        timeline = [
+            {
+                "start": float(start),
+                "end": float(end),
+                "isAmbulance": bool(index == 0),
+                "confidence": float(probabilities[index]),
+            }
+            for start, end, index, probabilities in zip(starts, ends, indices, prediction)
+        ]
+
+        # A siren anywhere in the recording makes it an ambulance recording, so the
+        # verdict follows the window most likely to contain one
+        ambulance_probability = float(prediction[:, 0].max())
+        is_ambulance = ambulance_probability >= 0.5
+        confidence = ambulance_probability if is_ambulance else 1.0 - ambulance_probability
+        confidence_percent = f"{confidence * 100:.1f}%"
+
+        Logger.debug(
+            "[/api/classify/timeline] Result: %s over %d windows, Confidence: %s",
+            CLASS_NAMES[0 if is_ambulance else 1],
+            len(timeline),
+            confidence_percent,
+        )
+
+        await attempt.succeed(is_ambulance, confidence)
+
         return Response[dict](
             success=True,
             status=ResponseStatusEnum.CREATED_201,
@@ -328,29 +622,121 @@ async def upload_file(request: Request, file: UploadFile = File(...)):
                 "isAmbulance": is_ambulance,
                 "confidence": confidence,
                 "confidencePercent": confidence_percent,
+                "ambulanceWindows": sum(1 for window in timeline if window["isAmbulance"]),
+                "timeline": timeline,
             },
         )
 
     except Exception as e:
-        Logger.error(f"[/api/classify] Error: {e}")
-        
-        # Try to log the error attempt with whatever information we have
+        return await attempt.fail_unexpectedly(e)
+
+
+@router.post("/batch")
+async def upload_files_batch(request: Request, files: List[UploadFile] = File(...)):
+    """
+    Classify many audio files in one request.
+
+    Uploads may be audio files or zip / tar archives of them. Every file is decoded
+    on the feature backend in parallel, then all of them go through the model in one
+    batched forward pass. Each file counts as one request against CLASSIFY_MAX_PENDING:
+    when there is room for only part of the batch, it runs in several such waves, and
+    files that find no room fail with 503. Each file gets its own result, so a file
+    that cannot be decoded fails alone; the history entries of the whole batch are
+    written together.
+
+    Args:
+        request: FastAPI Request object (for client IP and headers)
+        files: Audio files (WAV, MP3, WebM, OGG, M4A) and archives (zip, tar, tar.gz, ...)
+
+    Returns:
+        Per-file results, in upload (and archive) order, with success and failure counts
+    """
+
+    endpoint = "/api/classify/batch"
+    received_at = time.perf_counter()
+
+    try:
+        Logger.debug("[%s] Received %d uploads", endpoint, len(files))
+
         try:
-            processing_time = (time.time() - start_time) * 1000
-            
-            HistoryLogger.log_attempt(
-                file_name=file.filename or "unknown",
-                file_size=file.size if hasattr(file, 'size') else 0,
-                audio_format=get_file_extension(file.filename) if file.filename else "unknown",
-                client_ip=client_ip,
-                user_agent=user_agent,
+            items = await read_batch(endpoint, request, files)
+
+        except BatchLimitError as e:
+            Logger.debug("[%s] Rejected batch: %s", endpoint, e)
+
+            return Response[None](
                 success=False,
-                error_message=str(e),
-                processing_time_ms=processing_time,
+                status=ResponseStatusEnum.BAD_REQUEST_400,
+                message=str(e),
+                data=None,
             )
-        
-        except Exception as log_error:
-            Logger.error(f"[/api/classify] Failed to log error: {log_error}")
+
+        # Files seen before under the same model skip decoding and inference; hashing up to
+        # BATCH_MAX_TOTAL_MB of uploads happens in a thread, off the event loop
+        cache_keys = {}
+
+        if result_cache.is_enabled():
+            unresolved = [item for item in items if item.result is None]
+            keys = await asyncio.to_thread(
+                lambda: [result_cache.key(item.content, item.attempt.file_extension) for item in unresolved]
+            )
+
+            for item, key in zip(unresolved, keys):
+                cache_keys[id(item)] = key
+                cached = result_cache.get(key)
+
+                if cached is not None:
+                    item.succeed(cached)
+
+        remaining = [item for item in items if item.result is None]
+
+        # Every file counts against the pending budget: the batch runs in waves of as many
+        # files as there is room for, and what finds no room is answered 503 like a request
+        while remaining:
+            try:
+                with classify_executor.admit(len(remaining), partial=True) as admitted:
+                    wave, remaining = remaining[:admitted], remaining[admitted:]
+
+                    await classify_batch_items(endpoint, wave, cache_keys)
+
+            except ExecutorSaturatedError as e:
+                Logger.error("[%s] %s", endpoint, e)
+
+                for item in remaining:
+                    item.fail("Server is busy. Please try again later.", ResponseStatusEnum.SERVICE_UNAVAILABLE_503)
+
+                break
+
+        await history_writer.log_attempts([item.history for item in items])
+        elapsed = time.perf_counter() - received_at
+        request_seconds.labels(endpoint).observe(elapsed)
+
+        succeeded = sum(1 for item in items if item.result["success"])
+
+        Logger.info(
+            "[%s] Classified %d of %d files",
+            endpoint,
+            succeeded,
+            len(items),
+            files=len(items),
+            succeeded=succeeded,
+            duration_ms=round(elapsed * 1000, 3),
+        )
+
+        return Response[dict](
+            success=True,
+            status=ResponseStatusEnum.CREATED_201,
+            message="Batch classification completed",
+            data={
+                "total": len(items),
+                "succeeded": succeeded,
+                "failed": len(items) - succeeded,
+                "results": [item.result for item in items],
+            },
+        )
+
+    except Exception as e:
+        Logger.error("[%s] Error: %s", endpoint, e)
 
         return Response[None](
             success=False,
@@ -358,3 +744,28 @@ async def upload_file(request: Request, file: UploadFile = File(...)):
             message="Internal Server Error. Please try again.",
             data=None,
         )
+
+
+@router.websocket("/stream")
+async def classify_stream(
+    websocket: WebSocket,
+    format: str = Query("f32le"),
+    sample_rate: int = Query(44100, ge=8000, le=96000),
+    hop: int = Query(pipeline.MAX_TIME_STEPS // 4, ge=1, le=pipeline.MAX_TIME_STEPS),
+):
+    """
+    Classify live audio streamed as binary WebSocket messages.
+
+    Send mono audio chunks in the chosen format, then a text "end" message (or just
+    close the socket). Once enough audio for one model window has arrived, the server
+    sends a "classification" message every `hop` spectrogram frames, with the window's
+    position in the stream and the delay between the audio arriving and its verdict.
+
+    Args:
+        websocket: The client connection
+        format: "f32le" or "s16le" raw PCM, or "webm" / "ogg" Opus streams (e.g. from MediaRecorder)
+        sample_rate: Sample rate of raw PCM streams (resampled to the pipeline rate if it differs)
+        hop: Spectrogram frames between verdicts
+    """
+
+    await StreamSession.serve(websocket, format, sample_rate, hop)
@@ -0,0 +1,324 @@
+"""In-process audio decoding, straight from the upload bytes to a float32 mono array."""
+
+import io
+import math
+import os
+import shutil
+import struct
+import subprocess
+import tempfile
+import threading
+from bisect import bisect_right
+from typing import List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from utilities.logger import Logger
+
+# Formats libsndfile decodes from memory (MP3 needs libsndfile >= 1.1, bundled with soundfile >= 0.12)
+SOUNDFILE_EXTENSIONS = {".wav", ".ogg", ".oga", ".flac", ".mp3"}
+
+# Demuxer names for the formats that go through ffmpeg
+FFMPEG_FORMATS = {
+    ".mp3": "mp3",
+    ".webm": "webm",
+    ".ogg": "ogg",
+    ".oga": "ogg",
+    ".m4a": "mp4",
+    ".mp4": "mp4",
+    ".wav": "wav",
+    ".flac": "flac",
+}
+
+FFMPEG_BINARY = os.getenv("FFMPEG_BINARY", "ffmpeg")
+
+# An upload, either as one bytes object or as the chunks it was received in
+AudioContent = Union[bytes, Sequence[bytes]]
+
+
+class ChunkReader(io.RawIOBase):
+    """Seekable binary file over a list of byte chunks, read without joining them."""
+
+    def __init__(self, chunks: Sequence[bytes]) -> None:
+        self._chunks = [memoryview(chunk) for chunk in chunks if len(chunk)]
+        self._offsets = []
+        self._size = 0
+        self._position = 0
+
+        for chunk in self._chunks:
+            self._offsets.append(self._size)
+            self._size += len(chunk)
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+
+        elif whence == io.SEEK_END:
+            offset += self._size
+
+        self._position = max(0, offset)
+
+        return self._position
+
+    def readinto(self, buffer) -> int:
+        target = memoryview(buffer).cast("B")
+        written = 0
+
+        # Find the chunk holding the current position, then copy forward from it
+        index = max(0, bisect_right(self._offsets, self._position) - 1)
+
+        while written < len(target) and index < len(self._chunks) and self._position < self._size:
+            chunk = self._chunks[index]
+            start = self._position - self._offsets[index]
+            count = min(len(chunk) - start, len(target) - written)
+
+            if count > 0:
+                target[written : written + count] = chunk[start : start + count]
+                written += count
+                self._position += count
+
+            index += 1
+
+        return written
+
+
+def _as_chunks(file_content: AudioContent) -> List[bytes]:
+    if isinstance(file_content, (bytes, bytearray, memoryview)):
+        return [file_content]
+
+    return list(file_content)
+
+
+def decode_audio(
+    file_content: AudioContent,
+    file_extension: str,
+    max_samples: Optional[int] = None,
+    sample_rate: Optional[int] = None,
+) -> Tuple[np.ndarray, int]:
+    """
+    Decode an upload into a float32 mono signal, at `sample_rate` or its native rate.
+
+    Formats supported by libsndfile are decoded in memory with soundfile; everything
+    else (or anything soundfile rejects) is streamed through an ffmpeg pipe. With
+    `max_samples`, decoding stops after that many samples, so the cost no longer
+    depends on the length of the upload. With `sample_rate`, the decoded signal is
+    resampled once, with soxr.
+
+    Args:
+        file_content: Raw bytes of the uploaded file, whole or as the chunks it was received in
+        file_extension: Extension of the uploaded file (e.g., ".mp3")
+        max_samples: Only decode this many samples from the start (None for all), counted at the output rate
+        sample_rate: Rate to resample to (None to keep the native rate)
+
+    Returns:
+        The signal and its sample rate
+
+    Raises:
+        ValueError: If the audio could not be decoded
+    """
+
+    file_extension = file_extension.lower()
+    chunks = _as_chunks(file_content)
+    decoded = None
+
+    if file_extension in SOUNDFILE_EXTENSIONS:
+        try:
+            decoded = _decode_with_soundfile(chunks, max_samples, sample_rate)
+
+        except Exception as e:
+            Logger.debug("[decode_audio] soundfile could not decode %s (%s), falling back to ffmpeg", file_extension, e)
+
+    try:
+        if decoded is None:
+            decoded = _decode_with_ffmpeg(chunks, file_extension, max_samples, sample_rate)
+
+        return _resample(*decoded, max_samples, sample_rate)
+
+    except Exception as e:
+        Logger.error(f"[decode_audio] Error decoding audio: {e}")
+
+        raise ValueError(f"Failed to convert audio file: {str(e)}")
+
+
+def _to_mono(signal: np.ndarray) -> np.ndarray:
+    """Average the channels of a (frames, channels) signal, like `librosa.to_mono`."""
+
+    if signal.shape[1] == 1:
+        return signal[:, 0]
+
+    return signal.mean(axis=1, dtype=np.float32)
+
+
+def _input_samples(max_samples: int, native_rate: int, sample_rate: Optional[int]) -> int:
+    """Native samples to decode for `max_samples` output samples, with enough margin for the resampling filter."""
+
+    if sample_rate is None or sample_rate == native_rate:
+        return max_samples
+
+    return math.ceil(max_samples * native_rate / sample_rate) + max(1024, native_rate // 50)
+
+
+def _resample(
+    signal: np.ndarray, native_rate: int, max_samples: Optional[int], sample_rate: Optional[int]
+) -> Tuple[np.ndarray, int]:
+    if sample_rate is None or sample_rate == native_rate:
+        return signal, native_rate
+
+    import soxr
+
+    resampled = soxr.resample(signal, native_rate, sample_rate)
+
+    return (resampled if max_samples is None else resampled[:max_samples]), sample_rate
+
+
+def _decode_with_soundfile(
+    chunks: List[bytes], max_samples: Optional[int] = None, sample_rate: Optional[int] = None
+) -> Tuple[np.ndarray, int]:
+    import soundfile
+
+    with soundfile.SoundFile(ChunkReader(chunks)) as audio:
+        frames = -1 if max_samples is None else _input_samples(max_samples, audio.samplerate, sample_rate)
+        signal = audio.read(frames=frames, dtype="float32", always_2d=True)
+
+        return _to_mono(signal), audio.samplerate
+
+
+def _needs_seekable_input(chunks: List[bytes], file_extension: str) -> bool:
+    """MP4 files whose index (moov atom) comes after the media data cannot be demuxed from a pipe."""
+
+    if FFMPEG_FORMATS.get(file_extension) != "mp4":
+        return False
+
+    # Walk the top-level boxes: each starts with its 32-bit size (1: a 64-bit size follows) and type
+    reader = ChunkReader(chunks)
+
+    while True:
+        header = reader.read(8)
+
+        if len(header) < 8:
+            return True
+
+        size, kind = struct.unpack(">I4s", header)
+
+        if kind == b"moov":
+            return False
+
+        if kind == b"mdat" or size == 0:
+            return True
+
+        header_size = 8
+
+        if size == 1:
+            large_size = reader.read(8)
+
+            if len(large_size) < 8:
+                return True
+
+            size = struct.unpack(">Q", large_size)[0]
+            header_size = 16
+
+        # A box smaller than its own header is malformed; seeking by it would move back
+        # over boxes already walked (and loop for ever), so let ffmpeg seek instead
+        if size < header_size:
+            return True
+
+        reader.seek(size - header_size, io.SEEK_CUR)
+
+
+def _decode_with_ffmpeg(
+    chunks: List[bytes], file_extension: str, max_samples: Optional[int] = None, sample_rate: Optional[int] = None
+) -> Tuple[np.ndarray, int]:
+    """Decode through ffmpeg, reading the upload from stdin and a float WAV from stdout."""
+
+    if shutil.which(FFMPEG_BINARY) is None:
+        raise RuntimeError(f"{FFMPEG_BINARY} not found")
+
+    command = [FFMPEG_BINARY, "-nostdin", "-hide_banner", "-loglevel", "error"]
+
+    if file_extension in FFMPEG_FORMATS:
+        command += ["-f", FFMPEG_FORMATS[file_extension]]
+
+    # The WAV header carries the native sample rate; ffmpeg downmixes to mono
+    output = ["-vn", "-ac", "1", "-c:a", "pcm_f32le", "-f", "wav", "pipe:1"]
+
+    if max_samples is not None and sample_rate is None:
+        # atrim counts samples at the native rate, and ffmpeg stops decoding once it is done
+        output = ["-af", f"atrim=end_sample={max_samples}"] + output
+
+    elif max_samples is not None:
+        # The native rate is not known up front, so trim by time, with margin for the resampling filter
+        output = ["-af", f"atrim=end={max_samples / sample_rate + 0.05:.6f}"] + output
+
+    if _needs_seekable_input(chunks, file_extension):
+        completed = _run_ffmpeg_seekable(command, output, chunks)
+
+    else:
+        completed = _run_ffmpeg_piped(command + ["-i", "pipe:0"] + output, chunks)
+
+    if completed.returncode != 0 or not completed.stdout:
+        raise RuntimeError(completed.stderr.decode(errors="replace").strip() or "ffmpeg produced no audio")
+
+    return _decode_with_soundfile([completed.stdout])
+
+
+def _run_ffmpeg_piped(command: list, chunks: List[bytes]) -> subprocess.CompletedProcess:
+    """Run ffmpeg with the upload's chunks written to its stdin one by one."""
+
+    with tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=stderr)
+
+        def feed() -> None:
+            try:
+                for chunk in chunks:
+                    process.stdin.write(chunk)
+
+                process.stdin.close()
+
+            # ffmpeg stops reading once it has decoded the samples it needs
+            except (BrokenPipeError, OSError):
+                pass
+
+        writer = threading.Thread(target=feed, daemon=True)
+        writer.start()
+
+        stdout = process.stdout.read()
+        process.stdout.close()
+        returncode = process.wait()
+        writer.join()
+
+        stderr.seek(0)
+
+        return subprocess.CompletedProcess(command, returncode, stdout, stderr.read())
+
+
+def _run_ffmpeg_seekable(command: list, output: list, chunks: List[bytes]) -> subprocess.CompletedProcess:
+    """Give ffmpeg a seekable in-memory file (memfd), or a temporary file where memfd is unavailable."""
+
+    if hasattr(os, "memfd_create"):
+        fd = os.memfd_create("upload")
+
+        try:
+            with os.fdopen(fd, "wb", closefd=False) as memory_file:
+                memory_file.writelines(chunks)
+
+            return subprocess.run(
+                command + ["-i", f"/dev/fd/{fd}"] + output, pass_fds=(fd,), capture_output=True
+            )
+
+        finally:
+            os.close(fd)
+
+    with tempfile.NamedTemporaryFile() as temp_input:
+        temp_input.writelines(chunks)
+        temp_input.flush()
+
+        return subprocess.run(command + ["-i", temp_input.name] + output, capture_output=True)
@@ -0,0 +1,217 @@
+"""Execution backends that keep the classify pipeline's CPU work off the event loop."""
+
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+
+from models.classify import pipeline
+from utilities.logger import Logger
+
+BACKENDS = {"inline", "thread", "process", "remote"}
+
+
+class ExecutorSaturatedError(Exception):
+    """Raised when the executor already holds its maximum number of pending requests."""
+
+
+class ClassifyExecutor:
+    """Runs the feature stage (decode + spectrogram) and the inference stage in worker pools.
+
+    Each stage has its own backend: "process" (a spawned process pool), "thread"
+    (a thread pool), "remote" (the model process shared by every API worker, see
+    `serve.py`) or "inline" (run directly on the event loop, as before). Workers
+    are warmed up when they start, so inference workers load their model through
+    `ModelManager` before the first request reaches them. At most `max_pending`
+    requests (each file of a batch request counting as one) are admitted at once;
+    beyond that `admit` raises `ExecutorSaturatedError` so the handler can answer
+    503 instead of queueing without bound.
+    """
+
+    def __init__(
+        self,
+        feature_backend: str = "process",
+        inference_backend: str = "thread",
+        feature_workers: Optional[int] = None,
+        inference_workers: int = 1,
+        max_pending: int = 64,
+    ) -> None:
+        for backend in (feature_backend, inference_backend):
+            if backend not in BACKENDS:
+                raise ValueError(f"Invalid execution backend: {backend} (expected one of {BACKENDS})")
+
+        self.feature_backend = feature_backend
+        self.inference_backend = inference_backend
+        self.feature_workers = feature_workers or os.cpu_count() or 1
+        self.inference_workers = inference_workers
+        self.max_pending = max_pending
+
+        self._feature_pool: Optional[Executor] = None
+        self._inference_pool: Optional[Executor] = None
+        self._pending = 0
+
+    @staticmethod
+    def _create_pool(backend: str, workers: int, initializer: Callable[[], None]) -> Optional[Executor]:
+        if backend == "thread":
+            return ThreadPoolExecutor(max_workers=workers, initializer=initializer)
+
+        if backend == "remote":
+            # The model process warms itself up, so the initializer is not needed here
+            from models.classify.inference_server import INFERENCE_SERVER_ADDRESS, INFERENCE_SERVER_AUTHKEY, RemoteExecutor
+
+            return RemoteExecutor(INFERENCE_SERVER_ADDRESS, INFERENCE_SERVER_AUTHKEY, max_workers=workers)
+
+        if backend == "process":
+            # Spawn rather than fork: TensorFlow and numba are not fork-safe once initialised
+            return ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn"), initializer=initializer
+            )
+
+        return None
+
+    async def start(self) -> None:
+        """Create the worker pools and wait until every worker has warmed up."""
+
+        self._feature_pool = self._create_pool(
+            self.feature_backend, self.feature_workers, pipeline.warm_feature_worker
+        )
+        self._inference_pool = self._create_pool(
+            self.inference_backend, self.inference_workers, pipeline.warm_inference_worker
+        )
+
+        loop = asyncio.get_running_loop()
+        warmups = []
+        stages = (
+            (self._feature_pool, self.feature_workers, pipeline.warm_feature_worker),
+            (self._inference_pool, self.inference_workers, pipeline.warm_inference_worker),
+        )
+
+        for pool, workers, initializer in stages:
+            # Submitting one no-op per worker makes the pools start (and warm) all of their workers now
+            if pool is not None:
+                warmups.extend(loop.run_in_executor(pool, _noop) for _ in range(workers))
+
+            # Inline stages run in this process, so it is the one to warm up (off the event loop)
+            else:
+                warmups.append(asyncio.to_thread(initializer))
+
+        await asyncio.gather(*warmups)
+
+        Logger.info(
+            f"[ClassifyExecutor] Started (features: {self.feature_backend} x{self.feature_workers}, "
+            f"inference: {self.inference_backend} x{self.inference_workers}, max pending: {self.max_pending})"
+        )
+
+    def shutdown(self) -> None:
+        """Shut the worker pools down."""
+
+        for pool in (self._feature_pool, self._inference_pool):
+            if pool is not None:
+                pool.shutdown(wait=True, cancel_futures=True)
+
+        self._feature_pool = None
+        self._inference_pool = None
+
+        Logger.info("[ClassifyExecutor] Stopped")
+
+    def pending(self) -> int:
+        """Number of requests currently admitted."""
+
+        return self._pending
+
+    @contextmanager
+    def admit(self, count: int = 1, partial: bool = False) -> Iterator[int]:
+        """
+        Admit `count` files (one request by default) into the pipeline.
+
+        Args:
+            count: Number of files to admit, each counting as one pending request
+            partial: Admit as many of them as there is room for (at least one) instead of all or none
+
+        Yields:
+            The number of files admitted
+
+        Raises:
+            ExecutorSaturatedError: If there is no room for them
+        """
+
+        available = self.max_pending - self._pending
+        admitted = min(count, available) if partial else count
+
+        if admitted < 1 or admitted > available:
+            raise ExecutorSaturatedError(f"Classify pipeline saturated ({self._pending} pending requests)")
+
+        self._pending += admitted
+
+        try:
+            yield admitted
+
+        finally:
+            self._pending -= admitted
+
+    async def _run(self, pool: Optional[Executor], function: Callable, *args):
+        if pool is None:
+            return function(*args)
+
+        return await asyncio.get_running_loop().run_in_executor(pool, function, *args)
+
+    def _replace_pool(self, broken: Executor, backend: str, workers: int, initializer: Callable[[], None]) -> Optional[Executor]:
+        """Release a broken pool (its management thread and dead workers) and create its replacement."""
+
+        broken.shutdown(wait=False, cancel_futures=True)
+
+        return self._create_pool(backend, workers, initializer)
+
+    async def run_features(self, function: Callable, *args):
+        """Run a feature-stage function on the feature backend."""
+
+        pool = self._feature_pool
+
+        try:
+            return await self._run(pool, function, *args)
+
+        except BrokenProcessPool:
+            # Every request in flight fails with the pool; only the first one replaces it
+            if self._feature_pool is pool:
+                Logger.error("[ClassifyExecutor] Feature worker pool broke, restarting it")
+
+                self._feature_pool = self._replace_pool(
+                    pool, self.feature_backend, self.feature_workers, pipeline.warm_feature_worker
+                )
+
+            raise
+
+    async def run_inference(self, function: Callable, *args):
+        """Run an inference-stage function on the inference backend."""
+
+        pool = self._inference_pool
+
+        try:
+            return await self._run(pool, function, *args)
+
+        except BrokenProcessPool:
+            if self._inference_pool is pool:
+                Logger.error("[ClassifyExecutor] Inference worker pool broke, restarting it")
+
+                self._inference_pool = self._replace_pool(
+                    pool, self.inference_backend, self.inference_workers, pipeline.warm_inference_worker
+                )
+
+            raise
+
+
+def _noop() -> None:
+    pass
+
+
+# Global classify executor instance
+classify_executor = ClassifyExecutor(
+    feature_backend=os.getenv("CLASSIFY_FEATURE_BACKEND", "process"),
+    inference_backend=os.getenv("CLASSIFY_INFERENCE_BACKEND", "thread"),
+    feature_workers=int(os.getenv("CLASSIFY_FEATURE_WORKERS", "0")) or None,
+    inference_workers=int(os.getenv("CLASSIFY_INFERENCE_WORKERS", "1")),
+    max_pending=int(os.getenv("CLASSIFY_MAX_PENDING", "64")),
+)
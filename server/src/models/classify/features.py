@@ -0,0 +1,145 @@
+"""Mel spectrogram features with precomputed filterbanks and vectorised FFTs."""
+
+from functools import lru_cache
+from typing import Optional, Sequence
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Silence floor and dynamic range of `librosa.power_to_db`
+AMIN = 1e-10
+TOP_DB = 80.0
+
+
+class FeatureExtractor:
+    """Mel spectrograms matching `librosa.feature.melspectrogram` followed by `librosa.power_to_db(ref=np.max)`.
+
+    librosa rebuilds the window and mel filterbank and allocates several float64
+    intermediates on every call. Here both are built once per configuration (see
+    `get_feature_extractor`), the STFT of all of a clip's frames is a single float32
+    FFT call and the mel projection a single matrix product. Frames are centred with
+    zero padding, like librosa's defaults.
+    """
+
+    def __init__(self, sample_rate: int, n_fft: int, hop_length: int, n_mels: int) -> None:
+        import librosa
+        import scipy.fft
+
+        self.sample_rate = sample_rate
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.n_mels = n_mels
+
+        self.mel_basis: np.ndarray = librosa.filters.mel(sr=sample_rate, n_fft=n_fft, n_mels=n_mels).astype(np.float32)
+        self.window: np.ndarray = (0.5 - 0.5 * np.cos(2 * np.pi * np.arange(n_fft) / n_fft)).astype(np.float32)
+
+        # scipy's pocketfft has a native float32 path, several times faster than numpy.fft's
+        self._rfft = scipy.fft.rfft
+
+    def n_frames(self, n_samples: int) -> int:
+        """Number of centred frames in a signal of `n_samples` samples."""
+
+        return 1 + n_samples // self.hop_length
+
+    def frames(self, y: np.ndarray) -> np.ndarray:
+        """Centred frames of a signal as a strided view, shaped (n_frames, n_fft)."""
+
+        padded = np.pad(y.astype(np.float32, copy=False), self.n_fft // 2)
+
+        return sliding_window_view(padded, self.n_fft)[:: self.hop_length]
+
+    def mel_frames(self, frames: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Mel power spectrum of frames shaped (..., n_frames, n_fft).
+
+        Returns:
+            The mel power, shaped (..., n_mels, n_frames)
+        """
+
+        spectrum = self._rfft(frames * self.window, axis=-1)
+        power = np.square(spectrum.real)
+        power += np.square(spectrum.imag)
+
+        return np.matmul(self.mel_basis, np.swapaxes(power, -1, -2), out=out)
+
+    def melspectrogram(self, y: np.ndarray, max_frames: Optional[int] = None) -> np.ndarray:
+        """Mel power spectrogram of a signal, shaped (n_mels, n_frames), optionally only its first frames."""
+
+        frames = self.frames(y)
+
+        if max_frames is not None:
+            frames = frames[:max_frames]
+
+        return self.mel_frames(frames)
+
+    @staticmethod
+    def power_to_db(S: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Convert mel power to dB relative to its loudest bin, floored `TOP_DB` below it.
+
+        Each (n_mels, n_frames) item of a batch is normalised on its own. Pass `out=S`
+        to convert in place.
+        """
+
+        out = np.maximum(S, AMIN, out=out)
+        np.log10(out, out=out)
+        out *= 10.0
+        out -= out.max(axis=(-2, -1), keepdims=True)
+
+        return np.maximum(out, -TOP_DB, out=out)
+
+    def spectrogram(self, y: np.ndarray, max_frames: Optional[int] = None) -> np.ndarray:
+        """Mel spectrogram in dB of a signal, like `extract_spectrogram`."""
+
+        mel = self.melspectrogram(y, max_frames)
+
+        return self.power_to_db(mel, out=mel)
+
+    def batch(self, signals: Sequence[np.ndarray], max_time_steps: int, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Model inputs for many clips at once, written into one float32 buffer.
+
+        Each clip's frames are transformed straight from a strided view of its signal
+        into its slice of the buffer, and the dB conversion runs once over the whole
+        batch. (Stacking every clip's frames into a single FFT call is slower: the
+        intermediates of a full batch no longer fit in cache.)
+
+        Item i equals `pad_spectrogram(spectrogram(signals[i], max_time_steps))`: only
+        the first `max_time_steps` frames count, and clips with fewer frames are
+        zero-padded after the dB conversion.
+
+        Args:
+            signals: Mono signals at this extractor's sample rate
+            max_time_steps: Frames per model input
+            out: Optional float32 buffer shaped (len(signals), n_mels, max_time_steps)
+
+        Returns:
+            The spectrograms, shaped (len(signals), n_mels, max_time_steps)
+        """
+
+        if out is None:
+            out = np.empty((len(signals), self.n_mels, max_time_steps), dtype=np.float32)
+
+        counts = []
+
+        for i, y in enumerate(signals):
+            frames = self.frames(y)[:max_time_steps]
+            self.mel_frames(frames, out=out[i, :, : len(frames)])
+            counts.append(len(frames))
+
+            # Missing frames get zero power, which never raises a clip's peak
+            out[i, :, len(frames) :] = 0.0
+
+        self.power_to_db(out, out=out)
+
+        for i, count in enumerate(counts):
+            out[i, :, count:] = 0.0
+
+        return out
+
+
+@lru_cache(maxsize=16)
+def get_feature_extractor(sample_rate: int, n_fft: int, hop_length: int, n_mels: int) -> FeatureExtractor:
+    """The shared extractor for a configuration, built on first use."""
+
+    return FeatureExtractor(sample_rate, n_fft, hop_length, n_mels)
@@ -0,0 +1,138 @@
+"""A single model process shared by every API worker process."""
+
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from multiprocessing.managers import BaseManager
+from typing import Callable, Optional
+
+from utilities.logger import Logger
+
+INFERENCE_SERVER_ADDRESS = os.getenv("INFERENCE_SERVER_ADDRESS", "")
+INFERENCE_SERVER_AUTHKEY = os.getenv("INFERENCE_SERVER_AUTHKEY", "")
+INFERENCE_SERVER_CONNECT_TIMEOUT_S = float(os.getenv("INFERENCE_SERVER_CONNECT_TIMEOUT_S", "300"))
+
+
+class InferenceService:
+    """Runs inference-stage functions (`pipeline.predict`, `pipeline.model_status`, ...) in the model process."""
+
+    def run(self, function: Callable, args: tuple):
+        return function(*args)
+
+
+# Served object, created once in the model process
+_service: Optional[InferenceService] = None
+
+
+def _get_service() -> InferenceService:
+    return _service
+
+
+class InferenceManager(BaseManager):
+    """Connects API workers to the model process over a Unix socket."""
+
+
+InferenceManager.register("get_service", callable=_get_service)
+
+
+def serve(address: str, authkey: str) -> None:
+    """
+    Entry point of the model process: load the model, then answer inference calls until killed.
+
+    Args:
+        address: Path of the Unix socket to listen on
+        authkey: Shared secret the API workers authenticate with
+    """
+
+    global _service
+
+    from models.classify import pipeline
+
+    pipeline.warm_inference_worker()
+    _service = InferenceService()
+
+    if os.path.exists(address):
+        os.unlink(address)
+
+    server = InferenceManager(address=address, authkey=authkey.encode()).get_server()
+
+    Logger.info(f"[InferenceServer] Serving the model on {address}")
+
+    server.serve_forever()
+
+
+def start_inference_server(address: str, authkey: str) -> multiprocessing.Process:
+    """Start the model process. It is spawned, not forked, so it gets a clean TensorFlow runtime."""
+
+    process = multiprocessing.get_context("spawn").Process(
+        target=serve, args=(address, authkey), name="inference-server", daemon=True
+    )
+    process.start()
+
+    return process
+
+
+class RemoteExecutor(Executor):
+    """Executor that runs every submitted call in the model process.
+
+    Each of its threads keeps its own connection to the server, so up to `max_workers`
+    calls from this API worker are in flight at once. Connections are retried until
+    `INFERENCE_SERVER_CONNECT_TIMEOUT_S` elapses, which covers the server still loading
+    its model (or being restarted after a crash) when the first call is made.
+    """
+
+    def __init__(self, address: str, authkey: str, max_workers: int = 1) -> None:
+        if not address or not authkey:
+            raise ValueError("The remote backend needs INFERENCE_SERVER_ADDRESS and INFERENCE_SERVER_AUTHKEY")
+
+        self._address = address
+        self._authkey = authkey.encode()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="inference-client")
+        self._local = threading.local()
+
+    def _service(self):
+        service = getattr(self._local, "service", None)
+
+        if service is not None:
+            return service
+
+        deadline = time.monotonic() + INFERENCE_SERVER_CONNECT_TIMEOUT_S
+
+        while True:
+            try:
+                manager = InferenceManager(address=self._address, authkey=self._authkey)
+                manager.connect()
+                break
+
+            except (FileNotFoundError, ConnectionRefusedError):
+                if time.monotonic() > deadline:
+                    raise
+
+                time.sleep(0.2)
+
+        self._local.service = manager.get_service()
+
+        return self._local.service
+
+    def _call(self, function: Callable, args: tuple):
+        try:
+            return self._service().run(function, args)
+
+        except (EOFError, ConnectionError):
+            # The model process went away; reconnect on the next call
+            self._local.service = None
+
+            Logger.error("[RemoteExecutor] Lost the connection to the inference server")
+
+            raise
+
+    def submit(self, fn: Callable, /, *args, **kwargs) -> Future:
+        if kwargs:
+            raise TypeError("RemoteExecutor does not support keyword arguments")
+
+        return self._pool.submit(self._call, fn, args)
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False) -> None:
+        self._pool.shutdown(wait=wait, cancel_futures=cancel_futures)
@@ -0,0 +1,72 @@
+"""Metrics of the classify pipeline, exposed on /metrics."""
+
+from typing import Dict
+
+from models.classify.executor import ClassifyExecutor
+from utilities.metrics import metrics_registry
+
+# Seconds, from a cached hit's sub-millisecond stages to a long recording's decode
+STAGE_BUCKETS = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+# Label values for the HTTP status of an outcome
+OUTCOMES = {201: "success", 400: "rejected", 500: "error", 503: "busy"}
+
+# Stages of a request, in pipeline order:
+#   upload     streaming the body in and validating it
+#   decode     decoding (and resampling) the audio
+#   features   mel spectrogram and dB conversion
+#   pad        padding or truncating to the model's time steps
+#   queue      waiting in the micro-batcher for a forward pass
+#   inference  the batched forward pass (including the trip to an inference worker)
+stage_seconds = metrics_registry.histogram(
+    "classify_stage_duration_seconds", "Time spent in each stage of the classify pipeline", STAGE_BUCKETS, ("stage",)
+)
+
+request_seconds = metrics_registry.histogram(
+    "classify_request_duration_seconds", "Time from receiving a classify request to its outcome", STAGE_BUCKETS, ("endpoint",)
+)
+
+requests_total = metrics_registry.counter(
+    "classify_requests_total", "Classified files by endpoint, outcome and audio format", ("endpoint", "outcome", "format")
+)
+
+
+def observe_stages(timings: Dict[str, float]) -> None:
+    """Record the stage timings brought back by `record_stages`."""
+
+    for name, seconds in timings.items():
+        stage_seconds.labels(name).observe(seconds)
+
+
+def register_pipeline_metrics(executor: ClassifyExecutor, batcher, cache, streams, model_loaded) -> None:
+    """Expose the state the pipeline components already keep, read when /metrics is scraped."""
+
+    metrics_registry.gauge(
+        "classify_pending_requests", "Requests admitted into the classify pipeline", function=executor.pending
+    )
+    metrics_registry.gauge(
+        "classify_batcher_queue_depth", "Requests waiting in the micro-batcher", function=batcher.queue_depth
+    )
+    metrics_registry.gauge(
+        "classify_stream_sessions", "Open WebSocket classification streams", function=lambda: streams.active
+    )
+    metrics_registry.gauge(
+        "classify_model_loaded", "Whether the model is loaded and warmed up (1) or not (0)", function=lambda: int(model_loaded())
+    )
+    metrics_registry.counter(
+        "classify_cache_requests_total",
+        "Result cache lookups by result",
+        ("result",),
+        function=lambda: {("hit",): cache.hits, ("miss",): cache.misses},
+    )
+    metrics_registry.counter(
+        "classify_cache_evictions_total", "Results evicted from the result cache", function=lambda: cache.evictions
+    )
+    metrics_registry.gauge(
+        "classify_cache_entries", "Results held by the result cache", function=lambda: cache.stats()["entries"]
+    )
+    metrics_registry.histogram(
+        "classify_inference_batch_size",
+        "Samples per forward pass of the micro-batcher",
+        function=lambda: batcher.batch_size_histogram,
+    )
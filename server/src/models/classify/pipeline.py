@@ -0,0 +1,207 @@
+"""CPU-bound steps of the classify pipeline.
+
+These are plain (synchronous, picklable) functions so they can run in a thread or
+process pool through `ClassifyExecutor` instead of on the event loop. The audio
+libraries are imported inside the functions that use them, so importing the server
+stays cheap and the cost lands in the warmed-up workers instead.
+"""
+
+import os
+from io import BytesIO
+from typing import Optional, Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from model_manager import model_manager
+from models.classify.decoder import AudioContent, decode_audio
+from models.classify.features import AMIN, TOP_DB, get_feature_extractor
+from utilities.logger import Logger
+from utilities.metrics import stage
+
+N_MELS = 128
+N_FFT = 1024
+HOP_LENGTH = 512
+MAX_TIME_STEPS = 128
+
+# Every upload is resampled to this rate while decoding, so the model's 128 frames always
+# span the same time and cost the same to compute. 44.1 kHz is the rate of the training
+# clips cut by model/src/cut.py; 0 keeps each upload's native rate.
+SAMPLE_RATE: Optional[int] = int(os.getenv("CLASSIFY_SAMPLE_RATE", "44100")) or None
+
+
+def required_samples(
+    n_fft: int = N_FFT, hop_length: int = HOP_LENGTH, max_time_steps: int = MAX_TIME_STEPS
+) -> int:
+    """
+    Number of leading samples that determine the first `max_time_steps` STFT frames.
+
+    Frames are centred: frame t covers samples [t * hop_length - n_fft // 2, t * hop_length + n_fft // 2),
+    so the last frame the model consumes ends at (max_time_steps - 1) * hop_length + n_fft // 2.
+    """
+
+    return (max_time_steps - 1) * hop_length + n_fft // 2
+
+
+def extract_spectrogram(
+    y: np.ndarray,
+    sr: int,
+    n_mels: int = N_MELS,
+    n_fft: int = N_FFT,
+    hop_length: int = HOP_LENGTH,
+    max_time_steps: Optional[int] = None,
+) -> np.ndarray:
+    """Extract mel spectrogram (in dB relative to its loudest bin) from a decoded signal."""
+
+    # Only the frames the model consumes are computed and take part in the dB reference
+    return get_feature_extractor(sr, n_fft, hop_length, n_mels).spectrogram(y, max_time_steps)
+
+
+def pad_spectrogram(spectrogram: np.ndarray, max_time_steps: int = MAX_TIME_STEPS) -> np.ndarray:
+    """Pad or truncate the spectrogram to `max_time_steps` frames."""
+
+    if spectrogram.shape[1] < max_time_steps:
+        pad_width: int = max_time_steps - spectrogram.shape[1]
+
+        return np.pad(spectrogram, ((0, 0), (0, pad_width)), mode="constant")
+
+    return spectrogram[:, :max_time_steps]
+
+
+def extract_features(
+    file_content: AudioContent, file_extension: str, sample_rate: Optional[int] = SAMPLE_RATE
+) -> np.ndarray:
+    """
+    Decode an upload and turn it into a model input.
+
+    Args:
+        file_content: Raw bytes of the uploaded file, whole or in chunks
+        file_extension: Extension of the uploaded file (e.g., ".mp3")
+        sample_rate: Rate to resample to while decoding (None for the native rate)
+
+    Returns:
+        The padded spectrogram, shaped (n_mels, max_time_steps)
+
+    Raises:
+        ValueError: If the audio could not be decoded
+    """
+
+    # Only decode and transform the prefix the model looks at
+    with stage("decode"):
+        y, sr = decode_audio(file_content, file_extension, max_samples=required_samples(), sample_rate=sample_rate)
+
+    with stage("features"):
+        spectrogram = extract_spectrogram(y, sr, max_time_steps=MAX_TIME_STEPS)
+
+    with stage("pad"):
+        return pad_spectrogram(spectrogram)
+
+
+def extract_windows(
+    file_content: AudioContent,
+    file_extension: str,
+    window_hop: int = MAX_TIME_STEPS // 2,
+    sample_rate: Optional[int] = SAMPLE_RATE,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Decode a whole recording and cut it into overlapping model inputs.
+
+    The mel spectrogram is computed once over the full signal. Windows of
+    `MAX_TIME_STEPS` frames, `window_hop` frames apart (and a last one ending on the
+    last frame, when the hop does not end there), are cut from it, and each is
+    normalised against its own loudest bin exactly as `extract_features` does for a
+    single clip, so the cost grows linearly with the length of the recording.
+
+    Args:
+        file_content: Raw bytes of the uploaded file, whole or in chunks
+        file_extension: Extension of the uploaded file (e.g., ".mp3")
+        window_hop: Distance between the starts of consecutive windows, in frames
+        sample_rate: Rate to resample to while decoding (None for the native rate)
+
+    Returns:
+        The windows shaped (n_windows, n_mels, max_time_steps), and the start and end
+        time of each window in seconds
+
+    Raises:
+        ValueError: If the audio could not be decoded
+    """
+    with stage("decode"):
+        y, sr = decode_audio(file_content, file_extension, sample_rate=sample_rate)
+
+    duration = len(y) / sr
+
+    with stage("features"):
+        extractor = get_feature_extractor(sr, N_FFT, HOP_LENGTH, N_MELS)
+        mel_spec = extractor.melspectrogram(y)
+
+    if mel_spec.shape[1] <= MAX_TIME_STEPS:
+        with stage("pad"):
+            spectrogram = pad_spectrogram(extractor.power_to_db(mel_spec, out=mel_spec))
+
+        return spectrogram[np.newaxis], np.zeros(1), np.array([duration])
+
+    # Windows every `window_hop` frames, plus one ending on the last frame when the hop does
+    # not land there, so the end of the recording is always classified
+    last_start = mel_spec.shape[1] - MAX_TIME_STEPS
+    start_frames = np.arange(0, last_start + 1, window_hop)
+
+    if start_frames[-1] != last_start:
+        start_frames = np.append(start_frames, last_start)
+
+    # The dB conversion of each window is its log power minus its peak, floored at -TOP_DB,
+    # so the logarithm is taken once for the whole recording
+    with stage("features"):
+        log_mel = np.log10(np.maximum(mel_spec, AMIN, out=mel_spec), out=mel_spec)
+        log_mel *= 10.0
+        # Indexing copies the windows once; the normalisation then works in place on the copy
+        normalised = sliding_window_view(log_mel, MAX_TIME_STEPS, axis=1)[:, start_frames].transpose(1, 0, 2)
+        normalised -= normalised.max(axis=(1, 2))[:, np.newaxis, np.newaxis]
+        np.maximum(normalised, -TOP_DB, out=normalised)
+
+    starts = start_frames * HOP_LENGTH / sr
+    ends = np.minimum(starts + MAX_TIME_STEPS * HOP_LENGTH / sr, duration)
+
+    return normalised, starts, ends
+
+
+def predict(X: np.ndarray) -> np.ndarray:
+    """Run the model on a batch of spectrograms shaped (batch, n_mels, max_time_steps, 1)."""
+
+    return model_manager.predict(X)
+
+
+def warm_feature_worker() -> None:
+    """Pay the librosa import and filterbank construction cost before the first request."""
+
+    decode_audio(_silent_wav(sr=48000), ".wav", sample_rate=SAMPLE_RATE)
+    extract_spectrogram(np.zeros(22050, dtype=np.float32), SAMPLE_RATE or 44100)
+
+
+def warm_inference_worker() -> None:
+    """Load and warm up this worker's model through ModelManager."""
+
+    try:
+        model_manager.load_model()
+
+    except Exception as e:
+        Logger.error(f"[warm_inference_worker] Failed to warm model: {e}")
+
+
+def model_status() -> dict:
+    """Report whether this worker's model is loaded, with its version and startup timings."""
+
+    return {
+        "is_loaded": model_manager.is_model_loaded(),
+        "version": model_manager.get_model_version(),
+        "backend": model_manager.get_backend(),
+        "timings_ms": model_manager.get_startup_timings(),
+    }
+
+
+def _silent_wav(duration_s: float = 0.5, sr: int = 44100) -> bytes:
+    import soundfile
+
+    buffer = BytesIO()
+    soundfile.write(buffer, np.zeros(int(duration_s * sr), dtype=np.float32), sr, format="WAV")
+
+    return buffer.getvalue()
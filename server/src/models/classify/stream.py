@@ -0,0 +1,431 @@
+"""Live classification of audio streamed over a WebSocket.
+
+Audio arrives in small chunks, either as raw PCM or as a WebM/Ogg Opus stream
+(what `MediaRecorder` produces), which is decoded by a long-running ffmpeg process.
+Only the STFT frames the new samples complete are computed, into a fixed ring of mel
+frames, and a verdict on the latest model window is emitted every `hop` frames.
+"""
+
+import asyncio
+import os
+import shutil
+import time
+from typing import Optional
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from starlette.websockets import WebSocket, WebSocketDisconnect
+
+from models.classify import pipeline
+from models.classify.batcher import model_batcher
+from models.classify.decoder import FFMPEG_BINARY
+from models.classify.executor import ExecutorSaturatedError, classify_executor
+from models.classify.features import FeatureExtractor, get_feature_extractor
+from utilities.logger import Logger
+
+# Caps on concurrent streams and on what a single stream can hold in memory
+STREAM_MAX_CONNECTIONS = int(os.getenv("STREAM_MAX_CONNECTIONS", "32"))
+STREAM_MAX_MESSAGE_BYTES = int(os.getenv("STREAM_MAX_MESSAGE_BYTES", str(256 * 1024)))
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", "32"))
+STREAM_IDLE_TIMEOUT_S = float(os.getenv("STREAM_IDLE_TIMEOUT_S", "30"))
+
+# Raw sample formats, and the container formats decoded through ffmpeg
+PCM_FORMATS = {"f32le": np.dtype("<f4"), "s16le": np.dtype("<i2")}
+CONTAINER_FORMATS = {"webm": "webm", "ogg": "ogg"}
+
+# WebSocket close codes (RFC 6455)
+CLOSE_NORMAL = 1000
+CLOSE_UNSUPPORTED_DATA = 1003
+CLOSE_MESSAGE_TOO_BIG = 1009
+CLOSE_INTERNAL_ERROR = 1011
+CLOSE_TRY_AGAIN_LATER = 1013
+
+
+class StreamingSpectrogram:
+    """Mel spectrogram of an unbounded signal, computed incrementally.
+
+    Frames line up with `librosa.feature.melspectrogram(center=True)` on the whole
+    signal: the stream is prefixed with the same `n_fft // 2` zeros of centre padding,
+    and each frame is computed once, as soon as its last sample arrives. Only the
+    latest `max_time_steps` mel frames are kept.
+    """
+
+    def __init__(
+        self,
+        sample_rate: int,
+        n_mels: int = pipeline.N_MELS,
+        n_fft: int = pipeline.N_FFT,
+        hop_length: int = pipeline.HOP_LENGTH,
+        max_time_steps: int = pipeline.MAX_TIME_STEPS,
+    ) -> None:
+        self.sample_rate = sample_rate
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.max_time_steps = max_time_steps
+
+        self.frame_count = 0
+
+        self._extractor = get_feature_extractor(sample_rate, n_fft, hop_length, n_mels)
+        self._samples = np.zeros(n_fft // 2, dtype=np.float32)
+        self._frames = np.zeros((n_mels, max_time_steps), dtype=np.float32)
+
+    def push(self, samples: np.ndarray) -> int:
+        """Append samples and compute the frames they complete; returns how many there were."""
+
+        buffer = np.concatenate([self._samples, samples.astype(np.float32, copy=False)])
+
+        if len(buffer) < self.n_fft:
+            self._samples = buffer
+
+            return 0
+
+        n_new = 1 + (len(buffer) - self.n_fft) // self.hop_length
+        # Frames older than the ring would be overwritten anyway
+        n_skip = max(0, n_new - self.max_time_steps)
+        frames = sliding_window_view(buffer, self.n_fft)[n_skip * self.hop_length :: self.hop_length][: n_new - n_skip]
+
+        mel = self._extractor.mel_frames(frames)
+
+        positions = (self.frame_count + n_skip + np.arange(n_new - n_skip)) % self.max_time_steps
+        self._frames[:, positions] = mel
+
+        self.frame_count += n_new
+        self._samples = buffer[n_new * self.hop_length :].copy()
+
+        return n_new
+
+    def window(self) -> np.ndarray:
+        """The latest `max_time_steps` frames as a model input, normalised like `extract_spectrogram`."""
+
+        if self.frame_count >= self.max_time_steps:
+            mel = np.roll(self._frames, -(self.frame_count % self.max_time_steps), axis=1)
+
+        else:
+            mel = self._frames[:, : self.frame_count].copy()
+
+        return pipeline.pad_spectrogram(FeatureExtractor.power_to_db(mel, out=mel))
+
+    def window_start(self) -> float:
+        """Stream time (seconds) of the first sample covered by the current window."""
+
+        first_frame = max(0, self.frame_count - self.max_time_steps)
+
+        return max(0.0, (first_frame * self.hop_length - self.n_fft // 2) / self.sample_rate)
+
+    def window_end(self) -> float:
+        """Stream time (seconds) of the last sample covered by the current window."""
+
+        return ((self.frame_count - 1) * self.hop_length + self.n_fft // 2) / self.sample_rate
+
+
+class PcmDecoder:
+    """Turns raw little-endian PCM chunks into float samples, carrying split samples over.
+
+    When the stream's rate differs from `output_rate`, samples are resampled on the fly
+    with a streaming soxr resampler, which gives the same output as resampling the
+    whole signal at once.
+    """
+
+    def __init__(self, format: str, sample_rate: Optional[int] = None, output_rate: Optional[int] = None) -> None:
+        self._dtype = PCM_FORMATS[format]
+        self._pending = b""
+        self._resampler = None
+
+        if sample_rate is not None and output_rate is not None and sample_rate != output_rate:
+            import soxr
+
+            self._resampler = soxr.ResampleStream(sample_rate, output_rate, 1, dtype="float32")
+
+    def decode(self, data: bytes) -> np.ndarray:
+        data = self._pending + data
+        usable = len(data) - len(data) % self._dtype.itemsize
+        self._pending = data[usable:]
+        samples = np.frombuffer(data[:usable], dtype=self._dtype)
+
+        if self._dtype.kind == "i":
+            samples = samples.astype(np.float32) / 32768.0
+
+        else:
+            samples = samples.astype(np.float32)
+
+        if self._resampler is not None:
+            return self._resampler.resample_chunk(samples)
+
+        return samples
+
+    def flush(self) -> np.ndarray:
+        """Samples still held back by the resampler at the end of the stream."""
+
+        if self._resampler is None:
+            return np.zeros(0, dtype=np.float32)
+
+        return self._resampler.resample_chunk(np.zeros(0, dtype=np.float32), last=True)
+
+
+class StreamLimitError(Exception):
+    """Raised when a client breaks one of the per-connection limits."""
+
+    def __init__(self, message: str, code: int) -> None:
+        super().__init__(message)
+
+        self.code = code
+
+
+class StreamSession:
+    """One client stream: receives audio, keeps the spectrogram current and sends verdicts.
+
+    Chunks go through a bounded queue between the receiving and the classifying side,
+    so a client cannot make the server buffer more than `STREAM_QUEUE_SIZE` chunks.
+    Whenever the classifier catches up, it drains the queue and classifies only the
+    freshest window, so the delay between audio arriving and its verdict stays bounded
+    by roughly one inference instead of growing with a backlog; the windows it jumped
+    over are reported as skipped.
+    """
+
+    active = 0
+
+    def __init__(self, websocket: WebSocket, format: str, sample_rate: int, hop: int) -> None:
+        self.websocket = websocket
+        self.format = format
+        self.sample_rate = sample_rate
+        self.hop = hop
+
+        # Audio is classified at the pipeline's canonical rate, like uploads
+        self.feature_rate = pipeline.SAMPLE_RATE or sample_rate
+
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+        self._process: Optional[asyncio.subprocess.Process] = None
+        self._verdicts = 0
+        self._skipped = 0
+
+    @classmethod
+    async def serve(cls, websocket: WebSocket, format: str, sample_rate: int, hop: int) -> None:
+        """Accept the connection if there is room for it and run the session until it ends."""
+
+        await websocket.accept()
+
+        if cls.active >= STREAM_MAX_CONNECTIONS:
+            Logger.error(f"[StreamSession] Rejected stream, {cls.active} already active")
+
+            await websocket.close(code=CLOSE_TRY_AGAIN_LATER, reason="Too many streams. Please try again later.")
+
+            return
+
+        if format not in PCM_FORMATS and format not in CONTAINER_FORMATS:
+            await websocket.close(code=CLOSE_UNSUPPORTED_DATA, reason=f"Unsupported format: {format}")
+
+            return
+
+        if format in CONTAINER_FORMATS and shutil.which(FFMPEG_BINARY) is None:
+            await websocket.close(code=CLOSE_UNSUPPORTED_DATA, reason=f"{format} streams are not available")
+
+            return
+
+        cls.active += 1
+
+        try:
+            await cls(websocket, format, sample_rate, hop).run()
+
+        finally:
+            cls.active -= 1
+
+    async def run(self) -> None:
+        client = self.websocket.client.host if self.websocket.client else "unknown"
+
+        Logger.debug("[StreamSession] Stream from %s (%s, %d Hz, hop %d)", client, self.format, self.sample_rate, self.hop)
+
+        # Building the filterbank imports librosa on first use
+        spectrogram = await asyncio.to_thread(StreamingSpectrogram, self.feature_rate)
+
+        await self.websocket.send_json(
+            {
+                "type": "ready",
+                "sampleRate": self.sample_rate,
+                "featureSampleRate": self.feature_rate,
+                "windowSeconds": pipeline.MAX_TIME_STEPS * pipeline.HOP_LENGTH / self.feature_rate,
+                "hopSeconds": self.hop * pipeline.HOP_LENGTH / self.feature_rate,
+            }
+        )
+
+        tasks = []
+
+        if self.format in CONTAINER_FORMATS:
+            self._process = await asyncio.create_subprocess_exec(
+                FFMPEG_BINARY, "-nostdin", "-hide_banner", "-loglevel", "error",
+                "-f", CONTAINER_FORMATS[self.format], "-i", "pipe:0",
+                "-vn", "-ac", "1", "-ar", str(self.feature_rate), "-f", "f32le", "pipe:1",
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.DEVNULL,
+            )
+            tasks.append(asyncio.create_task(self._read_decoded()))
+
+        tasks += [asyncio.create_task(self._receive()), asyncio.create_task(self._classify(spectrogram))]
+
+        code, reason = CLOSE_NORMAL, ""
+
+        try:
+            # The classifier finishes once the audio has ended; any other task failing ends the stream
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+
+            for task in done:
+                task.result()
+
+        except WebSocketDisconnect:
+            code = None
+
+        except StreamLimitError as e:
+            code, reason = e.code, str(e)
+
+        except Exception as e:
+            Logger.error(f"[StreamSession] Error: {e}")
+
+            code, reason = CLOSE_INTERNAL_ERROR, "Internal Server Error"
+
+        finally:
+            for task in tasks:
+                task.cancel()
+
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+            if self._process is not None and self._process.returncode is None:
+                self._process.kill()
+                await self._process.wait()
+
+        Logger.debug(
+            "[StreamSession] Stream from %s ended after %.1fs (%d verdicts, %d windows skipped)",
+            client,
+            spectrogram.window_end(),
+            self._verdicts,
+            self._skipped,
+        )
+
+        if code is not None:
+            try:
+                await self.websocket.close(code=code, reason=reason)
+
+            except RuntimeError:
+                pass  # Already closed by the client
+
+    async def _receive(self) -> None:
+        """Read client messages until it closes the stream or sends "end"."""
+
+        decoder = PcmDecoder(self.format, self.sample_rate, self.feature_rate) if self.format in PCM_FORMATS else None
+
+        while True:
+            try:
+                message = await asyncio.wait_for(self.websocket.receive(), timeout=STREAM_IDLE_TIMEOUT_S)
+
+            except asyncio.TimeoutError:
+                raise StreamLimitError(f"No audio for {STREAM_IDLE_TIMEOUT_S:.0f}s", CLOSE_NORMAL)
+
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", CLOSE_NORMAL))
+
+            data = message.get("bytes")
+
+            if data is None:
+                if message.get("text") == "end":
+                    break
+
+                continue
+
+            if len(data) > STREAM_MAX_MESSAGE_BYTES:
+                raise StreamLimitError(
+                    f"Chunks are limited to {STREAM_MAX_MESSAGE_BYTES} bytes", CLOSE_MESSAGE_TOO_BIG
+                )
+
+            if decoder is not None:
+                await self._queue.put((decoder.decode(data), time.perf_counter()))
+
+            else:
+                self._process.stdin.write(data)
+                await self._process.stdin.drain()
+
+        if self._process is not None:
+            self._process.stdin.close()
+
+        else:
+            await self._queue.put((decoder.flush(), time.perf_counter()))
+            await self._queue.put(None)
+
+    async def _read_decoded(self) -> None:
+        """Forward the samples ffmpeg decodes to the classifier."""
+
+        decoder = PcmDecoder("f32le")
+
+        while True:
+            data = await self._process.stdout.read(64 * 1024)
+
+            if not data:
+                break
+
+            await self._queue.put((decoder.decode(data), time.perf_counter()))
+
+        await self._queue.put(None)
+
+    async def _classify(self, spectrogram: StreamingSpectrogram) -> None:
+        """Feed the spectrogram and classify the latest window every `hop` frames."""
+
+        # Frame count at which the next verdict is due
+        due_at = pipeline.MAX_TIME_STEPS
+        is_finished = False
+
+        while not is_finished:
+            items = [await self._queue.get()]
+
+            # Catch up on everything that arrived meanwhile before classifying
+            while not self._queue.empty():
+                items.append(self._queue.get_nowait())
+
+            arrived_at = None
+
+            for item in items:
+                if item is None:
+                    is_finished = True
+
+                    break
+
+                samples, arrived_at = item
+                spectrogram.push(samples)
+
+            if spectrogram.frame_count < due_at:
+                continue
+
+            windows_due = (spectrogram.frame_count - due_at) // self.hop + 1
+            self._skipped += windows_due - 1
+            due_at += windows_due * self.hop
+
+            await self._send_verdict(spectrogram, arrived_at)
+
+        await self.websocket.send_json({"type": "end", "verdicts": self._verdicts, "skippedWindows": self._skipped})
+
+    async def _send_verdict(self, spectrogram: StreamingSpectrogram, arrived_at: float) -> None:
+        X = spectrogram.window()[np.newaxis, ..., np.newaxis]
+
+        try:
+            with classify_executor.admit():
+                prediction: np.ndarray = await model_batcher.predict(X)
+
+        except ExecutorSaturatedError:
+            # Shed this window; the next one covers the same audio and more
+            self._skipped += 1
+
+            return
+
+        index = int(np.argmax(prediction[0]))
+        confidence = float(prediction[0][index])
+        self._verdicts += 1
+
+        await self.websocket.send_json(
+            {
+                "type": "classification",
+                "start": spectrogram.window_start(),
+                "end": spectrogram.window_end(),
+                "isAmbulance": index == 0,
+                "confidence": confidence,
+                "confidencePercent": f"{confidence * 100:.1f}%",
+                "latencyMs": (time.perf_counter() - arrived_at) * 1000,
+                "skippedWindows": self._skipped,
+            }
+        )
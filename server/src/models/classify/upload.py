@@ -0,0 +1,177 @@
+"""Streaming reader for single-file multipart uploads, enforcing the limits while the body arrives."""
+
+import hashlib
+from typing import Callable, Dict, List, Optional
+
+from fastapi import Request
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+# Room for the boundaries and part headers around the file in a multipart body
+MULTIPART_OVERHEAD_BYTES = 16 * 1024
+
+# OpenAPI description of the request body, for endpoints that stream it instead of declaring File(...)
+UPLOAD_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["file"],
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                }
+            }
+        },
+    }
+}
+
+
+class UploadRejectedError(Exception):
+    """Raised when an upload is rejected before or while its body is read."""
+
+
+class UploadTooLargeError(UploadRejectedError):
+    """Raised as soon as an upload is known to exceed the size limit."""
+
+    def __init__(self, size: int) -> None:
+        super().__init__(f"Upload exceeds the size limit ({size} bytes or more)")
+
+        self.size = size
+
+
+class StreamedUpload:
+    """The file part of a multipart request, kept as the chunks it arrived in.
+
+    The body is parsed as it is received, so a request is turned away as soon as its
+    Content-Length, its file name or the bytes received so far break a limit, rather
+    than after the whole body has been buffered. The file is never joined into one
+    bytes object: the decoder reads the chunks directly, and the SHA-256 used by the
+    result cache is updated chunk by chunk.
+    """
+
+    def __init__(self, field_name: str = "file") -> None:
+        self.field_name = field_name
+        self.filename: Optional[str] = None
+        self.chunks: List[bytes] = []
+        self.size = 0
+
+        self._sha256 = hashlib.sha256()
+
+    def digest(self) -> str:
+        return self._sha256.hexdigest()
+
+    async def receive(
+        self,
+        request: Request,
+        max_bytes: int,
+        check_filename: Callable[[Optional[str]], Optional[str]],
+    ) -> None:
+        """
+        Read the request body, keeping the first part named `field_name`.
+
+        Args:
+            request: Request whose multipart body holds the file
+            max_bytes: Maximum size of the file
+            check_filename: Called with the file name once the part headers arrive;
+                returns an error message to reject the upload, or None
+
+        Raises:
+            UploadTooLargeError: If the body or the file exceeds the size limit
+            UploadRejectedError: If the body is not a multipart upload with the file, or the file name is rejected
+        """
+
+        content_type, options = parse_options_header(request.headers.get("content-type"))
+
+        if content_type != b"multipart/form-data" or not options.get(b"boundary"):
+            raise UploadRejectedError("Expected a multipart/form-data upload with a file")
+
+        max_body_bytes = max_bytes + MULTIPART_OVERHEAD_BYTES
+        content_length = request.headers.get("content-length")
+
+        if content_length is not None and content_length.isdigit() and int(content_length) > max_body_bytes:
+            raise UploadTooLargeError(int(content_length))
+
+        headers: Dict[bytes, bytes] = {}
+        header_field = bytearray()
+        header_value = bytearray()
+        state = {"in_file": False, "found": False}
+
+        def on_part_begin() -> None:
+            headers.clear()
+
+        def on_header_field(data: bytes, start: int, end: int) -> None:
+            header_field.extend(data[start:end])
+
+        def on_header_value(data: bytes, start: int, end: int) -> None:
+            header_value.extend(data[start:end])
+
+        def on_header_end() -> None:
+            headers[bytes(header_field).lower()] = bytes(header_value)
+            header_field.clear()
+            header_value.clear()
+
+        def on_headers_finished() -> None:
+            _, disposition = parse_options_header(headers.get(b"content-disposition"))
+            name = disposition.get(b"name", b"").decode("utf-8", errors="replace")
+
+            # Only the first file part counts; other fields are read past
+            state["in_file"] = name == self.field_name and not state["found"]
+
+            if state["in_file"]:
+                state["found"] = True
+                filename = disposition.get(b"filename")
+                self.filename = filename.decode("utf-8", errors="replace") if filename is not None else None
+
+                error_msg = check_filename(self.filename)
+
+                if error_msg is not None:
+                    raise UploadRejectedError(error_msg)
+
+        def on_part_data(data: bytes, start: int, end: int) -> None:
+            if not state["in_file"]:
+                return
+
+            self.size += end - start
+
+            if self.size > max_bytes:
+                raise UploadTooLargeError(self.size)
+
+            chunk = bytes(data[start:end])
+            self.chunks.append(chunk)
+            self._sha256.update(chunk)
+
+        def on_part_end() -> None:
+            state["in_file"] = False
+
+        parser = MultipartParser(
+            options[b"boundary"],
+            {
+                "on_part_begin": on_part_begin,
+                "on_header_field": on_header_field,
+                "on_header_value": on_header_value,
+                "on_header_end": on_header_end,
+                "on_headers_finished": on_headers_finished,
+                "on_part_data": on_part_data,
+                "on_part_end": on_part_end,
+            },
+        )
+        received = 0
+
+        try:
+            async for body_chunk in request.stream():
+                # Bounds the whole body too, so other fields cannot be used to send unbounded data
+                received += len(body_chunk)
+
+                if received > max_body_bytes:
+                    raise UploadTooLargeError(max(received, self.size))
+
+                parser.write(body_chunk)
+
+            parser.finalize()
+
+        except MultipartParseError as e:
+            raise UploadRejectedError(f"Malformed multipart upload: {e}") from e
+
+        if not state["found"]:
+            raise UploadRejectedError(f"No '{self.field_name}' field in the upload")
@@ -0,0 +1,177 @@
+import asyncio
+import datetime
+import os
+import secrets
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Query, Request
+
+from common.enums.response import ResponseStatusEnum
+from models.history.stats import DEFAULT_RANGES, bucket_start, build_stats, parse_time
+from utilities.history import HistoryLogger
+from utilities.logger import Logger
+from utilities.response import Response
+
+# Configuration
+# When set, the history API answers only requests with "Authorization: Bearer <token>"
+HISTORY_API_TOKEN = os.getenv("HISTORY_API_TOKEN") or None
+HISTORY_PAGE_MAX = 500
+
+
+def is_authorized(request: Request) -> bool:
+    if HISTORY_API_TOKEN is None:
+        return True
+
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+
+    return scheme.lower() == "bearer" and secrets.compare_digest(token.encode(), HISTORY_API_TOKEN.encode())
+
+
+def unauthorized() -> Response:
+    return Response[None](
+        success=False,
+        status=ResponseStatusEnum.UNAUTHORIZED_401,
+        message="A valid history API token is required",
+        data=None,
+    )
+
+
+def invalid_time(error: ValueError) -> Response:
+    return Response[None](
+        success=False,
+        status=ResponseStatusEnum.BAD_REQUEST_400,
+        message=f"Invalid time, expected ISO 8601: {error}",
+        data=None,
+    )
+
+
+router: APIRouter = APIRouter(prefix="/history", tags=["History"])
+
+
+@router.get("/")
+async def list_history(
+    request: Request,
+    start: Optional[str] = Query(None, description="Inclusive ISO 8601 lower bound on the timestamp"),
+    end: Optional[str] = Query(None, description="Exclusive ISO 8601 upper bound on the timestamp"),
+    result: Optional[Literal["ambulance", "traffic_noise"]] = Query(None),
+    success: Optional[bool] = Query(None),
+    format: Optional[str] = Query(None, description="Audio format, e.g. .mp3"),
+    client_ip: Optional[str] = Query(None),
+    cursor: Optional[int] = Query(None, description="nextCursor of the previous page"),
+    limit: int = Query(50, ge=1, le=HISTORY_PAGE_MAX),
+):
+    """
+    Page through history entries, newest first.
+
+    Each page reads only its own rows through the indexed columns: pass the returned
+    `nextCursor` as `cursor` to get the next page, until it is null. Without a
+    configured HISTORY_API_TOKEN the requester (IP address and user agent) is left out
+    of the entries.
+
+    Returns:
+        The entries of the page and the cursor of the next one
+    """
+
+    if not is_authorized(request):
+        return unauthorized()
+
+    try:
+        start, end = parse_time(start), parse_time(end)
+
+    except ValueError as e:
+        return invalid_time(e)
+
+    try:
+        entries = await asyncio.to_thread(
+            HistoryLogger.store.query,
+            start=start,
+            end=end,
+            result=result,
+            client_ip=client_ip,
+            success=success,
+            audio_format=format,
+            before_id=cursor,
+            limit=limit,
+            newest_first=True,
+        )
+
+    except Exception as e:
+        Logger.error("[/api/history] Error: %s", e)
+
+        return Response[None](
+            success=False,
+            status=ResponseStatusEnum.INTERNAL_SERVER_ERROR_500,
+            message="Internal Server Error. Please try again.",
+            data=None,
+        )
+
+    if HISTORY_API_TOKEN is None:
+        for entry in entries:
+            entry.pop("requester", None)
+
+    return Response[dict](
+        success=True,
+        status=ResponseStatusEnum.OK_200,
+        message="History entries",
+        data={
+            "entries": entries,
+            "nextCursor": entries[-1]["id"] if len(entries) == limit else None,
+        },
+    )
+
+
+@router.get("/stats")
+async def history_stats(
+    request: Request,
+    resolution: Literal["minute", "hour"] = Query("minute"),
+    start: Optional[str] = Query(None, description="ISO 8601 time; its bucket is the first one (default: 1 hour or 1 day ago)"),
+    end: Optional[str] = Query(None, description="Exclusive ISO 8601 upper bound on the bucket start (default: now)"),
+    format: Optional[str] = Query(None, description="Audio format, e.g. .mp3"),
+):
+    """
+    Attempts, detection rate, error rate and processing times over a time range.
+
+    Computed from the per-minute or per-hour rollups maintained as attempts are
+    logged, so the cost follows the number of buckets in the range, not the number of
+    attempts. Processing time percentiles are estimated from the rollups' histograms.
+    Minute rollups are kept for HISTORY_MINUTE_ROLLUP_RETENTION_DAYS, hour rollups for
+    good (they outlive the entries themselves).
+
+    Returns:
+        Totals, figures per audio format and the series of non-empty buckets
+    """
+
+    if not is_authorized(request):
+        return unauthorized()
+
+    try:
+        start, end = parse_time(start), parse_time(end)
+
+    except ValueError as e:
+        return invalid_time(e)
+
+    now = datetime.datetime.now()
+    end = end or now.isoformat()
+    start = start or (now - DEFAULT_RANGES[resolution]).isoformat()
+
+    try:
+        rollups = await asyncio.to_thread(
+            HistoryLogger.store.rollups, resolution, bucket_start(start, resolution), end, format
+        )
+
+    except Exception as e:
+        Logger.error("[/api/history/stats] Error: %s", e)
+
+        return Response[None](
+            success=False,
+            status=ResponseStatusEnum.INTERNAL_SERVER_ERROR_500,
+            message="Internal Server Error. Please try again.",
+            data=None,
+        )
+
+    return Response[dict](
+        success=True,
+        status=ResponseStatusEnum.OK_200,
+        message="History statistics",
+        data=build_stats(rollups, resolution, start, end),
+    )
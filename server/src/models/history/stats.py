@@ -0,0 +1,115 @@
+"""Dashboard figures computed from the history rollups."""
+
+import datetime
+from typing import Dict, List, Optional
+
+from utilities.history_store import LATENCY_BUCKETS_MS, ROLLUP_RESOLUTIONS
+
+# Range of a stats query when it gives no start: the last hour by minute, the last day by hour
+DEFAULT_RANGES = {"minute": datetime.timedelta(hours=1), "hour": datetime.timedelta(days=1)}
+
+
+def parse_time(value: Optional[str]) -> Optional[str]:
+    """
+    Normalise an ISO 8601 query time to the form history timestamps are stored in (local, naive).
+
+    Raises:
+        ValueError: If the value is not an ISO 8601 date or time
+    """
+
+    if value is None:
+        return None
+
+    parsed = datetime.datetime.fromisoformat(value)
+
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+
+    return parsed.isoformat()
+
+
+def bucket_start(timestamp: str, resolution: str) -> str:
+    """Start of the rollup bucket holding an ISO timestamp."""
+
+    length, suffix = ROLLUP_RESOLUTIONS[resolution]
+
+    return timestamp[:length] + suffix
+
+
+def quantile(latency: List[int], q: float) -> Optional[float]:
+    """
+    Estimate a quantile of the processing time (ms) from histogram bucket counts.
+
+    The value is interpolated linearly inside the bucket holding the quantile, as
+    Prometheus' histogram_quantile does; past the last bound, the last bound is returned.
+    """
+
+    total = sum(latency)
+
+    if total == 0:
+        return None
+
+    rank = q * total
+    cumulative = 0
+
+    for index, count in enumerate(latency):
+        if count and cumulative + count >= rank:
+            if index == len(LATENCY_BUCKETS_MS):
+                return float(LATENCY_BUCKETS_MS[-1])
+
+            lower = LATENCY_BUCKETS_MS[index - 1] if index else 0
+
+            return lower + (LATENCY_BUCKETS_MS[index] - lower) * (rank - cumulative) / count
+
+        cumulative += count
+
+    return float(LATENCY_BUCKETS_MS[-1])
+
+
+def summarize(rollups: List[dict]) -> dict:
+    """Counts, rates and processing times over a set of rollup buckets."""
+
+    attempts = sum(rollup["attempts"] for rollup in rollups)
+    successes = sum(rollup["successes"] for rollup in rollups)
+    ambulance = sum(rollup["ambulance"] for rollup in rollups)
+    time_count = sum(rollup["processing_time_count"] for rollup in rollups)
+    latency = [sum(counts) for counts in zip(*(rollup["latency"] for rollup in rollups))] or [0]
+
+    return {
+        "attempts": attempts,
+        "successes": successes,
+        "errors": attempts - successes,
+        "ambulance": ambulance,
+        "trafficNoise": sum(rollup["traffic_noise"] for rollup in rollups),
+        "detectionRate": ambulance / successes if successes else None,
+        "errorRate": (attempts - successes) / attempts if attempts else None,
+        "averageProcessingTimeMs": (
+            sum(rollup["processing_time_sum_ms"] for rollup in rollups) / time_count if time_count else None
+        ),
+        "p50ProcessingTimeMs": quantile(latency, 0.5),
+        "p95ProcessingTimeMs": quantile(latency, 0.95),
+    }
+
+
+def build_stats(rollups: List[dict], resolution: str, start: str, end: str) -> dict:
+    """
+    Totals, per-format figures and the time series of a stats query.
+
+    Buckets without any attempt are left out of the series.
+    """
+
+    by_format: Dict[str, List[dict]] = {}
+    by_bucket: Dict[str, List[dict]] = {}
+
+    for rollup in rollups:
+        by_format.setdefault(rollup["format"], []).append(rollup)
+        by_bucket.setdefault(rollup["bucket"], []).append(rollup)
+
+    return {
+        "resolution": resolution,
+        "start": start,
+        "end": end,
+        "totals": summarize(rollups),
+        "formats": {audio_format: summarize(rows) for audio_format, rows in sorted(by_format.items())},
+        "buckets": [{"start": bucket, **summarize(rows)} for bucket, rows in by_bucket.items()],
+    }
@@ -0,0 +1,220 @@
+"""
+Pre-fork launcher that runs the API in several worker processes on one port.
+
+The model is loaded once, in a separate spawned process, and every API worker
+sends its inference calls there (the "remote" inference backend). TensorFlow is
+not fork-safe, so its weights cannot simply be loaded before forking and shared
+copy-on-write; a single model process gives the same result (one copy of the
+weights however many workers run) without forking an initialised runtime.
+
+Everything else a worker needs (FastAPI, librosa, scipy, soxr, the mel filterbank)
+is imported and warmed up in the parent before forking, so those pages are shared
+copy-on-write. The parent then supervises: crashed workers and a crashed model
+process are restarted, and SIGTERM / SIGINT stop everything.
+
+Workers write their metrics snapshots to a shared directory, and whichever worker
+answers /metrics merges them, so each scrape covers every worker (see
+`MultiprocessMetrics`).
+
+With `--inference per-worker`, every worker loads its own model instead (the
+baseline the shared model process is measured against, see benchmarks/workers.py).
+
+Usage (from the server directory):
+    SERVER_WORKERS=4 python src/serve.py
+    python src/serve.py --workers 4 --port 3001
+"""
+
+import argparse
+import os
+import secrets
+import shutil
+import signal
+import socket
+import tempfile
+import time
+
+
+def bind_socket(host: str, port: int) -> socket.socket:
+    """Listening socket shared by every worker; the kernel spreads connections over them."""
+
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    return sock
+
+
+def run_worker(sock: socket.socket) -> None:
+    """Body of a forked worker: serve the preloaded app on the shared socket."""
+
+    import uvicorn
+
+    import main
+
+    # uvicorn installs its own handlers for a graceful shutdown
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+    server = uvicorn.Server(uvicorn.Config(main.app, lifespan="on"))
+    server.run(sockets=[sock])
+
+
+def fork_worker(sock: socket.socket, index: int) -> int:
+    pid = os.fork()
+
+    if pid == 0:
+        code = 0
+
+        # Labels this worker's gauges in the merged metrics, the same across restarts
+        os.environ["SERVER_WORKER_INDEX"] = str(index)
+
+        try:
+            run_worker(sock)
+
+        except BaseException:
+            code = 1
+
+        finally:
+            from utilities.logger import Logger
+
+            # os._exit skips atexit, so write the queued log records first
+            Logger.flush()
+
+            # Never return into the parent's supervision loop
+            os._exit(code)
+
+    return pid
+
+
+def serve(workers: int, host: str, port: int, inference: str = "shared") -> None:
+    """
+    Run `workers` API processes on `host:port` until SIGTERM or SIGINT.
+
+    Args:
+        workers: Number of API worker processes
+        host: Address to listen on
+        port: Port to listen on
+        inference: "shared" (one model process for every worker) or "per-worker"
+    """
+
+    inference_server = None
+
+    if inference == "shared":
+        address = os.path.join(tempfile.mkdtemp(prefix="inference-"), "inference.sock")
+        authkey = secrets.token_hex(16)
+
+        # Read by the inference server module when the remote backend first imports it
+        os.environ["INFERENCE_SERVER_ADDRESS"] = address
+        os.environ["INFERENCE_SERVER_AUTHKEY"] = authkey
+
+    # Read by main.py: every worker writes its metrics snapshot there
+    metrics_directory = tempfile.mkdtemp(prefix="metrics-")
+    os.environ["METRICS_DIRECTORY"] = metrics_directory
+
+    import main  # noqa: F401 (preloaded for the workers)
+    from models.classify import pipeline
+    from models.classify.executor import classify_executor
+    from utilities.history import HistoryLogger
+    from utilities.logger import Logger
+
+    # Configured on the instance: when started through main.py it was built before this ran
+    if "CLASSIFY_FEATURE_BACKEND" not in os.environ:
+        # Process pools inside every worker would multiply the process count; threads are enough here
+        classify_executor.feature_backend = "thread"
+
+    if inference == "shared":
+        from models.classify.inference_server import start_inference_server
+
+        classify_executor.inference_backend = "remote"
+
+        inference_server = start_inference_server(address, authkey)
+
+    sock = bind_socket(host, port)
+
+    # Pay these once in the parent so the workers share the pages; the history
+    # store is opened once so a legacy JSON migration never runs in several workers
+    pipeline.warm_feature_worker()
+    HistoryLogger.store.open()
+    HistoryLogger.store.close()
+
+    children = {fork_worker(sock, index): index for index in range(workers)}
+    stopping = False
+
+    Logger.info(
+        f"[serve] {workers} workers on {host}:{port} (pids {sorted(children)}), "
+        f"inference: {inference}" + (f" (pid {inference_server.pid})" if inference_server else "")
+    )
+
+    def stop(signum, frame) -> None:
+        nonlocal stopping
+
+        stopping = True
+
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while children:
+        try:
+            pid, status = os.wait()
+
+        except ChildProcessError:
+            break
+
+        if inference_server is not None and pid == inference_server.pid:
+            if stopping:
+                continue
+
+            Logger.error(f"[serve] Inference server exited ({status}), restarting it")
+
+            inference_server = start_inference_server(address, authkey)
+
+            continue
+
+        index = children.pop(pid, None)
+
+        if index is None or stopping:
+            continue
+
+        Logger.error(f"[serve] Worker {index} (pid {pid}) exited ({status}), restarting it")
+
+        # Avoid a tight loop if workers die right after starting
+        time.sleep(1)
+        children[fork_worker(sock, index)] = index
+
+    if inference_server is not None and inference_server.is_alive():
+        inference_server.terminate()
+        inference_server.join(5)
+
+    sock.close()
+    shutil.rmtree(metrics_directory, ignore_errors=True)
+
+    Logger.info("[serve] Stopped")
+
+
+def main() -> None:
+    from dotenv import load_dotenv
+
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=int(os.getenv("SERVER_WORKERS", "1")))
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "3001")))
+    parser.add_argument("--inference", choices=["shared", "per-worker"], default=os.getenv("SERVER_INFERENCE", "shared"))
+    args = parser.parse_args()
+
+    serve(args.workers, args.host, args.port, args.inference)
+
+
+if __name__ == "__main__":
+    main()
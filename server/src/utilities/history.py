@@ -1,52 +1,44 @@
 """History logging utilities for tracking API requests and classifications."""
 
 import datetime
-import json
 import os
 from typing import Optional
 
+from utilities.history_store import HistoryStore
+from utilities.logger import Logger
+
 
 class HistoryLogger:
     """Manages history logging with detailed request and classification information."""
 
     HISTORY_FILE = "src/history.json"
+    HISTORY_DATABASE = os.getenv("HISTORY_DATABASE", "src/history.db")
+    HISTORY_ID_BLOCK_SIZE = int(os.getenv("HISTORY_ID_BLOCK_SIZE", "100"))
+    HISTORY_ROLLUP_FORMATS = os.getenv("HISTORY_ROLLUP_FORMATS", ".wav,.mp3,.webm,.ogg,.m4a,.oga").split(",")
+
+    # Entries are appended to an indexed SQLite store; the legacy JSON file is migrated on first use
+    store = HistoryStore(
+        HISTORY_DATABASE,
+        legacy_json_path=HISTORY_FILE,
+        id_block_size=HISTORY_ID_BLOCK_SIZE,
+        rollup_formats=HISTORY_ROLLUP_FORMATS,
+    )
 
     @staticmethod
     def get_history() -> list:
-        """Load existing history from file."""
+        """Load the full history. Prefer `HistoryLogger.store.query` for filtered reads."""
         try:
-            with open(HistoryLogger.HISTORY_FILE, "r") as f:
-                data = json.load(f)
-                return data if isinstance(data, list) else []
-            
-        except FileNotFoundError:
-            return []
-        
-        except json.JSONDecodeError:
-            # File exists but contains invalid JSON
-        
-            return []
-        
-        except Exception as e:
-            # Log any other errors and return empty list
-        
-            print(f"Error reading history file: {e}")
-        
-            return []
+            return list(HistoryLogger.store.iter_all())
 
-    @staticmethod
-    def save_history(data: list) -> None:
-        """Save history to file."""
-        try:
-            os.makedirs(os.path.dirname(HistoryLogger.HISTORY_FILE), exist_ok=True)
-            with open(HistoryLogger.HISTORY_FILE, "w") as f:
-                json.dump(data, f, indent=4)
-                
         except Exception as e:
-            print(f"Error saving history file: {e}")
+            # Log any errors and return empty list
+
+            Logger.error("[HistoryLogger] Error reading history database: %s", e)
+
+            return []
 
     @staticmethod
-    def log_attempt(
+    def build_entry(
         file_name: str,
         file_size: int,
         audio_format: str,
@@ -57,9 +49,9 @@ class HistoryLogger:
         confidence: Optional[float] = None,
         error_message: Optional[str] = None,
         processing_time_ms: Optional[float] = None,
-    ) -> int:
+    ) -> dict:
         """
-        Log a classification attempt (success or failure) with detailed information.
+        Build a history entry for a classification attempt (success or failure).
 
         Args:
             file_name: Name of the uploaded file
@@ -74,17 +66,12 @@ class HistoryLogger:
             processing_time_ms: Processing time in milliseconds
 
         Returns:
-            The ID of the logged attempt
+            The entry, without its ID yet: the store assigns it when the entry is written
         """
-        
-        history = HistoryLogger.get_history()
-
-        # Generate next ID
-        next_id = 1 if len(history) == 0 else history[-1]["id"] + 1
 
-        # Create entry
+        # Create entry (the ID is reserved by the store as it writes the entry, off the event loop)
         entry = {
-            "id": next_id,
+            "id": None,
             "timestamp": datetime.datetime.now().isoformat(),
             "success": success,
             "file": {
@@ -126,8 +113,27 @@ class HistoryLogger:
                 "seconds": processing_time_ms / 1000,
             }
 
-        # Save to history
-        history.append(entry)
-        HistoryLogger.save_history(history)
+        return entry
+
+    @staticmethod
+    def log_attempt(**kwargs) -> int:
+        """
+        Log a classification attempt synchronously. Takes the same arguments as `build_entry`.
+
+        Request handlers should go through `history_writer` instead, which batches writes
+        off the event loop.
+
+        Returns:
+            The ID of the logged attempt
+        """
+
+        entry = HistoryLogger.build_entry(**kwargs)
+
+        # Append to history (which assigns the entry its ID)
+        try:
+            HistoryLogger.store.append(entry)
+
+        except Exception as e:
+            Logger.error("[HistoryLogger] Error saving history entry: %s", e)
 
-        return next_id
+        return entry["id"]
@@ -0,0 +1,697 @@
+"""Append-only SQLite storage engine for the classification history."""
+
+import bisect
+import datetime
+import json
+import os
+import sqlite3
+import threading
+from typing import Collection, Iterable, Iterator, List, Optional, Tuple
+
+from utilities.logger import Logger
+
+# Rollup resolutions: the length of the ISO timestamp prefix naming a bucket, and what completes its start time
+ROLLUP_RESOLUTIONS = {"minute": (16, ":00"), "hour": (13, ":00:00")}
+
+# Upper bounds (inclusive) of the processing time buckets of the rollups, in milliseconds; a last bucket holds the rest
+LATENCY_BUCKETS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000]
+
+
+class HistoryStore:
+    """Stores history entries as append-only rows in a SQLite database (WAL mode).
+
+    Every entry is kept as its original JSON document, alongside a few indexed
+    columns (timestamp, result, client IP, ...) so that queries never need a full
+    scan. IDs are handed out from blocks reserved in the database, so several server
+    processes can share one store, and logging an attempt never has to read previous
+    entries. Entries appended without an ID get theirs as they are written, so the
+    reservation (which may wait on other processes) stays on the writing thread. IDs
+    are unique and increase within a process; across processes they are interleaved
+    by block.
+
+    Per-minute and per-hour rollups (attempts, outcomes and a processing time histogram
+    per audio format) are updated in the same transaction as the entries they count,
+    so aggregate queries read one row per bucket instead of every entry, and keep
+    their numbers once old entries are deleted by `compact`.
+
+    Reads (`query`, `iter_all`, `rollups`, `count`) go through a connection and lock of
+    their own: in WAL mode they read the last committed state while the writer,
+    compaction or a rollup rebuild holds the write connection, so neither side waits
+    for the other.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS history (
+            id INTEGER PRIMARY KEY,
+            timestamp TEXT NOT NULL,
+            success INTEGER NOT NULL,
+            result TEXT,
+            format TEXT,
+            client_ip TEXT,
+            processing_time_ms REAL,
+            entry TEXT NOT NULL
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_history_timestamp ON history (timestamp);
+        CREATE INDEX IF NOT EXISTS idx_history_result ON history (result, timestamp);
+        CREATE INDEX IF NOT EXISTS idx_history_client_ip ON history (client_ip, timestamp);
+
+        CREATE TABLE IF NOT EXISTS id_sequence (
+            name TEXT PRIMARY KEY,
+            next_id INTEGER NOT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS history_rollup (
+            resolution TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            format TEXT NOT NULL,
+            attempts INTEGER NOT NULL,
+            successes INTEGER NOT NULL,
+            ambulance INTEGER NOT NULL,
+            traffic_noise INTEGER NOT NULL,
+            processing_time_sum_ms REAL NOT NULL,
+            processing_time_count INTEGER NOT NULL,
+            PRIMARY KEY (resolution, bucket, format)
+        ) WITHOUT ROWID;
+
+        CREATE TABLE IF NOT EXISTS history_rollup_latency (
+            resolution TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            format TEXT NOT NULL,
+            latency_bucket INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (resolution, bucket, format, latency_bucket)
+        ) WITHOUT ROWID;
+    """
+
+    def __init__(
+        self,
+        path: str,
+        legacy_json_path: Optional[str] = None,
+        id_block_size: int = 100,
+        rollup_formats: Optional[Collection[str]] = None,
+    ) -> None:
+        self._path = path
+        self._legacy_json_path = legacy_json_path
+        self._id_block_size = id_block_size
+        # Formats outside this set are rolled up as "other", so clients cannot add rollup rows at will
+        self._rollup_formats = set(rollup_formats) if rollup_formats is not None else None
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = threading.RLock()
+        self._read_connection: Optional[sqlite3.Connection] = None
+        self._read_lock = threading.Lock()
+
+        # Current block of reserved IDs: [_next_id, _block_end)
+        self._next_id = 0
+        self._block_end = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        """Return the database connection, opening it on first use."""
+
+        if self._connection is not None:
+            return self._connection
+
+        with self._lock:
+            if self._connection is None:
+                self._open()
+
+        return self._connection
+
+    def _reader(self) -> sqlite3.Connection:
+        """Return the read connection, opening it (after the database itself) on first use. Use it under `_read_lock`."""
+
+        if self._read_connection is None:
+            self._connect()
+            self._read_connection = self._open_connection()
+
+        return self._read_connection
+
+    def open(self) -> None:
+        """Open the database ahead of the first read or write."""
+
+        self._connect()
+
+    def _open_connection(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self._path, check_same_thread=False, isolation_level=None)
+        # Other server processes may hold the write lock for a moment
+        connection.execute("PRAGMA busy_timeout=5000")
+
+        return connection
+
+    def _open(self) -> None:
+        """Create the schema and migrate the legacy history file. The caller must hold the lock."""
+
+        directory = os.path.dirname(self._path)
+
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        connection = self._open_connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.executescript(self.SCHEMA)
+
+        self._connection = connection
+
+        if self._legacy_json_path and os.path.exists(self._legacy_json_path):
+            self._migrate_json(self._legacy_json_path)
+
+        # Stores written before rollups existed get them from their entries once
+        elif (
+            connection.execute("SELECT 1 FROM history_rollup LIMIT 1").fetchone() is None
+            and connection.execute("SELECT 1 FROM history LIMIT 1").fetchone() is not None
+        ):
+            self.rebuild_rollups()
+
+    def _migrate_json(self, json_path: str) -> None:
+        """One-time import of the legacy `history.json` file, which is renamed afterwards."""
+
+        try:
+            with open(json_path, "r") as f:
+                data = json.load(f)
+
+        except (OSError, json.JSONDecodeError) as e:
+            Logger.error(f"[HistoryStore] Failed to read legacy history {json_path}: {e}")
+
+            return
+
+        entries = data if isinstance(data, list) else []
+        # A malformed entry would fail the import on every start, so the store would never open
+        valid = [entry for entry in entries if self._is_valid_legacy_entry(entry)]
+        skipped = len(entries) - len(valid)
+        entries = valid
+
+        if skipped:
+            Logger.warning("[HistoryStore] Skipped %d malformed entries of %s", skipped, json_path)
+
+        with self._lock:
+            # Keep the original IDs; entries without one are numbered after the highest known ID
+            last_id = max([self._max_id()] + [entry["id"] for entry in entries if isinstance(entry.get("id"), int)])
+
+            for entry in entries:
+                if not isinstance(entry.get("id"), int):
+                    last_id += 1
+                    entry["id"] = last_id
+
+            self._insert(entries, replace=True)
+            self.rebuild_rollups()
+
+        os.replace(json_path, f"{json_path}.migrated")
+
+        Logger.info(f"[HistoryStore] Migrated {len(entries)} entries from {json_path}")
+
+    @classmethod
+    def _is_valid_legacy_entry(cls, entry: object) -> bool:
+        """Whether a legacy entry can be stored: a dict with a timestamp, flattening cleanly."""
+
+        if not isinstance(entry, dict) or not isinstance(entry.get("timestamp"), str):
+            return False
+
+        try:
+            cls._row({**entry, "id": 0})
+
+        except (AttributeError, TypeError, ValueError):
+            return False
+
+        return True
+
+    @staticmethod
+    def _row(entry: dict) -> tuple:
+        """Flatten an entry into the indexed columns of the history table."""
+
+        classification = entry.get("classification") or {}
+        processing_time = entry.get("processing_time") or {}
+
+        return (
+            entry["id"],
+            entry["timestamp"],
+            int(bool(entry.get("success"))),
+            classification.get("result"),
+            (entry.get("file") or {}).get("format"),
+            (entry.get("requester") or {}).get("ip_address"),
+            processing_time.get("milliseconds"),
+            json.dumps(entry, separators=(",", ":")),
+        )
+
+    def _rollup_format(self, audio_format: Optional[str]) -> str:
+        if not audio_format:
+            return "unknown"
+
+        if self._rollup_formats is not None and audio_format not in self._rollup_formats:
+            return "other"
+
+        return audio_format
+
+    def _rollup_increments(self, rows: Iterable[tuple]) -> Tuple[dict, dict]:
+        """
+        Aggregate (timestamp, success, result, format, processing_time_ms) rows into rollup increments.
+
+        Returns:
+            Counters per (resolution, bucket, format), and processing time bucket
+            counts per (resolution, bucket, format, latency bucket)
+        """
+
+        counters: dict = {}
+        latency: dict = {}
+
+        for timestamp, success, result, audio_format, processing_time_ms in rows:
+            audio_format = self._rollup_format(audio_format)
+            latency_bucket = (
+                bisect.bisect_left(LATENCY_BUCKETS_MS, processing_time_ms) if processing_time_ms is not None else None
+            )
+
+            for resolution, (length, suffix) in ROLLUP_RESOLUTIONS.items():
+                key = (resolution, timestamp[:length] + suffix, audio_format)
+                counter = counters.get(key)
+
+                if counter is None:
+                    counter = counters[key] = [0, 0, 0, 0, 0.0, 0]
+
+                counter[0] += 1
+                counter[1] += int(bool(success))
+                counter[2] += result == "ambulance"
+                counter[3] += result == "traffic_noise"
+
+                if latency_bucket is not None:
+                    counter[4] += processing_time_ms
+                    counter[5] += 1
+                    latency[key + (latency_bucket,)] = latency.get(key + (latency_bucket,), 0) + 1
+
+        return counters, latency
+
+    def _add_rollups(self, rows: Iterable[tuple]) -> None:
+        """Add rows to the rollups. The caller must hold the lock and be in a transaction."""
+
+        counters, latency = self._rollup_increments(rows)
+        connection = self._connect()
+
+        connection.executemany(
+            "INSERT INTO history_rollup (resolution, bucket, format, attempts, successes, ambulance, traffic_noise, "
+            "processing_time_sum_ms, processing_time_count) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (resolution, bucket, format) DO UPDATE SET "
+            "attempts = attempts + excluded.attempts, successes = successes + excluded.successes, "
+            "ambulance = ambulance + excluded.ambulance, traffic_noise = traffic_noise + excluded.traffic_noise, "
+            "processing_time_sum_ms = processing_time_sum_ms + excluded.processing_time_sum_ms, "
+            "processing_time_count = processing_time_count + excluded.processing_time_count",
+            [key + tuple(counter) for key, counter in counters.items()],
+        )
+        connection.executemany(
+            "INSERT INTO history_rollup_latency (resolution, bucket, format, latency_bucket, count) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (resolution, bucket, format, latency_bucket) DO UPDATE SET count = count + excluded.count",
+            [key + (count,) for key, count in latency.items()],
+        )
+
+    def _insert(self, entries: list, replace: bool = False) -> None:
+        """
+        Insert entries in a single transaction. The caller must hold the lock.
+
+        New entries are added to the rollups in the same transaction; replaced entries
+        may already be counted, so replacing is followed by `rebuild_rollups`.
+        """
+
+        connection = self._connect()
+        verb = "INSERT OR REPLACE" if replace else "INSERT"
+        rows = [self._row(entry) for entry in entries]
+
+        connection.execute("BEGIN")
+
+        try:
+            connection.executemany(
+                f"{verb} INTO history (id, timestamp, success, result, format, client_ip, processing_time_ms, entry) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+
+            if not replace:
+                self._add_rollups((row[1], row[2], row[3], row[4], row[6]) for row in rows)
+
+            connection.execute("COMMIT")
+
+        except Exception:
+            connection.execute("ROLLBACK")
+
+            raise
+
+    def _max_id(self) -> int:
+        """Highest stored entry ID, or 0."""
+
+        return self._connect().execute("SELECT COALESCE(MAX(id), 0) FROM history").fetchone()[0]
+
+    def _reserve_block(self) -> None:
+        """Reserve the next block of IDs for this process. The caller must hold the lock."""
+
+        connection = self._connect()
+
+        # BEGIN IMMEDIATE takes the write lock up front, so no other process reserves the same block
+        connection.execute("BEGIN IMMEDIATE")
+
+        try:
+            row = connection.execute("SELECT next_id FROM id_sequence WHERE name = 'history'").fetchone()
+            # Entries may also have been written with explicit IDs (the legacy migration)
+            start = max(row[0] if row else 1, self._max_id() + 1)
+
+            connection.execute(
+                "INSERT OR REPLACE INTO id_sequence (name, next_id) VALUES ('history', ?)",
+                (start + self._id_block_size,),
+            )
+            connection.execute("COMMIT")
+
+        except Exception:
+            connection.execute("ROLLBACK")
+
+            raise
+
+        self._next_id = start
+        self._block_end = start + self._id_block_size
+
+    def _take_id(self) -> int:
+        """Next ID of the reserved block, reserving a new block when it is used up. The caller must hold the lock."""
+
+        if self._next_id >= self._block_end:
+            self._reserve_block()
+
+        entry_id = self._next_id
+        self._next_id += 1
+
+        return entry_id
+
+    def next_id(self) -> int:
+        """
+        Reserve the next entry ID.
+
+        This may wait for the database (a new block, or a write in progress), so it is
+        not for the event loop; entries appended without an ID get one as they are written.
+        """
+
+        self._connect()
+
+        with self._lock:
+            return self._take_id()
+
+    def append(self, entry: dict) -> None:
+        """Append a single entry; one without an ID (missing or None) gets the next one."""
+
+        self.append_many([entry])
+
+    def append_many(self, entries: Iterable[dict]) -> None:
+        """Append several entries in one transaction; those without an ID get the next ones, in order."""
+
+        entries = list(entries)
+
+        if not entries:
+            return
+
+        self._connect()
+
+        with self._lock:
+            for entry in entries:
+                if entry.get("id") is None:
+                    entry["id"] = self._take_id()
+
+            self._insert(entries)
+
+    def query(
+        self,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        result: Optional[str] = None,
+        client_ip: Optional[str] = None,
+        success: Optional[bool] = None,
+        audio_format: Optional[str] = None,
+        before_id: Optional[int] = None,
+        limit: Optional[int] = None,
+        offset: int = 0,
+        newest_first: bool = False,
+    ) -> list:
+        """
+        Query entries using the indexed columns.
+
+        Args:
+            start: Inclusive lower bound on the ISO timestamp
+            end: Exclusive upper bound on the ISO timestamp
+            result: Classification result ("ambulance" or "traffic_noise")
+            client_ip: IP address of the requester
+            success: Only successful (True) or failed (False) attempts
+            audio_format: Audio format (e.g., ".mp3")
+            before_id: Only entries with a lower ID, to page through results newest first
+            limit: Maximum number of entries to return
+            offset: Number of matching entries to skip
+            newest_first: Return entries in descending ID order
+
+        Returns:
+            The matching history entries
+        """
+
+        clauses = []
+        params: list = []
+
+        if start is not None:
+            clauses.append("timestamp >= ?")
+            params.append(start)
+
+        if end is not None:
+            clauses.append("timestamp < ?")
+            params.append(end)
+
+        if result is not None:
+            clauses.append("result = ?")
+            params.append(result)
+
+        if client_ip is not None:
+            clauses.append("client_ip = ?")
+            params.append(client_ip)
+
+        if success is not None:
+            clauses.append("success = ?")
+            params.append(int(success))
+
+        if audio_format is not None:
+            clauses.append("format = ?")
+            params.append(audio_format)
+
+        if before_id is not None:
+            clauses.append("id < ?")
+            params.append(before_id)
+
+        sql = "SELECT entry FROM history"
+
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+
+        sql += " ORDER BY id DESC" if newest_first else " ORDER BY id"
+        sql += " LIMIT ? OFFSET ?"
+        params.extend([limit if limit is not None else -1, offset])
+
+        with self._read_lock:
+            rows = self._reader().execute(sql, params).fetchall()
+
+        return [json.loads(row[0]) for row in rows]
+
+    def iter_all(self, batch_size: int = 1000) -> Iterator[dict]:
+        """Iterate over every entry in ID order without loading them all at once."""
+
+        last_id = 0
+
+        while True:
+            with self._read_lock:
+                rows = self._reader().execute(
+                    "SELECT id, entry FROM history WHERE id > ? ORDER BY id LIMIT ?", (last_id, batch_size)
+                ).fetchall()
+
+            if not rows:
+                return
+
+            for _, entry in rows:
+                yield json.loads(entry)
+
+            last_id = rows[-1][0]
+
+    def rebuild_rollups(self, batch_size: int = 10000) -> None:
+        """Recompute the rollups from the stored entries (those deleted by `compact` are lost from them)."""
+
+        connection = self._connect()
+
+        with self._lock:
+            connection.execute("BEGIN IMMEDIATE")
+
+            try:
+                connection.execute("DELETE FROM history_rollup")
+                connection.execute("DELETE FROM history_rollup_latency")
+
+                cursor = connection.execute("SELECT timestamp, success, result, format, processing_time_ms FROM history")
+
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+
+                    if not rows:
+                        break
+
+                    self._add_rollups(rows)
+
+                connection.execute("COMMIT")
+
+            except Exception:
+                connection.execute("ROLLBACK")
+
+                raise
+
+    def rollups(
+        self,
+        resolution: str,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        audio_format: Optional[str] = None,
+    ) -> List[dict]:
+        """
+        Read the rollup buckets starting in a time range.
+
+        Args:
+            resolution: "minute" or "hour"
+            start: Inclusive lower bound on the ISO start time of a bucket
+            end: Exclusive upper bound on the ISO start time of a bucket
+            audio_format: Only this audio format
+
+        Returns:
+            One dict per bucket and format, in time order, with the counters and the
+            processing time histogram (`latency`, counts per LATENCY_BUCKETS_MS bucket)
+        """
+
+        if resolution not in ROLLUP_RESOLUTIONS:
+            raise ValueError(f"Invalid rollup resolution: {resolution} (expected one of {set(ROLLUP_RESOLUTIONS)})")
+
+        clauses = ["resolution = ?"]
+        params: list = [resolution]
+
+        if start is not None:
+            clauses.append("bucket >= ?")
+            params.append(start)
+
+        if end is not None:
+            clauses.append("bucket < ?")
+            params.append(end)
+
+        if audio_format is not None:
+            clauses.append("format = ?")
+            params.append(audio_format)
+
+        where = " AND ".join(clauses)
+
+        with self._read_lock:
+            connection = self._reader()
+            # One read transaction, so both tables are read from the same snapshot
+            connection.execute("BEGIN")
+
+            try:
+                rows = connection.execute(
+                    "SELECT bucket, format, attempts, successes, ambulance, traffic_noise, processing_time_sum_ms, "
+                    f"processing_time_count FROM history_rollup WHERE {where} ORDER BY bucket, format",
+                    params,
+                ).fetchall()
+                latency_rows = connection.execute(
+                    f"SELECT bucket, format, latency_bucket, count FROM history_rollup_latency WHERE {where}", params
+                ).fetchall()
+
+            finally:
+                connection.execute("COMMIT")
+
+        buckets = {}
+
+        for bucket, audio_format, attempts, successes, ambulance, traffic_noise, time_sum, time_count in rows:
+            buckets[(bucket, audio_format)] = {
+                "bucket": bucket,
+                "format": audio_format,
+                "attempts": attempts,
+                "successes": successes,
+                "ambulance": ambulance,
+                "traffic_noise": traffic_noise,
+                "processing_time_sum_ms": time_sum,
+                "processing_time_count": time_count,
+                "latency": [0] * (len(LATENCY_BUCKETS_MS) + 1),
+            }
+
+        for bucket, audio_format, latency_bucket, count in latency_rows:
+            buckets[(bucket, audio_format)]["latency"][latency_bucket] = count
+
+        return list(buckets.values())
+
+    def compact(
+        self,
+        retention_days: float,
+        minute_rollup_retention_days: Optional[float] = None,
+        batch_size: int = 5000,
+    ) -> Tuple[int, int]:
+        """
+        Delete entries (and minute rollups) older than their retention; hour rollups are kept.
+
+        Entries are deleted in batches of `batch_size`, each in its own transaction, so
+        writers wait for one batch at most. Freed pages are reused by later entries, so
+        the database file stops growing once the retention is reached.
+
+        Args:
+            retention_days: Age in days past which entries are deleted (0 keeps them all)
+            minute_rollup_retention_days: Age in days past which minute rollups are deleted (None or 0 keeps them)
+
+        Returns:
+            The number of entries and of minute rollup rows deleted
+        """
+
+        now = datetime.datetime.now()
+        connection = self._connect()
+        deleted_entries = 0
+        deleted_rollups = 0
+
+        if retention_days > 0:
+            cutoff = (now - datetime.timedelta(days=retention_days)).isoformat()
+
+            while True:
+                with self._lock:
+                    deleted = connection.execute(
+                        "DELETE FROM history WHERE id IN (SELECT id FROM history WHERE timestamp < ? LIMIT ?)",
+                        (cutoff, batch_size),
+                    ).rowcount
+
+                deleted_entries += deleted
+
+                if deleted < batch_size:
+                    break
+
+        if minute_rollup_retention_days:
+            cutoff = (now - datetime.timedelta(days=minute_rollup_retention_days)).isoformat()
+
+            with self._lock:
+                connection.execute("BEGIN")
+
+                try:
+                    deleted_rollups = connection.execute(
+                        "DELETE FROM history_rollup WHERE resolution = 'minute' AND bucket < ?", (cutoff,)
+                    ).rowcount
+                    connection.execute(
+                        "DELETE FROM history_rollup_latency WHERE resolution = 'minute' AND bucket < ?", (cutoff,)
+                    )
+                    connection.execute("COMMIT")
+
+                except Exception:
+                    connection.execute("ROLLBACK")
+
+                    raise
+
+        return deleted_entries, deleted_rollups
+
+    def count(self) -> int:
+        """Number of stored entries."""
+
+        with self._read_lock:
+            return self._reader().execute("SELECT COUNT(*) FROM history").fetchone()[0]
+
+    def close(self) -> None:
+        """Close the underlying database connections."""
+
+        with self._read_lock:
+            if self._read_connection is not None:
+                self._read_connection.close()
+                self._read_connection = None
+
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
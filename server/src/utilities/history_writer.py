@@ -0,0 +1,240 @@
+"""Background writer that batches history entries off the request path."""
+
+import asyncio
+import os
+from typing import List, Optional
+
+from utilities.history import HistoryLogger
+from utilities.logger import Logger
+
+QUEUE_FULL_POLICIES = {"block", "drop"}
+
+
+class HistoryWriter:
+    """Queues history entries in memory and flushes them to the store in batches.
+
+    Handlers only build their entries and enqueue them, without touching the store;
+    the entries get their IDs and are written in a worker thread once `batch_size`
+    entries are pending or `flush_interval_ms` has elapsed, whichever comes first.
+    The entries of one request are queued as one group (`max_queue_size` counts
+    groups) and always written in the same transaction. Every `compact_interval_s`, entries older than
+    `retention_days` and minute rollups older than `minute_rollup_retention_days`
+    are deleted from the store, also in a worker thread.
+    """
+
+    def __init__(
+        self,
+        max_queue_size: int = 10000,
+        batch_size: int = 256,
+        flush_interval_ms: float = 500,
+        queue_full_policy: str = "block",
+        retention_days: float = 90,
+        minute_rollup_retention_days: float = 7,
+        compact_interval_s: float = 3600,
+    ) -> None:
+        if queue_full_policy not in QUEUE_FULL_POLICIES:
+            raise ValueError(f"Invalid queue full policy: {queue_full_policy} (expected one of {QUEUE_FULL_POLICIES})")
+
+        self.max_queue_size = max_queue_size
+        self.batch_size = batch_size
+        self.flush_interval_ms = flush_interval_ms
+        self.queue_full_policy = queue_full_policy
+        self.retention_days = retention_days
+        self.minute_rollup_retention_days = minute_rollup_retention_days
+        self.compact_interval_s = compact_interval_s
+        self.dropped = 0
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._compact_task: Optional[asyncio.Task] = None
+
+    def is_running(self) -> bool:
+        """Check if the flush task is running."""
+
+        return self._task is not None and not self._task.done()
+
+    def queue_depth(self) -> int:
+        """Number of groups of entries (one per request) waiting to be flushed."""
+
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def start(self) -> None:
+        """Start the flush task on the running event loop."""
+
+        if self.is_running():
+            return
+
+        # Open the store (and run any migration) before requests start reserving IDs
+        await asyncio.to_thread(HistoryLogger.store.open)
+
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._task = asyncio.create_task(self._run())
+
+        if self.compact_interval_s > 0 and (self.retention_days > 0 or self.minute_rollup_retention_days > 0):
+            self._compact_task = asyncio.create_task(self._compact_periodically())
+
+        Logger.info(
+            f"[HistoryWriter] Started (queue: {self.max_queue_size}, batch: {self.batch_size}, "
+            f"interval: {self.flush_interval_ms}ms, policy: {self.queue_full_policy}, "
+            f"retention: {self.retention_days}d, minute rollups: {self.minute_rollup_retention_days}d)"
+        )
+
+    async def stop(self) -> None:
+        """Flush every pending entry and stop the flush task."""
+
+        if not self.is_running():
+            return
+
+        if self._compact_task is not None:
+            self._compact_task.cancel()
+
+            try:
+                await self._compact_task
+
+            except asyncio.CancelledError:
+                pass
+
+            self._compact_task = None
+
+        # The sentinel is queued behind every pending entry, so they are all flushed first
+        await self._queue.put(None)
+        await self._task
+
+        # Entries enqueued after the sentinel are written directly
+        remaining = []
+
+        while not self._queue.empty():
+            entries = self._queue.get_nowait()
+
+            if entries is not None:
+                remaining.extend(entries)
+
+        await asyncio.to_thread(self._write, remaining)
+
+        self._task = None
+
+        Logger.info("[HistoryWriter] Stopped")
+
+    async def log_attempt(self, **kwargs) -> None:
+        """
+        Queue a classification attempt. Takes the same arguments as `HistoryLogger.build_entry`.
+
+        The entry's ID is assigned when it is written, so reserving IDs (which may wait for
+        the database) never blocks the event loop.
+        """
+
+        if not self.is_running():
+            await self.start()
+
+        await self._enqueue([HistoryLogger.build_entry(**kwargs)])
+
+    async def log_attempts(self, attempts: List[dict]) -> None:
+        """
+        Queue several classification attempts as one group, e.g. the files of a batch request.
+
+        Their entries are written to the store together, in one transaction.
+
+        Args:
+            attempts: Keyword arguments of `HistoryLogger.build_entry`, one dict per attempt
+        """
+
+        if not attempts:
+            return
+
+        if not self.is_running():
+            await self.start()
+
+        await self._enqueue([HistoryLogger.build_entry(**attempt) for attempt in attempts])
+
+    async def _enqueue(self, entries: List[dict]) -> None:
+        if self.queue_full_policy == "block":
+            await self._queue.put(entries)
+
+            return
+
+        try:
+            self._queue.put_nowait(entries)
+
+        except asyncio.QueueFull:
+            self.dropped += len(entries)
+
+            Logger.warning("[HistoryWriter] Queue full, dropped %d entries (%d dropped so far)", len(entries), self.dropped)
+
+    async def _run(self) -> None:
+        """Collect groups of entries into batches and write each batch in a worker thread."""
+
+        loop = asyncio.get_running_loop()
+        stopping = False
+
+        while not stopping:
+            entries = await self._queue.get()
+
+            if entries is None:
+                break
+
+            # A group is never split, so a batch may exceed `batch_size` by the last group's size
+            batch = list(entries)
+            deadline = loop.time() + self.flush_interval_ms / 1000
+
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+
+                if timeout <= 0:
+                    break
+
+                try:
+                    entries = await asyncio.wait_for(self._queue.get(), timeout)
+
+                except asyncio.TimeoutError:
+                    break
+
+                if entries is None:
+                    stopping = True
+
+                    break
+
+                batch.extend(entries)
+
+            await asyncio.to_thread(self._write, batch)
+
+    async def _compact_periodically(self) -> None:
+        """Compact the store now and then every `compact_interval_s`."""
+
+        while True:
+            try:
+                entries, rollups = await asyncio.to_thread(
+                    HistoryLogger.store.compact, self.retention_days, self.minute_rollup_retention_days
+                )
+
+                if entries or rollups:
+                    Logger.info(f"[HistoryWriter] Compacted history: {entries} entries, {rollups} minute rollups deleted")
+
+            except Exception as e:
+                Logger.error(f"[HistoryWriter] Failed to compact history: {e}")
+
+            await asyncio.sleep(self.compact_interval_s)
+
+    @staticmethod
+    def _write(batch: list) -> None:
+        """Append a batch of entries to the store."""
+
+        if not batch:
+            return
+
+        try:
+            HistoryLogger.store.append_many(batch)
+
+        except Exception as e:
+            Logger.error(f"[HistoryWriter] Failed to write {len(batch)} history entries: {e}")
+
+
+# Global history writer instance
+history_writer = HistoryWriter(
+    max_queue_size=int(os.getenv("HISTORY_QUEUE_SIZE", "10000")),
+    batch_size=int(os.getenv("HISTORY_BATCH_SIZE", "256")),
+    flush_interval_ms=float(os.getenv("HISTORY_FLUSH_INTERVAL_MS", "500")),
+    queue_full_policy=os.getenv("HISTORY_QUEUE_FULL_POLICY", "block"),
+    retention_days=float(os.getenv("HISTORY_RETENTION_DAYS", "90")),
+    minute_rollup_retention_days=float(os.getenv("HISTORY_MINUTE_ROLLUP_RETENTION_DAYS", "7")),
+    compact_interval_s=float(os.getenv("HISTORY_COMPACT_INTERVAL_S", "3600")),
+)
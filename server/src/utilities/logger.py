@@ -1,13 +1,234 @@
+"""
+Leveled, structured logger of the server.
+
+Records below LOG_LEVEL (DEBUG, INFO, WARNING or ERROR; INFO by default) are dropped
+before their message is formatted, so hot paths pass values as arguments instead of
+formatting them into the message themselves:
+
+    Logger.debug("[%s] Received file: %s", endpoint, file_name)
+
+Records that pass the level are put on a queue as they are; a background thread
+formats them and writes them to stdout in batches, so a slow terminal or pipe never
+blocks the event loop. LOG_FORMAT selects JSON lines ("json", the default) or coloured
+text for a terminal ("text"). Keyword arguments become fields of the line, and records
+logged while a request is handled carry its ID (see utilities/request_id.py).
+"""
+
+import atexit
+import contextvars
 import datetime
+import json
+import os
+import queue
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+
+DEBUG, INFO, WARNING, ERROR = 10, 20, 30, 40
+LEVELS = {"DEBUG": DEBUG, "INFO": INFO, "WARNING": WARNING, "ERROR": ERROR}
+LEVEL_NAMES = {value: name for name, value in LEVELS.items()}
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+# ID of the request being handled, set by RequestIdMiddleware
+request_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+
+COLORS = {DEBUG: 36, INFO: 32, WARNING: 33, ERROR: 31}
+
+_TIMEZONE = datetime.datetime.now().astimezone().tzinfo
+
+
+def _message(text: str, args: tuple) -> str:
+    if not args:
+        return text
+
+    try:
+        return text % args
+
+    except (TypeError, ValueError):
+        return f"{text} {args!r}"
+
+
+def format_json(record: tuple) -> str:
+    """One JSON object per line: time, level, message, request ID and the record's fields."""
+
+    created, level, text, args, record_id, fields, exception = record
+    line = {
+        "time": datetime.datetime.fromtimestamp(created, _TIMEZONE).isoformat(timespec="milliseconds"),
+        "level": LEVEL_NAMES[level],
+        "message": _message(text, args),
+    }
+
+    if record_id is not None:
+        line["request_id"] = record_id
+
+    line.update(fields)
+
+    if exception is not None:
+        line["exception"] = exception
+
+    return json.dumps(line, default=str)
+
+
+def format_text(record: tuple) -> str:
+    """The previous coloured console format, with the request ID and fields appended."""
+
+    created, level, text, args, record_id, fields, exception = record
+    name = LEVEL_NAMES[level]
+    line = (
+        f"\033[{COLORS[level]}m{name}\033[0m:{' ' * (9 - len(name))}"
+        f"[{datetime.datetime.fromtimestamp(created).strftime('%Y-%m-%d %H:%M:%S')}]{_message(text, args)}"
+    )
+
+    if record_id is not None:
+        line += f" request_id={record_id}"
+
+    for key, value in fields.items():
+        line += f" {key}={value}"
+
+    if exception is not None:
+        line += f"\n{exception.rstrip()}"
+
+    return line
+
+
+class LogWriter:
+    """Queues log records and writes them to a stream from a background thread, started on first use.
+
+    Callers only put the record (its time, level, unformatted message and arguments,
+    request ID and fields) on the queue; the thread takes every record queued so far,
+    formats them and writes them with one write and flush. Past `max_queue_size`
+    pending records, new ones are dropped and counted rather than held in memory.
+    """
+
+    def __init__(self, formatter, stream=None, max_queue_size: int = 10000) -> None:
+        self.formatter = formatter
+        self.stream = stream
+        self.max_queue_size = max_queue_size
+        self.dropped = 0
+
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def put(self, record: tuple) -> None:
+        if self._thread is None:
+            self.start()
+
+        if self._queue.qsize() >= self.max_queue_size:
+            self.dropped += 1
+
+            return
+
+        self._queue.put(record)
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+                self._thread.start()
+
+    def stop(self) -> None:
+        """Write every queued record and stop the thread."""
+
+        with self._lock:
+            if self._thread is not None:
+                # The sentinel is queued behind every pending record, so they are all written first
+                self._queue.put(None)
+                self._thread.join()
+                self._thread = None
+
+    def after_fork(self) -> None:
+        # The thread does not exist in a forked child, and the queue may hold the parent's records
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _run(self) -> None:
+        stopping = False
+        reported = 0
+
+        while not stopping:
+            batch = [self._queue.get()]
+
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+
+                except queue.Empty:
+                    break
+
+            if batch[-1] is None:
+                stopping = True
+                batch.pop()
+
+            lines = []
+
+            if self.dropped != reported:
+                lines.append(self.formatter((time.time(), WARNING, "[Logger] Queue full, dropped %d records so far", (self.dropped,), None, {}, None)))
+                reported = self.dropped
+
+            for record in batch:
+                try:
+                    lines.append(self.formatter(record))
+
+                except Exception as e:
+                    lines.append(f"Failed to format log record {record!r}: {e}")
+
+            try:
+                stream = self.stream or sys.stdout
+                stream.write("\n".join(lines) + "\n")
+                stream.flush()
+
+            except Exception:
+                # Nowhere left to report to; keep the thread alive for later records
+                pass
+
+
+_level = LEVELS.get(LOG_LEVEL, INFO)
+
+_writer = LogWriter(format_text if LOG_FORMAT == "text" else format_json, max_queue_size=LOG_QUEUE_SIZE)
+
+atexit.register(_writer.stop)
+os.register_at_fork(after_in_child=_writer.after_fork)
 
 
 class Logger:
-    def debug(text: str) -> None:
-        print(
-            f"\033[36mDEBUG\033[0m:    [{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}]{text}"
-        )
-
-    def error(text: str) -> None:
-        print(
-            f"\033[31mERROR\033[0m:    [{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}]{text}"
-        )
+    """Leveled logging for the server; see the module docstring."""
+
+    @staticmethod
+    def is_enabled(level: int) -> bool:
+        """Whether records of a level are written, to skip work that is only done for them."""
+
+        return level >= _level
+
+    @staticmethod
+    def debug(text: str, *args, **fields) -> None:
+        if _level <= DEBUG:
+            _writer.put((time.time(), DEBUG, text, args, request_id.get(), fields, None))
+
+    @staticmethod
+    def info(text: str, *args, **fields) -> None:
+        if _level <= INFO:
+            _writer.put((time.time(), INFO, text, args, request_id.get(), fields, None))
+
+    @staticmethod
+    def warning(text: str, *args, **fields) -> None:
+        if _level <= WARNING:
+            _writer.put((time.time(), WARNING, text, args, request_id.get(), fields, None))
+
+    @staticmethod
+    def error(text: str, *args, exc_info: bool = False, **fields) -> None:
+        if _level <= ERROR:
+            exception = traceback.format_exc() if exc_info else None
+            _writer.put((time.time(), ERROR, text, args, request_id.get(), fields, exception))
+
+    @staticmethod
+    def flush() -> None:
+        """Write every queued record; for processes that leave through os._exit."""
+
+        _writer.stop()
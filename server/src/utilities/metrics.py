@@ -0,0 +1,424 @@
+"""Lightweight in-process metrics, with a Prometheus text exposition of them."""
+
+import bisect
+import glob
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+
+class Histogram:
+    """Cumulative histogram with fixed upper bounds (the last bucket is +Inf)."""
+
+    def __init__(self, bounds: Sequence[float]) -> None:
+        self.bounds = list(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        """Record one observation."""
+
+        index = bisect.bisect_left(self.bounds, value)
+
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self) -> dict:
+        """Return the bucket counts keyed by upper bound, with the count, sum and mean."""
+
+        with self._lock:
+            buckets = {str(bound): count for bound, count in zip(self.bounds, self.counts)}
+            buckets["+Inf"] = self.counts[-1]
+
+            return {
+                "count": self.count,
+                "sum": self.sum,
+                "mean": self.sum / self.count if self.count else 0.0,
+                "buckets": buckets,
+            }
+
+    def cumulative(self) -> Tuple[List[Tuple[float, int]], float, int]:
+        """Return (upper bound, observations at or below it) pairs ending with +Inf, the sum and the count."""
+
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+
+        running = 0
+        buckets = []
+
+        for bound, bucket_count in zip(self.bounds + [math.inf], counts):
+            running += bucket_count
+            buckets.append((bound, running))
+
+        return buckets, total, count
+
+
+class Counter:
+    """Monotonically increasing value."""
+
+    def __init__(self) -> None:
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+
+class Gauge:
+    """Value that can go up and down."""
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class MetricFamily:
+    """A named metric, with one child metric per combination of label values.
+
+    Instead of children, a family may have a `function` that returns its current
+    value when metrics are rendered (a number, or a dict from label value tuples to
+    numbers), for values another component already keeps.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        kind: str,
+        label_names: Sequence[str] = (),
+        factory: Optional[Callable[[], object]] = None,
+        function: Optional[Callable[[], object]] = None,
+    ) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.kind = kind
+        self.label_names = tuple(label_names)
+        self.function = function
+
+        self._factory = factory
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values: str):
+        """The child metric for these label values (in the order of the label names), created on first use."""
+
+        child = self._children.get(values)
+
+        if child is None:
+            if len(values) != len(self.label_names):
+                raise ValueError(f"{self.name} takes labels {self.label_names}, got {values}")
+
+            with self._lock:
+                child = self._children.setdefault(values, self._factory())
+
+        return child
+
+    def samples(self) -> List[Tuple[Tuple[str, ...], object]]:
+        """(label values, child metric or value) pairs, sorted by label values."""
+
+        if self.function is None:
+            return sorted(self._children.items())
+
+        value = self.function()
+
+        return sorted(value.items()) if isinstance(value, dict) else [((), value)]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class MetricsRegistry:
+    """Metric families of this process, rendered in the Prometheus text format (version 0.0.4)."""
+
+    def __init__(self) -> None:
+        self._families: Dict[str, MetricFamily] = {}
+
+    def _register(self, family: MetricFamily) -> MetricFamily:
+        if family.name in self._families:
+            raise ValueError(f"Metric {family.name} is already registered")
+
+        self._families[family.name] = family
+
+        return family
+
+    def counter(
+        self, name: str, help_text: str, labels: Sequence[str] = (), function: Optional[Callable[[], object]] = None
+    ) -> MetricFamily:
+        return self._register(MetricFamily(name, help_text, "counter", labels, Counter, function))
+
+    def gauge(
+        self, name: str, help_text: str, labels: Sequence[str] = (), function: Optional[Callable[[], object]] = None
+    ) -> MetricFamily:
+        return self._register(MetricFamily(name, help_text, "gauge", labels, Gauge, function))
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        bounds: Sequence[float] = (),
+        labels: Sequence[str] = (),
+        function: Optional[Callable[[], object]] = None,
+    ) -> MetricFamily:
+        return self._register(MetricFamily(name, help_text, "histogram", labels, lambda: Histogram(bounds), function))
+
+    def snapshot(self) -> Dict[str, dict]:
+        """
+        Current value of every metric, as plain data (JSON-serialisable) keyed by family name.
+
+        Each family holds its help text, kind, label names and a list of (label values,
+        value) samples; a histogram's value is its cumulative buckets, sum and count.
+        """
+
+        families = {}
+
+        for family in self._families.values():
+            samples = []
+
+            for values, sample in family.samples():
+                if isinstance(sample, Histogram):
+                    buckets, total, count = sample.cumulative()
+                    value = {"buckets": [list(bucket) for bucket in buckets], "sum": total, "count": count}
+
+                else:
+                    value = sample.value if isinstance(sample, (Counter, Gauge)) else sample
+
+                samples.append([list(values), value])
+
+            families[family.name] = {
+                "help": family.help_text,
+                "kind": family.kind,
+                "labels": list(family.label_names),
+                "samples": samples,
+            }
+
+        return families
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+
+        return render_snapshot(self.snapshot())
+
+
+def render_snapshot(families: Dict[str, dict]) -> str:
+    """Render a `MetricsRegistry.snapshot` (or a merge of several) in the Prometheus text format."""
+
+    lines = []
+
+    for name, family in families.items():
+        lines.append(f"# HELP {name} {family['help']}")
+        lines.append(f"# TYPE {name} {family['kind']}")
+
+        for values, value in family["samples"]:
+            if family["kind"] == "histogram":
+                for bound, bucket_count in value["buckets"]:
+                    le = ("le", _format_value(bound))
+                    lines.append(f"{name}_bucket{_format_labels(family['labels'], values, le)} {bucket_count}")
+
+                labels = _format_labels(family["labels"], values)
+                lines.append(f"{name}_sum{labels} {_format_value(value['sum'])}")
+                lines.append(f"{name}_count{labels} {value['count']}")
+
+            else:
+                lines.append(f"{name}{_format_labels(family['labels'], values)} {_format_value(value)}")
+
+    return "\n".join(lines) + "\n"
+
+
+def _is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+
+    except ProcessLookupError:
+        return False
+
+    except PermissionError:
+        pass
+
+    return True
+
+
+def merge_snapshots(snapshots: Sequence[Tuple[str, bool, Dict[str, dict]]]) -> Dict[str, dict]:
+    """
+    Merge the snapshots of several worker processes into one.
+
+    Counters and histograms are summed over every snapshot, those of workers that
+    have exited included, so the totals never go down when a worker is restarted.
+    Gauges describe a live process, so they are only taken from running workers,
+    each with an extra `worker` label.
+
+    Args:
+        snapshots: (worker label, whether it is running, snapshot) triples
+
+    Returns:
+        The merged snapshot, in the format of `MetricsRegistry.snapshot`
+    """
+
+    merged: Dict[str, dict] = {}
+    totals: Dict[str, Dict[tuple, object]] = {}
+
+    for worker, alive, families in snapshots:
+        for name, family in families.items():
+            if family["kind"] == "gauge" and not alive:
+                continue
+
+            if name not in merged:
+                labels = family["labels"] + (["worker"] if family["kind"] == "gauge" else [])
+                merged[name] = {"help": family["help"], "kind": family["kind"], "labels": labels, "samples": []}
+                totals[name] = {}
+
+            samples = totals[name]
+
+            for values, value in family["samples"]:
+                if family["kind"] == "gauge":
+                    samples[tuple(values) + (worker,)] = value
+
+                elif family["kind"] == "histogram":
+                    total = samples.setdefault(
+                        tuple(values), {"buckets": [[bound, 0] for bound, _ in value["buckets"]], "sum": 0.0, "count": 0}
+                    )
+
+                    for bucket, (_, bucket_count) in zip(total["buckets"], value["buckets"]):
+                        bucket[1] += bucket_count
+
+                    total["sum"] += value["sum"]
+                    total["count"] += value["count"]
+
+                else:
+                    samples[tuple(values)] = samples.get(tuple(values), 0.0) + value
+
+    for name, family in merged.items():
+        family["samples"] = [[list(values), value] for values, value in sorted(totals[name].items())]
+
+    return merged
+
+
+class MultiprocessMetrics:
+    """Metrics of every worker process started by serve.py, exposed as one.
+
+    Each worker writes the snapshot of its registry to `<directory>/<pid>.json`
+    (every `interval` seconds, when it stops, and right before answering a scrape),
+    and the worker answering a scrape merges every file with `merge_snapshots`.
+    Files of exited workers are kept, so their counts stay in the totals. Since every
+    worker's contribution only ever comes from its latest snapshot, the merged
+    counters never decrease from one scrape to the next, whichever worker answers.
+    """
+
+    def __init__(self, registry: MetricsRegistry, directory: str) -> None:
+        self.registry = registry
+        self.directory = directory
+
+    @staticmethod
+    def worker() -> str:
+        """Label of this worker: its index in serve.py (stable across restarts), or its pid."""
+
+        return os.getenv("SERVER_WORKER_INDEX") or str(os.getpid())
+
+    def write(self) -> None:
+        """Write this worker's snapshot, replacing the previous one atomically."""
+
+        pid = os.getpid()
+        path = os.path.join(self.directory, f"{pid}.json")
+        temporary = f"{path}.tmp"
+
+        with open(temporary, "w") as file:
+            json.dump({"pid": pid, "worker": self.worker(), "metrics": self.registry.snapshot()}, file)
+
+        os.replace(temporary, path)
+
+    def render(self) -> str:
+        """Every worker's metrics, merged, in the Prometheus text format."""
+
+        self.write()
+
+        snapshots = []
+
+        for path in sorted(glob.glob(os.path.join(self.directory, "*.json"))):
+            try:
+                with open(path) as file:
+                    data = json.load(file)
+
+            # Removed by serve.py while stopping
+            except FileNotFoundError:
+                continue
+
+            snapshots.append((data["worker"], data["pid"] == os.getpid() or _is_alive(data["pid"]), data["metrics"]))
+
+        return render_snapshot(merge_snapshots(snapshots))
+
+
+# Stage timings of the call being recorded on this thread (see `record_stages`)
+_recording = threading.local()
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time a stage of the call being recorded by `record_stages`; does nothing outside of one."""
+
+    timings = getattr(_recording, "timings", None)
+
+    if timings is None:
+        yield
+
+        return
+
+    start = time.perf_counter()
+
+    try:
+        yield
+
+    finally:
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+
+
+def record_stages(function: Callable, *args) -> Tuple[object, Dict[str, float]]:
+    """
+    Call `function`, recording the seconds spent in each of its `stage` blocks.
+
+    It is a plain function, so it can wrap a pipeline function on any executor (a
+    thread, a process or the shared inference server) and bring the timings back
+    with the result.
+
+    Returns:
+        The function's result and the seconds per stage
+    """
+
+    previous = getattr(_recording, "timings", None)
+    _recording.timings = {}
+
+    try:
+        return function(*args), _recording.timings
+
+    finally:
+        _recording.timings = previous
+
+
+# Global metrics registry instance
+metrics_registry = MetricsRegistry()
@@ -0,0 +1,52 @@
+"""Request IDs, to find every log line of one request."""
+
+import re
+import uuid
+
+from utilities.logger import request_id
+
+# Client-supplied IDs are kept only if they are short and plain, since they end up in the logs
+REQUEST_ID_PATTERN = re.compile(r"[A-Za-z0-9._:-]{1,64}")
+
+
+class RequestIdMiddleware:
+    """
+    Give every HTTP request and WebSocket an ID, attached to the records logged while it is handled.
+
+    The ID is the client's X-Request-ID header if it sent a usable one (so a proxy's ID
+    carries through), else a new one, and is sent back in the X-Request-ID response header.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+
+            return
+
+        value = None
+
+        for name, header in scope["headers"]:
+            if name == b"x-request-id":
+                value = header.decode("latin-1")
+
+                break
+
+        if value is None or not REQUEST_ID_PATTERN.fullmatch(value):
+            value = uuid.uuid4().hex
+
+        async def send_with_id(message) -> None:
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", []), (b"x-request-id", value.encode())]}
+
+            await send(message)
+
+        token = request_id.set(value)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+
+        finally:
+            request_id.reset(token)